@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2019 by Michael F. Herbst
+##
+## This file is part of adcc-testdata.
+##
+## adcc-testdata is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc-testdata is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc-testdata. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import csv
+import json
+import time
+import zlib
+
+import numpy as np
+
+
+class AccessTrace:
+    #: Fields of each record of the trace
+    fields = ["function", "key", "slices", "nbytes", "time", "time_h5py",
+              "time_decompress"]
+
+    def __init__(self, records=[]):
+        """
+        Trace of the data requests made to a provider, see the `trace`
+        argument of :py:`ArrayProvider`. Each record is a dict with the keys
+
+          - **function**: Name of the called provider function
+          - **key**: Data key (e.g. HDF5 dataset name) the function serves
+          - **slices**: Requested slices as a list of `[start, stop, step]`
+            triples or `None` if the full data was requested
+          - **nbytes**: Number of bytes returned
+          - **time**: Wall time spent in the function, excluding the time
+            spent estimating `time_decompress`
+          - **time_h5py**: Wall time spent inside h5py (including
+            reading from disk and decompressing)
+          - **time_decompress**: Wall time spent decompressing. Since HDF5
+            does not expose this, it is estimated by decompressing the
+            touched chunks of gzip-compressed datasets a second time,
+            which is not included in `time_h5py`.
+        """
+        self.records = list(records)
+        self.time_h5py = 0.0        # Accumulated time spent in h5py
+        self.time_decompress = 0.0  # Accumulated estimated decompression time
+        self.time_overhead = 0.0    # Accumulated time spent estimating the above
+
+    def record(self, function, key, slices=None, nbytes=0, time=0.0,
+               time_h5py=0.0, time_decompress=0.0):
+        if slices is not None:
+            slices = [[sl.start, sl.stop, sl.step] for sl in slices]
+        self.records.append({
+            "function": function, "key": key, "slices": slices,
+            "nbytes": int(nbytes), "time": time, "time_h5py": time_h5py,
+            "time_decompress": time_decompress,
+        })
+
+    def summary(self):
+        """
+        Summarise the trace per data key, i.e. return a dict mapping from
+        the key to the number of `calls`, the bytes returned (`nbytes`) and
+        the accumulated times `time`, `time_h5py` and `time_decompress`.
+        """
+        ret = {}
+        for rec in self.records:
+            entry = ret.setdefault(rec["key"], {
+                "calls": 0, "nbytes": 0, "time": 0.0, "time_h5py": 0.0,
+                "time_decompress": 0.0,
+            })
+            entry["calls"] += 1
+            for field in ["nbytes", "time", "time_h5py", "time_decompress"]:
+                entry[field] += rec[field]
+        return ret
+
+    def to_json(self, file):
+        """Write trace and summary as JSON to a file name or file object"""
+        if isinstance(file, str):
+            with open(file, "w") as fp:
+                return self.to_json(fp)
+        json.dump({"records": self.records, "summary": self.summary()}, file,
+                  indent=1)
+
+    @classmethod
+    def from_json(cls, file):
+        """Read a trace written by :py:`to_json`"""
+        if isinstance(file, str):
+            with open(file, "r") as fp:
+                return cls.from_json(fp)
+        return cls(json.load(file)["records"])
+
+    def to_csv(self, file):
+        """Write the trace records as CSV to a file name or file object"""
+        if isinstance(file, str):
+            with open(file, "w", newline="") as fp:
+                return self.to_csv(fp)
+        writer = csv.DictWriter(file, fieldnames=self.fields)
+        writer.writeheader()
+        for rec in self.records:
+            row = dict(rec)
+            if row["slices"] is not None:
+                row["slices"] = json.dumps(row["slices"])
+            writer.writerow(row)
+
+
+class TracedDataset:
+    def __init__(self, dataset, trace):
+        """
+        Wrapper around an HDF5 dataset, which accounts the time spent
+        reading from the dataset in the :py:`AccessTrace` `trace`.
+        """
+        self.dataset = dataset
+        self.trace = trace
+
+    def __getitem__(self, sel):
+        start = time.perf_counter()
+        ret = self.dataset[sel]
+        self.trace.time_h5py += time.perf_counter() - start
+        self.__estimate_decompression(sel)
+        return ret
+
+    def read_direct(self, array, source_sel=None, dest_sel=None):
+        start = time.perf_counter()
+        self.dataset.read_direct(array, source_sel, dest_sel)
+        self.trace.time_h5py += time.perf_counter() - start
+        self.__estimate_decompression(source_sel)
+
+    def __estimate_decompression(self, sel):
+        start = time.perf_counter()
+        self.trace.time_decompress += self.__decompression_time(sel)
+        self.trace.time_overhead += time.perf_counter() - start
+
+    def __decompression_time(self, sel):
+        dataset = self.dataset
+        if dataset.compression != "gzip" or dataset.chunks is None:
+            return 0.0
+        if sel is None or sel == ():
+            sel = tuple(slice(None) for _ in dataset.shape)
+        elif not isinstance(sel, tuple):
+            sel = (sel, )
+        sel = tuple(sl if isinstance(sl, slice) else slice(sl, sl + 1)
+                    for sl in sel)
+        sel = sel + (len(dataset.shape) - len(sel)) * (slice(None), )
+        if any(sl.step not in (None, 1) for sl in sel):
+            return 0.0  # iter_chunks does not support steps
+
+        duration = 0.0
+        for chunk_sel in dataset.iter_chunks(sel):
+            offset = tuple(sl.start - sl.start % c
+                           for sl, c in zip(chunk_sel, dataset.chunks))
+            if dataset.id.get_chunk_info_by_coord(offset).byte_offset is None:
+                continue  # Chunk not allocated, i.e. only fill values
+            _, raw = dataset.id.read_direct_chunk(offset)
+            start = time.perf_counter()
+            try:
+                zlib.decompress(raw)
+            except zlib.error:
+                pass  # Chunk not stored compressed
+            duration += time.perf_counter() - start
+        return duration
+
+    def __getattr__(self, name):
+        return getattr(self.dataset, name)
+
+
+def nbytes_of(value):
+    """Number of bytes of a value returned by a provider function"""
+    if hasattr(value, "nbytes"):
+        return value.nbytes
+    return np.asarray(value).nbytes
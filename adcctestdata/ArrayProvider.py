@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2019 by Michael F. Herbst
+##
+## This file is part of adcc-testdata.
+##
+## adcc-testdata is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc-testdata is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc-testdata. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import time
+import functools
+import collections.abc
+import numpy as np
+
+from pyadcman import HartreeFockProvider
+
+from .AccessTrace import AccessTrace, nbytes_of
+from .EriBackends import open_eri_backend
+from .hdf5_access import BlockCache, read_into
+
+
+def get_scalar_value(data, key, default=None):
+    if "/" in key:
+        key, subkey = key.split("/", 1)
+        return get_scalar_value(data.get(key, {}), subkey, default=default)
+    if default is not None and key not in data:
+        return default
+
+    value = data[key]
+    if not hasattr(value, "shape"):
+        return value  # Just a scalar
+    elif value.shape == ():
+        return value[()]
+    elif value.shape == (1, ):
+        return value[0]
+    else:
+        raise ValueError("Unrecognised scalar value shape ", value.shape,
+                         " should be () or (1, )")
+
+
+def nest_keys(data):
+    """
+    Turn the keys containing `/` (e.g. `"multipoles/elec_1"`) of the mapping
+    `data` into nested dicts. This also reads all arrays of lazily loading
+    mappings such as the `NpzFile` returned by `np.load`.
+    """
+    ret = {}
+    for key in data:
+        *groups, name = key.split("/")
+        node = ret
+        for group in groups:
+            node = node.setdefault(group, {})
+        value = data[key]
+        if isinstance(value, collections.abc.Mapping):
+            node.setdefault(name, {}).update(nest_keys(value))
+        else:
+            node[name] = value
+    return ret
+
+
+def traced(key):
+    """
+    Decorator recording the calls to the decorated provider function,
+    which serves the data `key`, in the `trace` of the provider. Only the
+    outermost call is recorded if decorated functions call each other.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(self, *args):
+            trace = self.trace
+            if trace is None or self._trace_depth > 0:
+                return function(self, *args)
+
+            start_h5py = trace.time_h5py
+            start_decompress = trace.time_decompress
+            start_overhead = trace.time_overhead
+            start = time.perf_counter()
+            self._trace_depth += 1
+            try:
+                result = function(self, *args)
+            finally:
+                self._trace_depth -= 1
+            # Exclude the time spent estimating the decompression time
+            elapsed = time.perf_counter() - start \
+                - (trace.time_overhead - start_overhead)
+
+            slices = None
+            if function.__name__.startswith("fill_"):
+                nbytes = nbytes_of(args[-1])
+                if len(args) == 2:
+                    slices = args[0]
+            else:
+                nbytes = nbytes_of(result)
+            trace.record(function.__name__, key, slices, nbytes, elapsed,
+                         trace.time_h5py - start_h5py,
+                         trace.time_decompress - start_decompress)
+            return result
+        return wrapper
+    return decorator
+
+
+class HdfOperatorIntegralProvider:
+    def __init__(self, backend="data"):
+        self.backend = backend
+
+
+class ArrayProvider(HartreeFockProvider):
+    def __init__(self, data, cache_size=0, trace=False):
+        """
+        Initialise the ArrayProvider class with the `data` being a mapping
+        of arrays, e.g. a dict, the `NpzFile` returned by `np.load`, a zarr
+        group or an HDF5 group (see also :py:`HdfProvider`).
+        Let `nf` denote the number of Fock spin orbitals (i.e. the sum of both
+        the alpha and the beta orbitals) and `nb` the number of basis functions.
+        With `array` we indicate either a `np.array` or an HDF5 dataset.
+        The following keys are required in the container:
+
+        1. **restricted** (`bool`): `True` for a restricted SCF calculation,
+           `False` otherwise
+        2. **conv_tol** (`float`): Tolerance value used for SCF convergence,
+           should be roughly equivalent to l2 norm of the Pulay error.
+        3. **orbcoeff_fb** (`.array` with dtype `float`, size `(nf, nb)`):
+           SCF orbital coefficients, i.e. the uniform transform from the basis
+           to the molecular orbitals.
+        4. **occupation_f** (`array` with dtype `float`, size `(nf, )`:
+           Occupation number for each SCF orbitals (i.e. diagonal of the HF
+           density matrix in the SCF orbital basis).
+        5. **orben_f** (`array` with dtype `float`, size `(nf, )`:
+           SCF orbital energies
+        6. **fock_ff** (`array` with dtype `float`, size `(nf, nf)`:
+           Fock matrix in SCF orbital basis. Notice, the full matrix is expected
+           also for restricted calculations.
+        7. **eri_phys_asym_ffff** (`array` with dtype `float`,
+           size `(nf, nf, nf, nf)`: Antisymmetrised electron-repulsion integral
+           tensor in the SCF orbital basis, using the Physicists' indexing
+           convention, i.e. that the index tuple `(i,j,k,l)` refers to
+           the integral :math:`\\langle ij || kl \\rangle`, i.e.
+
+           .. math::
+              \\int_\\Omega \\int_\\Omega d r_1 d r_2 \\frac{
+              \\phi_i(r_1) \\phi_j(r_2)
+              \\phi_k(r_1) \\phi_l(r_2)}{|r_1 - r_2|}
+              - \\int_\\Omega \\int_\\Omega d r_1 d r_2 \\frac{
+              \\phi_i(r_1) \\phi_j(r_2)
+              \\phi_l(r_1) \\phi_k(r_2)}{|r_1 - r_2|}
+
+           The full tensor (including zero blocks) is expected.
+
+        As an alternative to `eri_phys_asym_ffff`, the user may provide
+
+        8. **eri_ffff** (`array` with dtype `float`, size `(nf, nf, nf, nf)`:
+           Electron-repulsion integral tensor in chemists' notation.
+           The index tuple `(i,j,k,l)` thus refers to the integral
+           :math:`(ij|kl)`, which is
+
+           .. math::
+              \\int_\\Omega \\int_\\Omega d r_1 d r_2
+              \\frac{\\phi_i(r_1) \\phi_j(r_1)
+              \\phi_k(r_2) \\phi_l(r_2)}{|r_1 - r_2|}
+
+           Notice, that no antisymmetrisation has been applied in this tensor.
+
+        Instead of the full `eri_ffff` tensor, which is dominated by zero
+        blocks, only the blocks allowed by spin symmetry may be stored:
+
+        9. **eri_blocks**: HDF5 group with the spin blocks of `eri_ffff`.
+           Let `n = nf / 2` denote the number of alpha orbitals.
+
+             - **aaaa** (`array`, size `(n, n, n, n)`): Alpha-alpha block
+             - **bbbb** (`array`, size `(n, n, n, n)`): Beta-beta block
+             - **aabb** (`array`, size `(n, n, n, n)`): Alpha-beta block.
+               The `bbaa` block is obtained by transposition.
+
+           For restricted references only **aaaa** is required, i.e. the
+           electron-repulsion integrals over the spatial orbitals.
+           The group attribute `format_version` (default: `1`) versions
+           the storage format. If the group attribute `packing` is `"s8"`,
+           the permutational symmetry of the integrals is exploited:
+           `aaaa` and `bbbb` are stored in pyscf's `s8` format
+           (size `(npair * (npair + 1) / 2, )` with `npair = n * (n + 1) / 2`)
+           and `aabb` in pyscf's `s4` format (size `(npair, npair)`).
+        10. **eri_factors**: HDF5 group with a three-index factorisation
+            :math:`(pq|rs) = \\sum_Q B^Q_{pq} B^Q_{rs}` of the
+            electron-repulsion integrals, e.g. from density fitting
+            or a Cholesky decomposition, with `naux` factors.
+
+              - **alpha** (`array`, size `(naux, n, n)`): Alpha factors
+              - **beta** (`array`, size `(naux, n, n)`): Beta factors,
+                not required for restricted references.
+
+            The group attribute `format_version` (default: `1`) versions
+            the storage format.
+        11. **eri_ao**: HDF5 group with the electron-repulsion integrals
+            in the atomic orbital basis, which are transformed to the
+            requested blocks of `eri_ffff` on demand using `orbcoeff_fb`.
+
+              - **bbbb** (`array`): Integrals in pyscf's `s8` format
+                (size `(npair * (npair + 1) / 2, )` with
+                `npair = nb * (nb + 1) / 2`), `s4` format
+                (size `(npair, npair)`) or unpacked (size `(nb, nb, nb, nb)`)
+
+            The group attribute `format_version` (default: `1`) versions
+            the storage format.
+
+        The above keys define the least set of quantities to start a calculation
+        in `adcc`. In order to have access to properties such as dipole moments
+        or to get the correct state energies, further keys are highly
+        recommended to be provided as well.
+
+        12. **energy_scf** (`float`): Final total SCF energy of both
+            electronic and nuclear energy terms. (default: `0.0`)
+        13. **multipoles**: HDF5 group with electric and nuclear
+            multipole moments.
+
+              - **elec_1** (`array`, size `(3, nb, nb)`):
+                Electric dipole moment integrals in the atomic orbital basis
+                (i.e. the discretisation basis with `nb` elements). First axis
+                indicates cartesian component (x, y, z).
+              - **nuc_0** (`float`): Total nuclear charge
+              - **nuc_1** (`array` size `(3, )`: Nuclear dipole moment
+
+            The defaults for all entries are all-zero multipoles.
+        14. **spin_multiplicity** (`int`): The spin mulitplicity of the HF
+            ground state described by the data. A value of `0` (for unknown)
+            should be supplied for unrestricted calculations.
+            (default: 1 for restricted and 0 for unrestricted calculations)
+        15. **frozen_orbitals**: HDF5 group with the orbitals, which have
+            been removed from the data, since they are frozen (see the
+            `frozen_core` argument of :py:`dump_pyscf`).
+
+              - **core** (`array` with dtype `int`): Frozen core orbitals
+              - **virtual** (`array` with dtype `int`): Frozen virtual
+                orbitals
+
+            Both are given as indices into the spin orbitals before the
+            removal. (default: no frozen orbitals)
+
+        Groups (such as **eri_blocks** or **multipoles**) are given as
+        nested mappings or by keys containing a `/` (e.g.
+        `"multipoles/elec_1"`). Group attributes (such as `format_version`
+        or `packing`) are taken from the `attrs` of the group if present
+        and take their defaults otherwise.
+
+        If `cache_size` is larger than zero, up to `cache_size` bytes of the
+        electron-repulsion integral blocks requested via `fill_eri_ffff`
+        and `fill_eri_phys_asym_ffff` are kept in a least-recently-used
+        cache, such that repeated requests do not read (and decompress)
+        the data again. See `cache_hits` and `cache_misses`.
+
+        If `trace` is `True`, all data requests are recorded together with
+        the requested slices, the number of bytes returned and the time
+        spent reading (see :py:`AccessTrace`). The trace is available
+        as the `trace` attribute and can be saved with `trace.to_json`
+        or `trace.to_csv`.
+        """
+
+        # Do not forget the next line, otherwise weird errors result
+        super().__init__()
+
+        self.__backend = getattr(data, "attrs", {}).get(
+            "backend", self.default_backend(data)
+        )
+        if isinstance(data, (dict, np.lib.npyio.NpzFile)):
+            data = nest_keys(data)
+        if not isinstance(data, collections.abc.Mapping):
+            raise TypeError("data should be a mapping of arrays.")
+        self.data = data
+        self.trace = AccessTrace() if trace else None
+        self._trace_depth = 0
+        self.arrays = self.wrap_arrays(data)
+        self.block_cache = BlockCache(cache_size)
+
+        for key in ["restricted", "conv_tol", "orbcoeff_fb", "occupation_f",
+                    "orben_f", "fock_ff"]:
+            if key not in data:
+                raise ValueError("Required key {} not found in data."
+                                 "".format(key))
+        if data["orbcoeff_fb"].shape[0] % 2 != 0:
+            raise ValueError("orbcoeff_fb first axis should have even length")
+        nb = self.get_n_bas()
+        nf = 2 * self.get_n_orbs_alpha()
+
+        checks = [("orbcoeff_fb", (nf, nb)), ("occupation_f", (nf, )),
+                  ("orben_f", (nf, )), ("fock_ff", (nf, nf)),
+                  ("eri_ffff", (nf, nf, nf, nf)),
+                  ("eri_phys_asym_ffff", (nf, nf, nf, nf)), ]
+        for key, exshape in checks:
+            if key not in data:
+                continue
+            if data[key].shape != exshape:
+                raise ValueError("Shape mismatch for key {}: Expected {}, but "
+                                 "got {}.".format(key, exshape,
+                                                  data[key].shape))
+
+        # Setup ERI backend for storage layouts other than the full tensor
+        self.eri_backend = self.make_eri_backend()
+        if (
+            self.eri_backend is None and "eri_ffff" not in data
+            and "eri_phys_asym_ffff" not in data
+        ):
+            raise ValueError("No electron-repulsion integrals found in data.")
+
+        # Setup integral data
+        opprov = HdfOperatorIntegralProvider(self.__backend)
+        mmp = data.get("multipoles", {})
+        if "elec_1" in mmp:
+            if mmp["elec_1"].shape != (3, nb, nb):
+                raise ValueError("multipoles/elec_1 is expected to have shape "
+                                 + str((3, nb, nb)) + " not "
+                                 + str(mmp["elec_1"].shape))
+            opprov.electric_dipole = np.asarray(mmp["elec_1"])
+        self.operator_integral_provider = opprov
+
+    def wrap_arrays(self, data):
+        """
+        Return the mapping through which the arrays in `data` are read
+        by the fill functions. Override to change how arrays are accessed.
+        """
+        return data
+
+    def default_backend(self, data):
+        """Backend string to use if `data` does not specify one"""
+        return "<{} data>".format(type(data).__name__)
+
+    def make_eri_backend(self):
+        """
+        Return the ERI backend serving the electron-repulsion integrals
+        or `None` if they are stored as full tensors.
+        """
+        return open_eri_backend(self.arrays, self.get_n_orbs_alpha(),
+                                restricted=self.get_restricted())
+
+    #
+    # Required keys
+    #
+    @traced("restricted")
+    def get_restricted(self):
+        return get_scalar_value(self.data, "restricted")
+
+    @traced("conv_tol")
+    def get_conv_tol(self):
+        return get_scalar_value(self.data, "conv_tol")
+
+    @traced("occupation_f")
+    def fill_occupation_f(self, out):
+        read_into(self.arrays["occupation_f"], out)
+
+    @traced("orbcoeff_fb")
+    def fill_orbcoeff_fb(self, out):
+        read_into(self.arrays["orbcoeff_fb"], out)
+
+    @traced("orben_f")
+    def fill_orben_f(self, out):
+        read_into(self.arrays["orben_f"], out)
+
+    @traced("fock_ff")
+    def fill_fock_ff(self, slices, out):
+        read_into(self.arrays["fock_ff"], out, slices)
+
+    @traced("eri_ffff")
+    def fill_eri_ffff(self, slices, out):
+        if self.__fill_from_cache("eri_ffff", slices, out):
+            return
+        if self.eri_backend is not None:
+            self.eri_backend.fill(slices, out)
+        else:
+            read_into(self.arrays["eri_ffff"], out, slices)
+        self.__store_in_cache("eri_ffff", slices, out)
+
+    @traced("eri_phys_asym_ffff")
+    def fill_eri_phys_asym_ffff(self, slices, out):
+        # Only required if eri_ffff not provided
+        if self.__fill_from_cache("eri_phys_asym_ffff", slices, out):
+            return
+        if "eri_phys_asym_ffff" not in self.data \
+           and self.eri_backend is not None:
+            self.eri_backend.fill_phys_asym(slices, out)
+        else:
+            read_into(self.arrays["eri_phys_asym_ffff"], out, slices)
+        self.__store_in_cache("eri_phys_asym_ffff", slices, out)
+
+    #
+    # Block cache
+    #
+    def __cache_key(self, key, slices):
+        nf = 2 * self.get_n_orbs_alpha()
+        return (key, ) + tuple(sl.indices(nf) for sl in slices)
+
+    def __fill_from_cache(self, key, slices, out):
+        if self.block_cache.max_bytes <= 0:
+            return False
+        block = self.block_cache.get(self.__cache_key(key, slices))
+        if block is None:
+            return False
+        out[:] = block
+        return True
+
+    def __store_in_cache(self, key, slices, out):
+        if self.block_cache.max_bytes > 0:
+            self.block_cache.put(self.__cache_key(key, slices), out)
+
+    @property
+    def cache_hits(self):
+        """Number of ERI block requests served from the block cache"""
+        return self.block_cache.hits
+
+    @property
+    def cache_misses(self):
+        """Number of ERI block requests not found in the block cache"""
+        return self.block_cache.misses
+
+    #
+    # Recommended keys
+    #
+    def get_backend(self):
+        return self.__backend
+
+    @traced("energy_scf")
+    def get_energy_scf(self):
+        return get_scalar_value(self.data, "energy_scf", 0.0)
+
+    @traced("multipoles")
+    def get_nuclear_multipole(self, order):
+        if order == 0:  # The function interface needs an np.array on return
+            nuc_0 = get_scalar_value(self.data, "multipoles/nuclear_0", 0.0)
+            return np.array([nuc_0])
+        elif order == 1:
+            mmp = self.data.get("multipoles", {})
+            return np.asarray(mmp.get("nuclear_1", [0., 0, 0]))
+        else:
+            raise NotImplementedError("get_nuclear_multipole with order > 1")
+
+    @traced("spin_multiplicity")
+    def get_spin_multiplicity(self):
+        if "spin_multiplicity" in self.data:
+            return get_scalar_value(self.data, "spin_multiplicity")
+        elif not self.get_restricted():
+            return 0
+        else:
+            noa = self.get_n_orbs_alpha()
+            na = int(np.sum(self.data["occupation_f"][:noa]))
+            nb = int(np.sum(self.data["occupation_f"][noa:]))
+            return na - nb + 1
+
+    #
+    # Deduced keys
+    #
+    def get_n_orbs_alpha(self):
+        return self.data["orbcoeff_fb"].shape[0] // 2
+
+    def get_n_bas(self):
+        return self.data["orbcoeff_fb"].shape[1]
+
+    def has_eri_phys_asym_ffff_inner(self):
+        return "eri_phys_asym_ffff" in self.data
+
+    #
+    # Active space
+    #
+    def get_frozen_core(self):
+        """Frozen core orbitals removed from the data"""
+        frozen = self.data.get("frozen_orbitals", {})
+        return [int(p) for p in frozen.get("core", [])]
+
+    def get_frozen_virtual(self):
+        """Frozen virtual orbitals removed from the data"""
+        frozen = self.data.get("frozen_orbitals", {})
+        return [int(p) for p in frozen.get("virtual", [])]
+
+    def active_orbitals(self, orbitals):
+        """
+        Map a list of orbitals indexing all spin orbitals (including
+        the frozen orbitals removed from the data) to the indices of the
+        same orbitals in the data. Raises a `ValueError` if any of the
+        orbitals has been removed.
+        """
+        removed = np.array(self.get_frozen_core() + self.get_frozen_virtual(),
+                           dtype=int)
+        ret = []
+        for p in orbitals:
+            if p in removed:
+                raise ValueError("Orbital {} has been removed from the data, "
+                                 "since it is frozen.".format(p))
+            ret.append(int(p - np.sum(removed < p)))
+        return ret
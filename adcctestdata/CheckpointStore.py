@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2019 by Michael F. Herbst
+##
+## This file is part of adcc-testdata.
+##
+## adcc-testdata is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc-testdata is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc-testdata. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import os
+import json
+import hashlib
+import itertools
+
+import h5py
+import pyadcman
+
+from .DiskCache import DiskCache, default_cache_dir, file_hash
+from .HdfProvider import HdfProvider
+
+#: Version of the checkpoint format, which is part of the checkpoint key
+CHECKPOINT_VERSION = 1
+
+#: Context entries adcman computes in the tasks, which only depend on the
+#: SCF data and the orbital subspaces, by the name of the task
+CHECKPOINT_ENTRIES = {
+    "mp1": ["mp1/df_o1v1", "mp1/df_o2v1", "mp1/t_o1o1v1v1",
+            "mp1/t_o1o2v1v1", "mp1/t_o2o2v1v1"],
+    "mp2td2": ["mp2/td_o1o1v1v1", "mp2/td_o1o2v1v1", "mp2/td_o2o2v1v1"],
+    "pi_oovv": ["gen/prereq/pi3_o1o1v1v1", "gen/prereq/pi4_o1o1v1v1",
+                "gen/prereq/pi5_o1o1v1v1"],
+    "pia": ["gen/prereq/pia_o1o1o1v1"],
+    "pib": ["gen/prereq/pib_o1v1v1v1"],
+}
+
+#: Index permutations (in the notation of `pyadcman.Symmetry.permutations`)
+#: of the context entries, under which they are symmetric or antisymmetric.
+#: Entries not listed (the orbital energy differences and the pi
+#: intermediates) are restored without permutational symmetry.
+CHECKPOINT_PERMUTATIONS = {
+    "mp1/t_o1o1v1v1": ["ijkl", "-jikl", "-ijlk"],
+    "mp1/t_o1o2v1v1": ["ijkl", "-ijlk"],
+    "mp1/t_o2o2v1v1": ["ijkl", "-jikl", "-ijlk"],
+    "mp2/td_o1o1v1v1": ["ijkl", "-jikl", "-ijlk"],
+    "mp2/td_o1o2v1v1": ["ijkl", "-ijlk"],
+    "mp2/td_o2o2v1v1": ["ijkl", "-jikl", "-ijlk"],
+}
+
+
+def task_entries(task, has_core_occupied_space=False):
+    """
+    Context entries of the task `task` (see :py:`CHECKPOINT_ENTRIES`), which
+    adcman computes for a reference state with or without a
+    core-occupied space.
+    """
+    return [ctxkey for ctxkey in CHECKPOINT_ENTRIES[task]
+            if has_core_occupied_space or "o2" not in ctxkey]
+
+
+def tensor_symmetry(mospaces, ctxkey, restricted):
+    """
+    Build the symmetry of the tensor stored under `ctxkey` in the adcman
+    context for the orbital subspaces `mospaces`. Besides the index
+    permutations (see :py:`CHECKPOINT_PERMUTATIONS`) all intermediates
+    conserve spin and are identical under exchange of alpha and beta spin
+    for restricted references.
+    """
+    space = ctxkey.rsplit("_", 1)[-1]
+    sym = pyadcman.Symmetry(mospaces, space)
+    if ctxkey in CHECKPOINT_PERMUTATIONS:
+        sym.permutations = CHECKPOINT_PERMUTATIONS[ctxkey]
+
+    ndim = len(space) // 2
+    allowed, forbidden = [], []
+    for block in itertools.product("ab", repeat=ndim):
+        block = "".join(block)
+        half = ndim // 2
+        if block[:half].count("a") == block[half:].count("a"):
+            allowed.append(block)
+        else:
+            forbidden.append(block)
+    sym.spin_blocks_forbidden = forbidden
+    if restricted:
+        flip = {"a": "b", "b": "a"}
+        sym.spin_block_maps = [
+            (block, "".join(flip[c] for c in block), 1)
+            for block in allowed if block[0] == "a"
+        ]
+    return sym
+
+
+class CheckpointStore:
+    def __init__(self, directory=None, max_bytes=2**34):
+        """
+        Store of the intermediates adcman computes for the ground state
+        (MP amplitudes, pi intermediates, see :py:`CHECKPOINT_ENTRIES`), such
+        that they can be injected into later adcman runs on the same
+        SCF data instead of being recomputed. The intermediates are kept as
+        HDF5 files in the directory `directory` (default: the subdirectory
+        `checkpoints` of :py:`DiskCache.default_cache_dir()`), which
+        take at most `max_bytes` bytes (see :py:`DiskCache`).
+        """
+        if directory is None:
+            directory = os.path.join(default_cache_dir(), "checkpoints")
+        self.cache = DiskCache(directory, max_bytes)
+
+    def key(self, data, core_orbitals=[], frozen_core=[], frozen_virtual=[]):
+        """
+        Key of the checkpoint for the SCF data `data` (an :py:`HdfProvider`)
+        and the orbital subspaces (indexing the orbitals present in `data`).
+        """
+        if not isinstance(data, HdfProvider):
+            raise TypeError("Checkpoints are only supported for SCF data "
+                            "read from HDF5 files.")
+        encoded = json.dumps([CHECKPOINT_VERSION, file_hash(data.data.filename),
+                              sorted(core_orbitals), sorted(frozen_core),
+                              sorted(frozen_virtual)])
+        return hashlib.sha256(encoded.encode()).hexdigest()
+
+    def load(self, key, refstate):
+        """
+        Load the checkpoint `key` as tensors over the orbital subspaces
+        of the adcman reference state `refstate`. Returns the dict of the
+        tensors by their context key and the set of the names of the tasks,
+        which do not need to be run any more. Only tasks, for which all
+        entries needed for `refstate` are found in the checkpoint,
+        are considered.
+        """
+        path = self.cache.get(key)
+        if path is None:
+            return {}, set()
+
+        tensors, skip_tasks = {}, set()
+        with h5py.File(path, "r") as f:
+            for task in f:
+                expected = task_entries(task, refstate.has_core_occupied_space)
+                if not all(ctxkey in f[task] for ctxkey in expected):
+                    continue
+                for ctxkey in expected:
+                    dataset = f[task][ctxkey]
+                    sym = tensor_symmetry(refstate.mospaces, ctxkey,
+                                          refstate.restricted)
+                    tensor = pyadcman.Tensor(sym)
+                    tensor.set_from_ndarray(dataset[()])
+                    tensors[ctxkey] = tensor
+                skip_tasks.add(task)
+        return tensors, skip_tasks
+
+    def save(self, key, refstate, ctx, tasks):
+        """
+        Add the entries computed by the tasks named in `tasks` from the
+        adcman context `ctx` of a run on top of the reference state `refstate`
+        to the checkpoint `key`. Tasks, for which not all entries needed
+        for `refstate` are found in `ctx`, are not stored.
+        """
+        arrays = {}
+        path = self.cache.get(key)
+        if path is not None:
+            with h5py.File(path, "r") as f:
+                for task in f:
+                    arrays[task] = {ctxkey: f[task][ctxkey][()]
+                                    for ctxkey in CHECKPOINT_ENTRIES[task]
+                                    if ctxkey in f[task]}
+        for task in tasks:
+            expected = task_entries(task, refstate.has_core_occupied_space)
+            if all(ctxkey in ctx for ctxkey in expected):
+                arrays[task] = {ctxkey: ctx[ctxkey].to_ndarray()
+                                for ctxkey in expected}
+
+        def write(filename):
+            with h5py.File(filename, "w") as f:
+                for task, entries in arrays.items():
+                    group = f.create_group(task)
+                    for ctxkey, value in entries.items():
+                        group.create_dataset(ctxkey, data=value)
+        if arrays:
+            self.cache.put(key, write)
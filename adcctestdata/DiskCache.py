@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2019 by Michael F. Herbst
+##
+## This file is part of adcc-testdata.
+##
+## adcc-testdata is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc-testdata is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc-testdata. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import os
+import hashlib
+import tempfile
+
+# Hashes of files by path, size and modification time
+_file_hashes = {}
+
+
+def default_cache_dir():
+    """
+    Cache directory used if none is passed explicitly, i.e. the environment
+    variable `ADCCTESTDATA_CACHE_DIR` or `~/.cache/adcc-testdata`.
+    """
+    if "ADCCTESTDATA_CACHE_DIR" in os.environ:
+        return os.environ["ADCCTESTDATA_CACHE_DIR"]
+    cache_home = os.environ.get("XDG_CACHE_HOME",
+                                os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(cache_home, "adcc-testdata")
+
+
+def file_hash(path):
+    """Return the sha256 hash of the content of the file `path`."""
+    stat = os.stat(path)
+    memo = (os.path.realpath(path), stat.st_size, stat.st_mtime_ns)
+    if memo not in _file_hashes:
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(2**24), b""):
+                sha.update(block)
+        _file_hashes[memo] = sha.hexdigest()
+    return _file_hashes[memo]
+
+
+class DiskCache:
+    def __init__(self, directory=None, max_bytes=2**32, suffix=".hdf5"):
+        """
+        Cache of files in the directory `directory` (default:
+        :py:`default_cache_dir()`), which are addressed by a key string
+        (e.g. a hash of the inputs the file was generated from).
+
+        If the files in the cache take more than `max_bytes` bytes,
+        the least recently used files are removed. Files are marked as used
+        by updating their modification time, such that the cache can be
+        shared between processes.
+        """
+        self.directory = directory if directory else default_cache_dir()
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, key):
+        """Path of the file for `key` inside the cache"""
+        return os.path.join(self.directory, key + self.suffix)
+
+    def __contains__(self, key):
+        return os.path.isfile(self.path(key))
+
+    def get(self, key):
+        """
+        Return the path of the cached file for `key` and mark it as
+        recently used or return `None` if `key` is not in the cache.
+        """
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, write):
+        """
+        Add the file for `key` to the cache, which is generated by calling
+        `write` with a file name to write to. The file is only moved into
+        the cache once `write` returns, such that no partially written
+        files are ever found in the cache. Returns the path of the file.
+        """
+        fd, tmppath = tempfile.mkstemp(suffix=self.suffix + ".tmp",
+                                       dir=self.directory)
+        os.close(fd)
+        try:
+            write(tmppath)
+            os.replace(tmppath, self.path(key))
+        finally:
+            if os.path.exists(tmppath):
+                os.remove(tmppath)
+        self.evict(keep=self.path(key))
+        return self.path(key)
+
+    def entries(self):
+        """
+        List of the `(path, size, mtime)` of all files in the cache,
+        least recently used first
+        """
+        ret = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(self.suffix):
+                stat = entry.stat()
+                ret.append((entry.path, stat.st_size, stat.st_mtime))
+        return sorted(ret, key=lambda entry: entry[2])
+
+    def evict(self, keep=None):
+        """
+        Remove the least recently used files until the cache takes
+        at most `max_bytes` bytes. The file `keep` is never removed.
+        """
+        entries = self.entries()
+        nbytes = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if nbytes <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # Removed by another process
+            nbytes -= size
+
+    def clear(self):
+        """Remove all files from the cache"""
+        for path, _, _ in self.entries():
+            os.remove(path)
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2019 by Michael F. Herbst
+##
+## This file is part of adcc-testdata.
+##
+## adcc-testdata is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc-testdata is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc-testdata. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import numpy as np
+
+from pyscf import ao2mo
+
+from .hdf5_access import read_into
+
+#: Version of the storage format of the `eri_blocks` group
+ERI_BLOCKS_FORMAT_VERSION = 1
+
+#: Version of the storage format of the `eri_factors` group
+ERI_FACTORS_FORMAT_VERSION = 1
+
+#: Version of the storage format of the `eri_ao` group
+ERI_AO_FORMAT_VERSION = 1
+
+
+def check_format_version(group, supported):
+    version = getattr(group, "attrs", {}).get("format_version", 1)
+    if version > supported:
+        raise ValueError("{} format version {} not supported. Try updating "
+                         "adcc-testdata.".format(group.name, version))
+
+
+def split_spin_slice(sl, n_orbs_alpha):
+    """
+    Split a slice `sl` over the spin-orbital axis (alpha orbitals first,
+    followed by the beta orbitals) into its alpha and its beta part.
+    Returns a list of tuples `(spin, out_slice, block_slice)`, where `spin`
+    is "a" or "b", `out_slice` selects the respective part of the result
+    array and `block_slice` the respective orbitals in a spin block.
+    """
+    start, stop, step = sl.indices(2 * n_orbs_alpha)
+    if step <= 0:
+        raise ValueError("Only slices with a positive step are supported.")
+    indices = range(start, stop, step)
+    n_alpha = len(range(start, min(stop, n_orbs_alpha), step))
+
+    ret = []
+    alpha = indices[:n_alpha]
+    if len(alpha) > 0:
+        ret.append(("a", slice(0, n_alpha),
+                    slice(alpha.start, alpha.stop, step)))
+    beta = indices[n_alpha:]
+    if len(beta) > 0:
+        ret.append(("b", slice(n_alpha, len(indices)),
+                    slice(beta.start - n_orbs_alpha,
+                          beta.stop - n_orbs_alpha, step)))
+    return ret
+
+
+class EriBackend:
+    """
+    Base class for assembling slices of the electron-repulsion integral
+    tensor `eri_ffff` (chemists' notation, spin-orbital indices) from
+    a storage, which only holds the spin blocks allowed by spin symmetry,
+    i.e. the blocks `aaaa`, `bbbb`, `aabb` and `bbaa`. All other blocks are
+    zero and are never read.
+    """
+    def __init__(self, n_orbs_alpha):
+        self.n_orbs_alpha = n_orbs_alpha
+
+    def read_block(self, block, slices):
+        """
+        Return the integrals of spin block `block` (e.g. "aabb") for the
+        passed tuple of `slices`, which index the spatial orbitals of the block.
+        """
+        raise NotImplementedError("read_block not implemented in "
+                                  + self.__class__.__name__)
+
+    def fill(self, slices, out):
+        """
+        Fill `out` with the spin-orbital ERI tensor restricted to `slices`.
+        """
+        if len(slices) != 4:
+            raise ValueError("Expected four slices for eri_ffff.")
+        splits = [split_spin_slice(sl, self.n_orbs_alpha) for sl in slices]
+
+        out[:] = 0
+        for (s1, o1, b1) in splits[0]:
+            for (s2, o2, b2) in splits[1]:
+                if s1 != s2:
+                    continue
+                for (s3, o3, b3) in splits[2]:
+                    for (s4, o4, b4) in splits[3]:
+                        if s3 != s4:
+                            continue
+                        self.read_block_into(s1 + s2 + s3 + s4,
+                                             (b1, b2, b3, b4), out,
+                                             (o1, o2, o3, o4))
+
+    def read_block_into(self, block, slices, out, dest_sel):
+        """
+        Read the integrals of spin block `block` for the passed `slices` into
+        the selection `dest_sel` of `out`. Override to avoid temporaries.
+        """
+        out[dest_sel] = self.read_block(block, slices)
+
+    def fill_phys_asym(self, slices, out):
+        """
+        Fill `out` with the antisymmetrised ERI tensor in physicists' notation
+        restricted to `slices`, i.e. `<pq||rs> = (pr|qs) - (ps|qr)`.
+        """
+        sp, sq, sr, ss = slices
+        shape_prqs = (out.shape[0], out.shape[2], out.shape[1], out.shape[3])
+        prqs = np.empty(shape_prqs)
+        self.fill((sp, sr, sq, ss), prqs)
+        out[:] = np.transpose(prqs, (0, 2, 1, 3))
+        del prqs
+
+        shape_psqr = (out.shape[0], out.shape[3], out.shape[1], out.shape[2])
+        psqr = np.empty(shape_psqr)
+        self.fill((sp, ss, sq, sr), psqr)
+        out -= np.transpose(psqr, (0, 2, 3, 1))
+
+
+class SpinBlockEri(EriBackend):
+    """
+    ERI backend for the `eri_blocks` storage layout, where the spin blocks
+    `aaaa`, `bbbb` and `aabb` are stored as separate arrays of shape
+    `(n, n, n, n)` with `n` the number of alpha (or beta) orbitals.
+    The `bbaa` block is obtained from `aabb` by symmetry. For restricted
+    references only the `aaaa` block (i.e. the integrals over the spatial
+    orbitals) is required, since all other non-zero blocks equal it.
+    """
+    packing = "none"
+
+    def __init__(self, blocks, n_orbs_alpha, restricted=False):
+        super().__init__(n_orbs_alpha)
+        self.blocks = blocks
+        self.restricted = restricted
+
+        check_format_version(blocks, ERI_BLOCKS_FORMAT_VERSION)
+        packing = getattr(blocks, "attrs", {}).get("packing", "none")
+        if packing != self.packing:
+            raise ValueError("Expected eri_blocks packing {}, but found {}."
+                             "".format(self.packing, packing))
+
+        required = ["aaaa"] if restricted else ["aaaa", "bbbb", "aabb"]
+        for block in required:
+            if block not in blocks:
+                raise ValueError("Spin block {} is required in eri_blocks "
+                                 "storage.".format(block))
+            exshape = self.stored_shape(block)
+            if blocks[block].shape != exshape:
+                raise ValueError("Shape mismatch for key eri_blocks/{}: "
+                                 "Expected {}, but got {}."
+                                 "".format(block, exshape, blocks[block].shape))
+
+    def stored_shape(self, block):
+        """The expected shape of the stored spin block `block`"""
+        return 4 * (self.n_orbs_alpha, )
+
+    def read_stored(self, block, slices):
+        """Read the stored spin block `block` for the passed `slices`"""
+        return self.blocks[block][slices]
+
+    def read_block_into(self, block, slices, out, dest_sel):
+        if self.packing == "none" and (self.restricted or block != "bbaa"):
+            key = "aaaa" if self.restricted else block
+            read_into(self.blocks[key], out, slices, dest_sel)
+        else:
+            super().read_block_into(block, slices, out, dest_sel)
+
+    def read_block(self, block, slices):
+        if self.restricted:
+            return self.read_stored("aaaa", slices)
+        if block == "bbaa":
+            b1, b2, b3, b4 = slices
+            return np.transpose(self.read_stored("aabb", (b3, b4, b1, b2)),
+                                (2, 3, 0, 1))
+        return self.read_stored(block, slices)
+
+
+def pair_index(i, j):
+    """
+    Compound index of the orbital pair `(i, j)` in pyscf's packed
+    lower-triangular storage
+    """
+    return np.where(i >= j, i * (i + 1) // 2 + j, j * (j + 1) // 2 + i)
+
+
+def read_indexed(dataset, indices, max_gap, rest=()):
+    """
+    Return `dataset[indices]` for an integer array `indices` indexing the
+    first axis of `dataset`, where the remaining axes are sliced by `rest`.
+    Only the sorted unique indices are read in contiguous runs. Runs
+    separated by at most `max_gap` unused entries are merged into one read.
+    """
+    unique, inverse = np.unique(indices, return_inverse=True)
+    splits = np.nonzero(np.diff(unique) > max_gap + 1)[0] + 1
+    values = []
+    for run in np.split(unique, splits):
+        stored = dataset[(slice(run[0], run[-1] + 1), ) + tuple(rest)]
+        values.append(stored[run - run[0]])
+    return np.concatenate(values)[inverse.reshape(indices.shape)]
+
+
+class PackedSpinBlockEri(SpinBlockEri):
+    """
+    ERI backend for the `eri_blocks` storage layout with `s8` packing, i.e.
+    employing the permutational symmetry of the integrals over real orbitals.
+    The same-spin blocks `aaaa` and `bbbb` are stored 8-fold packed
+    as a one-dimensional array (pyscf's `s8` format) and the mixed-spin
+    block `aabb` is stored 4-fold packed as a two-dimensional array
+    (pyscf's `s4` format). Only the elements (respectively the rows of
+    `aabb`) required for the requested slices are read and unpacked.
+    """
+    packing = "s8"
+
+    #: Largest number of unused stored elements (or rows) read to merge
+    #: two neighbouring reads into one
+    max_gap = 512
+
+    def stored_shape(self, block):
+        npair = self.n_orbs_alpha * (self.n_orbs_alpha + 1) // 2
+        if block == "aabb":
+            return (npair, npair)
+        else:
+            return (npair * (npair + 1) // 2, )
+
+    def read_stored(self, block, slices):
+        indices = [np.arange(self.n_orbs_alpha)[sl] for sl in slices]
+        pq = pair_index(indices[0][:, None], indices[1][None, :])
+        rs = pair_index(indices[2][:, None], indices[3][None, :])
+        pq = pq[:, :, None, None]
+        rs = rs[None, None, :, :]
+
+        dataset = self.blocks[block]
+        if block == "aabb":
+            rs0, rs1 = np.min(rs), np.max(rs) + 1
+            rows = read_indexed(dataset, pq[:, :, 0, 0], self.max_gap,
+                                (slice(rs0, rs1), ))
+            return rows[:, :, rs[0, 0] - rs0]
+        else:
+            return read_indexed(dataset, pair_index(pq, rs), self.max_gap)
+
+
+class FactorisedEri(EriBackend):
+    """
+    ERI backend for the `eri_factors` storage layout, where a three-index
+    factorisation `(pq|rs) = sum_Q B^Q_pq B^Q_rs` of the integrals
+    (e.g. from density fitting or a Cholesky decomposition) is stored.
+    The factors are stored for each spin as arrays of shape `(naux, n, n)`,
+    where for restricted references only the `alpha` factors are required.
+    """
+    def __init__(self, factors, n_orbs_alpha, restricted=False):
+        super().__init__(n_orbs_alpha)
+        self.factors = factors
+        self.restricted = restricted
+        check_format_version(factors, ERI_FACTORS_FORMAT_VERSION)
+
+        required = ["alpha"] if restricted else ["alpha", "beta"]
+        naux = factors["alpha"].shape[0] if "alpha" in factors else 0
+        for spin in required:
+            if spin not in factors:
+                raise ValueError("Factors for spin {} are required in "
+                                 "eri_factors storage.".format(spin))
+            exshape = (naux, n_orbs_alpha, n_orbs_alpha)
+            if factors[spin].shape != exshape:
+                raise ValueError("Shape mismatch for key eri_factors/{}: "
+                                 "Expected {}, but got {}."
+                                 "".format(spin, exshape, factors[spin].shape))
+
+    def read_factors(self, spin, slice1, slice2):
+        if self.restricted or spin == "a":
+            return self.factors["alpha"][:, slice1, slice2]
+        else:
+            return self.factors["beta"][:, slice1, slice2]
+
+    def read_block(self, block, slices):
+        left = self.read_factors(block[0], slices[0], slices[1])
+        right = self.read_factors(block[2], slices[2], slices[3])
+        return np.tensordot(left, right, axes=(0, 0))
+
+
+class AoEri(EriBackend):
+    """
+    ERI backend transforming the electron-repulsion integrals in the atomic
+    orbital basis `eri_ao` (in pyscf's `s8`, `s4` or unpacked format) on the fly
+    to the requested blocks of the molecular orbital basis defined by the
+    alpha and beta coefficients `mo_coeff` (each of shape `(nb, n)`).
+    Only the orbitals in the requested slices are transformed.
+    """
+    def __init__(self, eri_ao, mo_coeff, restricted=False):
+        super().__init__(mo_coeff[0].shape[1])
+        self.eri_ao = eri_ao
+        self.mo_coeff = {"a": mo_coeff[0], "b": mo_coeff[1]}
+        self.restricted = restricted
+
+        nb = mo_coeff[0].shape[0]
+        npair = nb * (nb + 1) // 2
+        exshapes = [(npair * (npair + 1) // 2, ), (npair, npair), 4 * (nb, )]
+        if eri_ao.shape not in exshapes:
+            raise ValueError("Shape mismatch for the AO electron-repulsion "
+                             "integrals: Expected one of {}, but got {}."
+                             "".format(exshapes, eri_ao.shape))
+
+    def read_block(self, block, slices):
+        if self.restricted:
+            block = "aaaa"
+        coeffs = tuple(self.mo_coeff[spin][:, sl]
+                       for spin, sl in zip(block, slices))
+        shape = tuple(c.shape[1] for c in coeffs)
+        return ao2mo.general(self.eri_ao, coeffs, compact=False).reshape(shape)
+
+
+def open_eri_backend(data, n_orbs_alpha, restricted=False):
+    """
+    Return the ERI backend for the storage layout of the electron-repulsion
+    integrals in the HDF5 group `data` or `None` if the full `eri_ffff`
+    tensor (or none of the supported layouts) is stored.
+    """
+    if "eri_ffff" in data:
+        return None
+    elif "eri_blocks" in data:
+        blocks = data["eri_blocks"]
+        if getattr(blocks, "attrs", {}).get("packing", "none") == "s8":
+            backend = PackedSpinBlockEri
+        else:
+            backend = SpinBlockEri
+        return backend(blocks, n_orbs_alpha, restricted=restricted)
+    elif "eri_factors" in data:
+        return FactorisedEri(data["eri_factors"], n_orbs_alpha,
+                             restricted=restricted)
+    elif "eri_ao" in data:
+        eri_ao = data["eri_ao"]
+        check_format_version(eri_ao, ERI_AO_FORMAT_VERSION)
+        orbcoeff_fb = data["orbcoeff_fb"][()]
+        mo_coeff = (orbcoeff_fb[:n_orbs_alpha].T, orbcoeff_fb[n_orbs_alpha:].T)
+        return AoEri(eri_ao["bbbb"][()], mo_coeff, restricted=restricted)
+    return None
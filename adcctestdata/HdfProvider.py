@@ -20,225 +20,53 @@
 ## along with adcc-testdata. If not, see <http://www.gnu.org/licenses/>.
 ##
 ## ---------------------------------------------------------------------
-import numpy as np
-
 import h5py
 
-from pyadcman import HartreeFockProvider
-
-
-def get_scalar_value(data, key, default=None):
-    if "/" in key:
-        key, subkey = key.split("/", 1)
-        return get_scalar_value(data.get(key, {}), subkey, default=default)
-    if default is not None and key not in data:
-        return default
-
-    value = data[key]
-    if not hasattr(value, "shape"):
-        return value  # Just a scalar
-    elif value.shape == ():
-        return value[()]
-    elif value.shape == (1, ):
-        return value[0]
-    else:
-        raise ValueError("Unrecognised scalar value shape ", value.shape,
-                         " should be () or (1, )")
-
+try:
+    # Registers additional compression filters (e.g. blosc, zstd) with HDF5
+    import hdf5plugin  # noqa: F401
+except ImportError:
+    pass
 
-class HdfOperatorIntegralProvider:
-    def __init__(self, backend="data"):
-        self.backend = backend
+from .ArrayProvider import ArrayProvider
+from .hdf5_access import MappedGroup
 
 
-class HdfProvider(HartreeFockProvider):
-    def __init__(self, data):
+class HdfProvider(ArrayProvider):
+    def __init__(self, data, mmap=None, cache_size=0, trace=False):
         """
-        Initialise the DataHfProvider class with the `data` being an HDF5 file.
-        Let `nf` denote the number of Fock spin orbitals (i.e. the sum of both
-        the alpha and the beta orbitals) and `nb` the number of basis functions.
-        With `array` we indicate either a `np.array` or an HDF5 dataset.
-        The following keys are required in the container:
-
-        1. **restricted** (`bool`): `True` for a restricted SCF calculation,
-           `False` otherwise
-        2. **conv_tol** (`float`): Tolerance value used for SCF convergence,
-           should be roughly equivalent to l2 norm of the Pulay error.
-        3. **orbcoeff_fb** (`.array` with dtype `float`, size `(nf, nb)`):
-           SCF orbital coefficients, i.e. the uniform transform from the basis
-           to the molecular orbitals.
-        4. **occupation_f** (`array` with dtype `float`, size `(nf, )`:
-           Occupation number for each SCF orbitals (i.e. diagonal of the HF
-           density matrix in the SCF orbital basis).
-        5. **orben_f** (`array` with dtype `float`, size `(nf, )`:
-           SCF orbital energies
-        6. **fock_ff** (`array` with dtype `float`, size `(nf, nf)`:
-           Fock matrix in SCF orbital basis. Notice, the full matrix is expected
-           also for restricted calculations.
-        7. **eri_phys_asym_ffff** (`array` with dtype `float`,
-           size `(nf, nf, nf, nf)`: Antisymmetrised electron-repulsion integral
-           tensor in the SCF orbital basis, using the Physicists' indexing
-           convention, i.e. that the index tuple `(i,j,k,l)` refers to
-           the integral :math:`\\langle ij || kl \\rangle`, i.e.
-
-           .. math::
-              \\int_\\Omega \\int_\\Omega d r_1 d r_2 \\frac{
-              \\phi_i(r_1) \\phi_j(r_2)
-              \\phi_k(r_1) \\phi_l(r_2)}{|r_1 - r_2|}
-              - \\int_\\Omega \\int_\\Omega d r_1 d r_2 \\frac{
-              \\phi_i(r_1) \\phi_j(r_2)
-              \\phi_l(r_1) \\phi_k(r_2)}{|r_1 - r_2|}
-
-           The full tensor (including zero blocks) is expected.
-
-        As an alternative to `eri_phys_asym_ffff`, the user may provide
-
-        8. **eri_ffff** (`array` with dtype `float`, size `(nf, nf, nf, nf)`:
-           Electron-repulsion integral tensor in chemists' notation.
-           The index tuple `(i,j,k,l)` thus refers to the integral
-           :math:`(ij|kl)`, which is
-
-           .. math::
-              \\int_\\Omega \\int_\\Omega d r_1 d r_2
-              \\frac{\\phi_i(r_1) \\phi_j(r_1)
-              \\phi_k(r_2) \\phi_l(r_2)}{|r_1 - r_2|}
-
-           Notice, that no antisymmetrisation has been applied in this tensor.
-
-        The above keys define the least set of quantities to start a calculation
-        in `adcc`. In order to have access to properties such as dipole moments
-        or to get the correct state energies, further keys are highly
-        recommended to be provided as well.
-
-        9. **energy_scf** (`float`): Final total SCF energy of both electronic
-           and nuclear energy terms. (default: `0.0`)
-        10. **multipoles**: HDF5 group with electric and nuclear
-            multipole moments.
-
-              - **elec_1** (`array`, size `(3, nb, nb)`):
-                Electric dipole moment integrals in the atomic orbital basis
-                (i.e. the discretisation basis with `nb` elements). First axis
-                indicates cartesian component (x, y, z).
-              - **nuc_0** (`float`): Total nuclear charge
-              - **nuc_1** (`array` size `(3, )`: Nuclear dipole moment
-
-            The defaults for all entries are all-zero multipoles.
-        11. **spin_multiplicity** (`int`): The spin mulitplicity of the HF
-            ground state described by the data. A value of `0` (for unknown)
-            should be supplied for unrestricted calculations.
-            (default: 1 for restricted and 0 for unrestricted calculations)
+        Initialise the DataHfProvider class with the `data` being an HDF5 file
+        (or the name of an HDF5 file). See :py:`ArrayProvider` for the keys
+        expected in the file and for the arguments `cache_size` and `trace`.
+
+        Datasets, which are stored contiguously and uncompressed, are read
+        by memory-mapping the HDF5 file, such that concurrent processes reading
+        the same file share the page cache. The flag `mmap` forces (`True`)
+        or disables (`False`) memory-mapped access.
         """
-
-        # Do not forget the next line, otherwise weird errors result
-        super().__init__()
-
         if isinstance(data, str) and data.endswith(".hdf5"):
             data = h5py.File(data, "r")
         if not isinstance(data, h5py.File):
             raise TypeError("data should be an h5py.File.")
-        self.data = data
-
         if "r" not in data.mode:
             raise ValueError("Passed h5py.File stream (filename: {}) not "
                              "readable.".format(data.filename))
-        self.__backend = data.attrs.get(
-            "backend", '<HDF5 file "{}">'.format(data.filename)
-        )
-
-        if data["orbcoeff_fb"].shape[0] % 2 != 0:
-            raise ValueError("orbcoeff_fb first axis should have even length")
-        nb = self.get_n_bas()
-        nf = 2 * self.get_n_orbs_alpha()
-
-        checks = [("orbcoeff_fb", (nf, nb)), ("occupation_f", (nf, )),
-                  ("orben_f", (nf, )), ("fock_ff", (nf, nf)),
-                  ("eri_ffff", (nf, nf, nf, nf)),
-                  ("eri_phys_asym_ffff", (nf, nf, nf, nf)), ]
-        for key, exshape in checks:
-            if key not in data:
-                continue
-            if data[key].shape != exshape:
-                raise ValueError("Shape mismatch for key {}: Expected {}, but "
-                                 "got {}.".format(key, exshape,
-                                                  data[key].shape))
-
-        # Setup integral data
-        opprov = HdfOperatorIntegralProvider(self.__backend)
-        mmp = data.get("multipoles", {})
-        if "elec_1" in mmp:
-            if mmp["elec_1"].shape != (3, nb, nb):
-                raise ValueError("multipoles/elec_1 is expected to have shape "
-                                 + str((3, nb, nb)) + " not "
-                                 + str(mmp["elec_1"].shape))
-            opprov.electric_dipole = np.asarray(mmp["elec_1"])
-        self.operator_integral_provider = opprov
-
-    #
-    # Required keys
-    #
-    def get_restricted(self):
-        return get_scalar_value(self.data, "restricted")
-
-    def get_conv_tol(self):
-        return get_scalar_value(self.data, "conv_tol")
-
-    def fill_occupation_f(self, out):
-        out[:] = self.data["occupation_f"]
-
-    def fill_orbcoeff_fb(self, out):
-        out[:] = self.data["orbcoeff_fb"]
-
-    def fill_orben_f(self, out):
-        out[:] = self.data["orben_f"]
-
-    def fill_fock_ff(self, slices, out):
-        out[:] = self.data["fock_ff"][slices]
-
-    def fill_eri_ffff(self, slices, out):
-        out[:] = self.data["eri_ffff"][slices]
-
-    def fill_eri_phys_asym_ffff(self, slices, out):
-        # Only required if eri_ffff not provided
-        out[:] = self.data["eri_phys_asym_ffff"][slices]
-
-    #
-    # Recommended keys
-    #
-    def get_backend(self):
-        return self.__backend
-
-    def get_energy_scf(self):
-        return get_scalar_value(self.data, "energy_scf", 0.0)
-
-    def get_nuclear_multipole(self, order):
-        if order == 0:  # The function interface needs an np.array on return
-            nuc_0 = get_scalar_value(self.data, "multipoles/nuclear_0", 0.0)
-            return np.array([nuc_0])
-        elif order == 1:
-            return np.asarray(self.data.get("multipoles/nuclear_1",
-                                            [0., 0, 0]))
-        else:
-            raise NotImplementedError("get_nuclear_multipole with order > 1")
-
-    def get_spin_multiplicity(self):
-        if "spin_multiplicity" in self.data:
-            return get_scalar_value(self.data, "spin_multiplicity")
-        elif not self.get_restricted():
-            return 0
-        else:
-            noa = self.get_n_orbs_alpha()
-            na = int(np.sum(self.data["occupation_f"][:noa]))
-            nb = int(np.sum(self.data["occupation_f"][noa:]))
-            return na - nb + 1
-
-    #
-    # Deduced keys
-    #
-    def get_n_orbs_alpha(self):
-        return self.data["orbcoeff_fb"].shape[0] // 2
-
-    def get_n_bas(self):
-        return self.data["orbcoeff_fb"].shape[1]
-
-    def has_eri_phys_asym_ffff_inner(self):
-        return "eri_phys_asym_ffff" in self.data
+        self.mmap = mmap
+        super().__init__(data, cache_size=cache_size, trace=trace)
+
+        if mmap:
+            # Fail early if the data served by the fill functions
+            # cannot be memory-mapped
+            for key in ["occupation_f", "orbcoeff_fb", "orben_f", "fock_ff",
+                        "eri_ffff", "eri_phys_asym_ffff"]:
+                if key in data:
+                    self.arrays[key]
+            for group in ["eri_blocks", "eri_factors", "eri_ao"]:
+                for key in data.get(group, {}):
+                    self.arrays[group + "/" + key]
+
+    def wrap_arrays(self, data):
+        return MappedGroup(data, self.mmap, self.trace)
+
+    def default_backend(self, data):
+        return '<HDF5 file "{}">'.format(data.filename)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2019 by Michael F. Herbst
+##
+## This file is part of adcc-testdata.
+##
+## adcc-testdata is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc-testdata is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc-testdata. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import os
+import sys
+import time
+import ctypes
+import resource
+import threading
+import contextlib
+
+import numpy as np
+
+import h5py
+
+
+def peak_rss():
+    """Peak resident set size of this process in MB"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def flush_c_stdout():
+    """Flush the C stdio buffers, which hold the output of compiled code"""
+    try:
+        ctypes.CDLL(None).fflush(None)
+    except (OSError, AttributeError):
+        pass
+
+
+def write_report(report, group):
+    """
+    Write the profiling `report` (see :py:`Profiler.report`)
+    into the HDF5 group `group`.
+    """
+    names = [stage["name"] for stage in report["stages"]]
+    group.create_dataset("stages", shape=(len(names), ),
+                         data=np.array(names, dtype=h5py.special_dtype(vlen=str)))
+    for key in ["wall", "cpu", "peak_rss"]:
+        group.create_dataset("stage_" + key, data=np.array(
+            [stage[key] for stage in report["stages"]]
+        ))
+        group.create_dataset(key, shape=(), data=report[key])
+    group.create_dataset("adcman_log", shape=(), data=report["adcman_log"],
+                         dtype=h5py.special_dtype(vlen=str))
+
+    access = group.create_group("data_access")
+    for key, entry in report.get("data_access", {}).items():
+        dataset_group = access.create_group(key)
+        for field, value in entry.items():
+            dataset_group.create_dataset(field, shape=(), data=value)
+
+
+class Profiler:
+    def __init__(self):
+        """
+        Collects the wall and CPU time (of all threads) as well as the peak
+        resident memory of named stages of a calculation and the output
+        of adcman, see :py:`report` for the collected data.
+        """
+        self.stages = []
+        self.log = ""
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Context manager timing the stage `name`"""
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.stages.append({
+                "name": name,
+                "wall": time.perf_counter() - wall,
+                "cpu": time.process_time() - cpu,
+                "peak_rss": peak_rss(),
+            })
+
+    @contextlib.contextmanager
+    def capture_output(self):
+        """
+        Context manager recording what is written to the standard output
+        (including the output of compiled code like adcman) to :py:`log`.
+        The output is passed on to the standard output as it is written.
+        """
+        sys.stdout.flush()
+        flush_c_stdout()
+        saved = os.dup(1)
+        read_end, write_end = os.pipe()
+        chunks = []
+
+        def tee():
+            while True:
+                chunk = os.read(read_end, 65536)
+                if not chunk:
+                    break
+                os.write(saved, chunk)
+                chunks.append(chunk)
+        thread = threading.Thread(target=tee, daemon=True)
+        thread.start()
+
+        os.dup2(write_end, 1)
+        os.close(write_end)
+        try:
+            yield
+        finally:
+            sys.stdout.flush()
+            flush_c_stdout()
+            os.dup2(saved, 1)  # Closes the pipe, which ends the tee thread
+            thread.join()
+            os.close(read_end)
+            os.close(saved)
+            self.log += b"".join(chunks).decode(errors="replace")
+
+    def report(self):
+        """
+        Return the collected data as a dict. Under the key "stages" the list
+        of the stages in the order they were run, each a dict with the
+        keys "name", "wall" and "cpu" (times in seconds) and "peak_rss"
+        (peak resident memory of the process at the end of the stage in MB).
+        "wall", "cpu" and "peak_rss" hold the totals over all stages and
+        "adcman_log" the output of adcman. :py:`run_adcman` adds the
+        :py:`AccessTrace.summary` of the SCF data under "data_access"
+        if the data access is traced.
+        """
+        return {
+            "stages": [dict(stage) for stage in self.stages],
+            "wall": sum(stage["wall"] for stage in self.stages),
+            "cpu": sum(stage["cpu"] for stage in self.stages),
+            "peak_rss": max([0] + [stage["peak_rss"] for stage in self.stages]),
+            "adcman_log": self.log,
+        }
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2019 by Michael F. Herbst
+##
+## This file is part of adcc-testdata.
+##
+## adcc-testdata is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc-testdata is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc-testdata. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+from .dump_pyscf import collect_scf_data, get_eri_ao
+from .ArrayProvider import ArrayProvider
+
+
+class PyscfProvider(ArrayProvider):
+    def __init__(self, scfres, frozen_core=[], frozen_virtual=[],
+                 cache_size=0, trace=False):
+        """
+        Initialise the PyscfProvider class with `scfres` being a converged
+        pyscf SCF calculation. In contrast to :py:`dump_pyscf` followed by
+        :py:`HdfProvider` no data is written to disk: The SCF data is
+        kept in memory and the blocks of the electron-repulsion integrals
+        requested by adcman are transformed from the atomic orbital basis
+        on the fly (as for the `eri_ao` key, see :py:`ArrayProvider`).
+        The orbitals `frozen_core` and `frozen_virtual` are removed
+        from the data (see :py:`dump_pyscf`). See :py:`ArrayProvider`
+        for the arguments `cache_size` and `trace`.
+        """
+        data, _ = collect_scf_data(scfres, frozen_core, frozen_virtual)
+        data["eri_ao/bbbb"] = get_eri_ao(scfres)
+        super().__init__(data, cache_size=cache_size, trace=trace)
+        self.scfres = scfres
+
+    def default_backend(self, data):
+        return "pyscf"
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2019 by Michael F. Herbst
+##
+## This file is part of adcc-testdata.
+##
+## adcc-testdata is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc-testdata is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc-testdata. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import os
+import json
+import hashlib
+
+import numpy as np
+
+import h5py
+
+from .DiskCache import DiskCache, default_cache_dir, file_hash
+from .HdfProvider import HdfProvider
+
+#: Version of the cached results, which is part of the cache key. Increase
+#: to invalidate the cached results after changes to the parameter trees
+#: built by :py:`tasks.parameters`.
+RESULT_CACHE_VERSION = 2
+
+#: Context entries of the ground state stored in the cache
+MP_KEYS = ["mp2/energy", "mp2/total_energy", "mp3/energy", "mp3/total_energy",
+           "mp2/prop/dipole", "mp1/t_o1o1v1v1", "mp1/t_o2o2v1v1",
+           "mp1/t_o1o2v1v1", "mp1/df_o1v1", "mp1/df_o2v1", "mp2/td_o1o1v1v1"]
+MP_KEYS += ["mp2/opdm/" + block
+            for block in ["dm_o1o1", "dm_o1v1", "dm_v1v1", "dm_bb_a", "dm_bb_b",
+                          "dm_o2o1", "dm_o2o2", "dm_o2v1"]]
+
+#: Context entries of each excited state stored in the cache
+STATE_KEYS = ["energy", "u1", "u2", "opdm/dm_bb_a", "opdm/dm_bb_b",
+              "optdm/dm_bb_a", "optdm/dm_bb_b", "prop/dipole", "tprop/dipole"]
+
+#: Context entries of each pair of excited states stored in the cache
+PAIR_KEYS = ["dipole", "optdm/dm_bb_a", "optdm/dm_bb_b"]
+
+
+def state_trees(method):
+    """
+    Return the context subtrees holding the excited states computed for
+    `method` as a list of tuples `(state_tree, state2state_tree, prefix)`,
+    where `prefix` is the prefix of the subtrees of the individual states
+    (e.g. `"es"` for `es0`, `es1`, ...).
+    """
+    base_method = method.split("-")[-1]
+    if base_method.startswith("ip"):
+        root = "adc_ip/" + base_method[2:]
+        prefix = "ip"
+        trees = [("rhf/0", "rhf/isr/0-0"),
+                 ("uhf/alphas/0", "uhf/alphas/isr/0-0"),
+                 ("uhf/betas/0", "uhf/betas/isr/0-0")]
+    else:
+        root = "adc_pp/" + method.replace("-", "_")
+        if method in ["adc2", "cvs-adc2"]:
+            root += "s"
+        prefix = "es"
+        trees = [("rhf/singlets/0", "rhf/isr/singlets/0-0"),
+                 ("rhf/triplets/0", "rhf/isr/triplets/0-0"),
+                 ("uhf/0", "uhf/isr/0-0")]
+    return [(root + "/" + tree, root + "/" + isr, prefix)
+            for tree, isr in trees]
+
+
+def result_keys(ctx, method):
+    """
+    Return the keys of the entries of the adcman output context `ctx` for
+    `method`, which hold results (energies, vectors, densities, properties).
+    """
+    keys = [key for key in MP_KEYS if key in ctx]
+    for tree, isr, prefix in state_trees(method):
+        state = tree + "/" + prefix + "{}/"
+        if tree + "/nstates" in ctx:
+            keys.append(tree + "/nstates")
+            n_states = ctx[tree + "/nstates"]
+        else:
+            n_states = 0
+            while state.format(n_states) + "energy" in ctx:
+                n_states += 1
+        for i in range(n_states):
+            keys.extend(key for key in (state.format(i) + suffix
+                                        for suffix in STATE_KEYS)
+                        if key in ctx)
+        for ifrom in range(n_states):
+            for ito in range(ifrom + 1, n_states):
+                pair = isr + "/{}-{}/".format(ito, ifrom)
+                keys.extend(pair + suffix for suffix in PAIR_KEYS
+                            if pair + suffix in ctx)
+    return keys
+
+
+class CachedTensor:
+    def __init__(self, array):
+        """Tensor of a :py:`CachedContext` holding the array `array`"""
+        self.array = array
+
+    def to_ndarray(self):
+        return self.array.copy()
+
+
+class CachedContext:
+    def __init__(self, entries):
+        """
+        Read-only stand-in for an adcman output context, which serves
+        the dict `entries` (e.g. loaded from a :py:`ResultCache`).
+        """
+        self.entries = entries
+
+    def __contains__(self, key):
+        return key.strip("/") in self.entries
+
+    def __getitem__(self, key):
+        return self.entries[key.strip("/")]
+
+    def get(self, key, default=None):
+        return self.entries.get(key.strip("/"), default)
+
+    def submap(self, tree):
+        prefix = tree.strip("/") + "/"
+        return CachedContext({key[len(prefix):]: value
+                              for key, value in self.entries.items()
+                              if key.startswith(prefix)})
+
+
+class ResultCache:
+    def __init__(self, directory=None, max_bytes=2**32):
+        """
+        Cache of the results of :py:`run_adcman` in the directory `directory`
+        (default: the subdirectory `results` of
+        :py:`DiskCache.default_cache_dir()`), which takes at most `max_bytes`
+        bytes. If exceeded, the least recently used results are removed
+        (see :py:`DiskCache`).
+        """
+        if directory is None:
+            directory = os.path.join(default_cache_dir(), "results")
+        self.cache = DiskCache(directory, max_bytes)
+
+    def key(self, data, method, orbitals, parameters):
+        """
+        Key of the results of running `method` on the SCF data `data`
+        (an :py:`HdfProvider`) with the orbital subspaces `orbitals`
+        (as returned by :py:`active_orbital_lists`) and the arguments
+        `parameters` to :py:`build_parameters`, which determine
+        the adcman parameter tree.
+        """
+        if not isinstance(data, HdfProvider):
+            raise TypeError("Caching results is only supported for SCF data "
+                            "read from HDF5 files.")
+        encoded = json.dumps([
+            RESULT_CACHE_VERSION, file_hash(data.data.filename), method,
+            [sorted(orbs) for orbs in orbitals], parameters
+        ], sort_keys=True)
+        return hashlib.sha256(encoded.encode()).hexdigest()
+
+    def get(self, key):
+        """
+        Return the cached results for `key` as a :py:`CachedContext`
+        or `None` if `key` is not in the cache.
+        """
+        path = self.cache.get(key)
+        if path is None:
+            return None
+
+        entries = {}
+
+        def load(name, item):
+            if isinstance(item, h5py.Dataset):
+                value = item[()]
+                if item.attrs.get("tensor", False):
+                    entries[name] = CachedTensor(value)
+                elif np.ndim(value) == 0:
+                    entries[name] = value.item()
+                else:
+                    entries[name] = value.tolist()
+        with h5py.File(path, "r") as f:
+            f.visititems(load)
+        return CachedContext(entries)
+
+    def put(self, key, ctx, method):
+        """
+        Store the results of `method` from the adcman output context `ctx`
+        in the cache under `key`.
+        """
+        def write(filename):
+            with h5py.File(filename, "w") as f:
+                for ctxkey in result_keys(ctx, method):
+                    value = ctx[ctxkey]
+                    if hasattr(value, "to_ndarray"):
+                        dataset = f.create_dataset(ctxkey,
+                                                   data=value.to_ndarray())
+                        dataset.attrs["tensor"] = True
+                    else:
+                        f.create_dataset(ctxkey, data=np.asarray(value))
+        self.cache.put(key, write)
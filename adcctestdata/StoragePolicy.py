@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2019 by Michael F. Herbst
+##
+## This file is part of adcc-testdata.
+##
+## adcc-testdata is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc-testdata is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc-testdata. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import fnmatch
+
+import numpy as np
+
+#: Storage options reproducing the gzip compression at level 8, which has
+#: historically been used for the larger datasets
+GZIP8 = {"codec": "gzip", "level": 8}
+
+
+class StoragePolicy:
+    def __init__(self, rules=[], default={}):
+        """
+        Policy deciding on the HDF5 storage options of the datasets written
+        by :py:`dump_pyscf` and :py:`dump_reference`.
+
+        Parameters
+        ----------
+        rules : list or dict
+            Pairs `(pattern, options)`, where `pattern` is a shell-style
+            wildcard pattern (see `fnmatch`), which is matched against the
+            full path of a dataset inside the HDF5 file (without leading `/`,
+            e.g. `"eri_blocks/aaaa"` or `"adc/singlet/eigenvectors_doubles"`).
+            The options of the first matching rule are used.
+
+        default : dict
+            Options to use for datasets, which match no rule.
+
+        The options are given as a dict with the keys
+
+          - **codec**: Compression codec, one of `None` (no compression),
+            `"gzip"`, `"lzf"`, `"blosc"` or `"zstd"`. The latter two require
+            the `hdf5plugin` package. (default: `None`)
+          - **level**: Compression level for gzip (default: 4), blosc
+            (default: 5) and zstd (default: 3)
+          - **shuffle**: Apply the byte shuffle filter before compression
+            (default: `False`)
+          - **chunks**: Chunk shape, `True` for automatic chunking or `None`
+            to let HDF5 decide (i.e. contiguous storage if not compressed).
+            Chunk shapes are clipped to the dataset shape. (default: `None`)
+
+        Scalar and empty datasets are always stored without any of these
+        options.
+        """
+        if isinstance(rules, dict):
+            rules = list(rules.items())
+        self.rules = list(rules)
+        self.default = dict(default)
+        for _, options in self.rules + [(None, self.default)]:
+            chunks = options.get("chunks", None)
+            ndim = len(chunks) if isinstance(chunks, (tuple, list)) else 1
+            self.dataset_options(options, ndim * (1, ))  # Check for errors
+
+    @classmethod
+    def legacy(cls):
+        """
+        Policy compressing the same datasets with gzip at level 8
+        as adcc-testdata always did.
+        """
+        return cls([
+            ("fock_ff", GZIP8), ("orbcoeff_fb", GZIP8), ("eri_ffff", GZIP8),
+            ("eri_blocks/*", GZIP8), ("eri_factors/*", GZIP8),
+            ("eri_ao/*", GZIP8),
+            ("*mp1/*", GZIP8), ("*mp2/dm_*", GZIP8), ("*mp2/td_*", GZIP8),
+            ("*/eigenvectors_doubles", GZIP8),
+        ])
+
+    def options_for(self, path):
+        """Return the options of the first rule matching the dataset `path`"""
+        path = path.lstrip("/")
+        for pattern, options in self.rules:
+            if fnmatch.fnmatchcase(path, pattern):
+                return options
+        return self.default
+
+    @staticmethod
+    def dataset_options(options, shape):
+        """
+        Translate the options into keyword arguments for
+        `h5py.Group.create_dataset` for a dataset of shape `shape`.
+        """
+        unknown = set(options) - {"codec", "level", "shuffle", "chunks"}
+        if unknown:
+            raise ValueError("Unknown storage options: " + str(unknown))
+        if len(shape) == 0 or np.prod(shape) == 0:
+            return {}
+
+        ret = {}
+        codec = options.get("codec", None)
+        level = options.get("level", None)
+        shuffle = options.get("shuffle", False)
+        if codec in [None, "none"]:
+            pass
+        elif codec == "gzip":
+            ret["compression"] = "gzip"
+            ret["compression_opts"] = 4 if level is None else level
+        elif codec == "lzf":
+            ret["compression"] = "lzf"
+        elif codec in ["blosc", "zstd"]:
+            try:
+                import hdf5plugin
+            except ImportError:
+                raise ImportError("The storage codec {} requires the package "
+                                  "hdf5plugin.".format(codec))
+            if codec == "blosc":
+                ret.update(hdf5plugin.Blosc(
+                    cname="zstd", clevel=5 if level is None else level,
+                    shuffle=hdf5plugin.Blosc.SHUFFLE if shuffle
+                    else hdf5plugin.Blosc.NOSHUFFLE
+                ))
+                shuffle = False  # Done inside blosc
+            else:
+                ret.update(hdf5plugin.Zstd(clevel=3 if level is None else level))
+        else:
+            raise ValueError("Unknown storage codec: " + str(codec))
+        if shuffle:
+            ret["shuffle"] = True
+
+        chunks = options.get("chunks", None)
+        if isinstance(chunks, (tuple, list)):
+            if len(chunks) != len(shape):
+                raise ValueError("Chunk shape {} does not fit dataset shape {}"
+                                 "".format(chunks, shape))
+            chunks = tuple(max(1, min(c, s)) for c, s in zip(chunks, shape))
+        if chunks is not None:
+            ret["chunks"] = chunks
+        return ret
+
+    def create_dataset(self, group, name, data=None, shape=None, dtype=None):
+        """
+        Create the dataset `name` inside `group` with the storage options
+        for this dataset.
+        """
+        if data is not None:
+            data = np.asarray(data)
+            shape = data.shape
+        path = group.name.rstrip("/") + "/" + name
+        kwargs = self.dataset_options(self.options_for(path), shape)
+        return group.create_dataset(name, data=data, shape=shape, dtype=dtype,
+                                    **kwargs)
@@ -28,11 +28,26 @@ except ImportError:
                       "package first.")
 
 from .dump_pyscf import dump_pyscf
-from .run_adcman import run_adcman
+from .cached_dump_pyscf import cached_dump_pyscf
+from .run_adcman import run_adcman, run_adcman_batch
 from .HdfProvider import HdfProvider
+from .ArrayProvider import ArrayProvider
+from .PyscfProvider import PyscfProvider
 from .dump_reference import dump_reference
+from .StoragePolicy import StoragePolicy
+from .AccessTrace import AccessTrace
+from .rechunk import rechunk
+from .run_sweep import run_sweep
+from .threads import set_num_threads
+from .CheckpointStore import CheckpointStore
+from .ResultCache import ResultCache
+from .Profiler import Profiler
 
-__all__ = ["HdfProvider", "run_adcman", "dump_pyscf", "dump_reference"]
+__all__ = ["ArrayProvider", "HdfProvider", "PyscfProvider", "run_adcman",
+           "run_adcman_batch", "dump_pyscf", "cached_dump_pyscf",
+           "dump_reference", "StoragePolicy", "AccessTrace", "rechunk",
+           "run_sweep", "set_num_threads", "CheckpointStore",
+           "ResultCache", "Profiler"]
 
 __version__ = "0.1.2"
 __license__ = "GPL v3"
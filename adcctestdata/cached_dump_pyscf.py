@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2019 by Michael F. Herbst
+##
+## This file is part of adcc-testdata.
+##
+## adcc-testdata is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc-testdata is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc-testdata. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import json
+import shutil
+import hashlib
+import numpy as np
+
+from .DiskCache import DiskCache
+from .dump_pyscf import dump_pyscf
+from .EriBackends import (ERI_AO_FORMAT_VERSION, ERI_BLOCKS_FORMAT_VERSION,
+                          ERI_FACTORS_FORMAT_VERSION)
+from .StoragePolicy import StoragePolicy
+from .threads import apply_num_threads
+
+#: Version of the data written by :py:`dump_pyscf`, which is part of the
+#: cache key. Increase to invalidate the cached files after changes to
+#: :py:`dump_pyscf`, which alter its output.
+DUMP_VERSION = 1
+
+
+def scf_cache_key(scfres, **kwargs):
+    """
+    Return a key identifying the data :py:`dump_pyscf` writes for the
+    pyscf SCF object `scfres` and the keyword arguments `kwargs`. The key is
+    a hash of the molecule (atoms, coordinates, basis, charge, spin), the SCF
+    class, the SCF convergence settings and `kwargs`, such that it can be
+    computed before the SCF has been run.
+    """
+    mol = scfres.mol
+    if not mol._built:
+        mol.build()
+    diis = scfres.diis
+    inputs = {
+        "versions": [DUMP_VERSION, ERI_AO_FORMAT_VERSION,
+                     ERI_BLOCKS_FORMAT_VERSION, ERI_FACTORS_FORMAT_VERSION],
+        "atoms": [mol.atom_symbol(i) for i in range(mol.natm)],
+        "coords": np.round(mol.atom_coords(), 10),  # In Bohr
+        "basis": mol._basis,
+        "ecp": mol._ecp,
+        "charge": mol.charge,
+        "spin": mol.spin,
+        "cart": mol.cart,
+        "scf": type(scfres).__module__ + "." + type(scfres).__qualname__,
+        "xc": getattr(scfres, "xc", None),
+        "conv_tol": scfres.conv_tol,
+        "conv_tol_grad": scfres.conv_tol_grad,
+        "max_cycle": scfres.max_cycle,
+        "init_guess": scfres.init_guess,
+        "level_shift": scfres.level_shift,
+        "diis": diis if isinstance(diis, bool) else type(diis).__name__,
+        "diis_space": scfres.diis_space,
+        "diis_start_cycle": scfres.diis_start_cycle,
+        "kwargs": kwargs,
+    }
+
+    def serialise(obj):
+        if isinstance(obj, StoragePolicy):
+            return {"rules": obj.rules, "default": obj.default}
+        elif isinstance(obj, (np.ndarray, np.generic)):
+            return obj.tolist()
+        raise TypeError("Cannot serialise {} for the cache key."
+                        "".format(type(obj).__name__))
+
+    encoded = json.dumps(inputs, sort_keys=True, default=serialise)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def cached_dump_pyscf(scfres, out=None, cache_dir=None, max_bytes=2**32,
+                      threads=None, **kwargs):
+    """
+    Return the name of an HDF5 file with the data :py:`dump_pyscf` writes for
+    the pyscf SCF object `scfres`. The file is taken from a cache of SCF dumps
+    if the same molecule has been computed with the same settings before
+    (see :py:`scf_cache_key`), else `scfres.kernel()` is run if required and
+    the result is dumped to the cache.
+
+    Parameters
+    ----------
+    scfres : pyscf.scf.hf.SCF
+        pyscf SCF calculation, which does not need to be run
+
+    out : str or NoneType
+        If not None, the file is copied from the cache to `out` and `out`
+        is returned instead of the file in the cache.
+
+    cache_dir : str or NoneType
+        Directory of the cache (default: :py:`DiskCache.default_cache_dir()`)
+
+    max_bytes : int
+        Maximal size of the cache in bytes. If exceeded, the least recently
+        used files are removed.
+
+    threads : int or NoneType
+        If not None, set the number of threads used by pyscf and BLAS for the
+        SCF and the dump (see :py:`set_num_threads`). Otherwise the number
+        of threads is taken from `ADCCTESTDATA_NUM_THREADS` if set, else the
+        current thread settings are used.
+
+    All other kwargs are passed to :py:`dump_pyscf`.
+    """
+    cache = DiskCache(cache_dir, max_bytes)
+    key = scf_cache_key(scfres, **kwargs)
+    path = cache.get(key)
+    if path is None:
+        def write(filename):
+            apply_num_threads(threads)
+            if not scfres.converged:
+                scfres.kernel()
+            dump_pyscf(scfres, filename, threads=threads, **kwargs).close()
+        path = cache.put(key, write)
+
+    if out is None:
+        return path
+    shutil.copyfile(path, out)
+    return out
@@ -24,8 +24,8 @@ import os
 
 
 def pytest_runtestloop(session):
-    import pyadcman
+    from adcctestdata import set_num_threads
 
     # Reduce threads in Travis session
     if "TRAVIS" in os.environ or "CI" in os.environ:
-        pyadcman.thread_pool.reinit(2, 3)
+        set_num_threads(2)
@@ -22,14 +22,231 @@
 ## ---------------------------------------------------------------------
 import numpy as np
 
-from pyscf import ao2mo, scf
+from pyscf import ao2mo, df, lib, scf
 
 import h5py
 
+from .EriBackends import (ERI_AO_FORMAT_VERSION, ERI_BLOCKS_FORMAT_VERSION,
+                          ERI_FACTORS_FORMAT_VERSION)
+from .StoragePolicy import StoragePolicy
+from .threads import apply_num_threads
 
-def dump_pyscf(scfres, out):
+
+def _spin_block_slices(block, n_orbs_alpha, p0, p1, axis=0):
     """
-    Convert pyscf SCF result to HDF5 file in adcc format
+    Return the slices selecting the spin block `block` (e.g. "aabb")
+    of the full `eri_ffff` tensor, restricted to the spatial orbitals
+    `p0:p1` along the axis `axis`.
+    """
+    ret = []
+    for i, spin in enumerate(block):
+        offset = 0 if spin == "a" else n_orbs_alpha
+        if i == axis:
+            ret.append(slice(offset + p0, offset + p1))
+        else:
+            ret.append(slice(offset, offset + n_orbs_alpha))
+    return tuple(ret)
+
+
+def get_eri_ao(scfres):
+    if hasattr(scfres, "_eri") and scfres._eri is not None:
+        # eri is stored ... use it directly
+        return scfres._eri
+    else:
+        # eri is not stored ... generate it now.
+        return scfres.mol.intor("int2e", aosym="s8")
+
+
+def _transform_eri(scfres, mo_coeffs, max_memory=None, eri_ao=None,
+                   compact=False):
+    """
+    Transform the electron-repulsion integrals to the MO basis defined by the
+    four coefficient matrices `mo_coeffs`. The integrals are returned
+    in batches over the first MO index, i.e. the generator yields tuples
+    `(p0, p1, eri)` where `eri` contains the integrals `(pq|rs)`
+    with `p0 <= p < p1` as an array of shape `(p1 - p0, nq, nr, ns)`.
+    If `compact` is True, the integrals are returned packed in pyscf's `s4`
+    format and the batches run over the compound index of the first pair.
+
+    If `max_memory` (in MB) is None, the full transformation is done in
+    memory (using the AO integrals `eri_ao` if passed) and a single batch
+    is returned. Otherwise the out-of-core transformation of pyscf is
+    employed and batches are chosen such that the memory footprint stays
+    below `max_memory`.
+    """
+    shape = tuple(c.shape[1] for c in mo_coeffs)
+    if compact:
+        shape = tuple(n * (n + 1) // 2 for n in shape[::2])
+    if max_memory is None:
+        if eri_ao is None:
+            eri_ao = get_eri_ao(scfres)
+        eri = ao2mo.general(eri_ao, mo_coeffs, compact=compact)
+        yield 0, shape[0], eri.reshape(shape)
+        return
+
+    # Use half of the memory for the batches copied from the temporary
+    # file, the other half is left for the HDF5 write buffers
+    with lib.H5TmpFile() as tmpfile:
+        ao2mo.outcore.general(scfres.mol, mo_coeffs, tmpfile, "eri_mo",
+                              max_memory=max_memory, compact=compact,
+                              verbose=scfres.verbose)
+        n_rows = 1 if compact else shape[1]  # Rows in eri_mo per index p
+        bytes_per_p = 8 * int(np.prod(shape[1:]))
+        batch = max(1, int(max_memory * 1e6 / 2 / bytes_per_p))
+        for p0 in range(0, shape[0], batch):
+            p1 = min(shape[0], p0 + batch)
+            eri = tmpfile["eri_mo"][p0 * n_rows:p1 * n_rows]
+            yield p0, p1, eri.reshape((p1 - p0, ) + shape[1:])
+
+
+def _dump_eri(data, scfres, mo_coeff, restricted, storage, eri_layout="dense",
+              max_memory=None):
+    """
+    Transform the electron-repulsion integrals to the MO basis defined
+    by the alpha and beta coefficients `mo_coeff` and store them in `data`
+    using the storage layout `eri_layout`.
+    """
+    n_orbs_alpha = mo_coeff[0].shape[1]
+    n_orbs = 2 * n_orbs_alpha
+    packed = eri_layout == "packed"
+    if eri_layout in ["spin_blocks", "packed"]:
+        # Only keep the blocks allowed by spin symmetry. For restricted
+        # references these are all equal, such that only one is stored.
+        blocks = data.create_group("eri_blocks")
+        blocks.attrs["format_version"] = ERI_BLOCKS_FORMAT_VERSION
+        blocks.attrs["packing"] = "s8" if packed else "none"
+        npair = n_orbs_alpha * (n_orbs_alpha + 1) // 2
+        for block in ["aaaa"] if restricted else ["aaaa", "bbbb", "aabb"]:
+            if not packed:
+                shape = 4 * (n_orbs_alpha, )
+            elif block == "aabb":
+                shape = (npair, npair)
+            else:
+                shape = (npair * (npair + 1) // 2, )
+            storage.create_dataset(blocks, block, shape=shape, dtype=float)
+    else:
+        # Blocks, which are never written, are zero (the fill value)
+        eri_ffff = storage.create_dataset(data, "eri_ffff",
+                                          shape=4 * (n_orbs, ), dtype=float)
+
+    # Only transform the spin blocks, which are non-zero by spin symmetry,
+    # and map each transformed block to the blocks of eri_ffff it makes up.
+    # For restricted references all non-zero blocks are equal to the
+    # integrals over the spatial orbitals, such that one transform suffices.
+    if restricted:
+        transforms = {"aaaa": ["aaaa", "aabb", "bbaa", "bbbb"]}
+    else:
+        transforms = {"aaaa": ["aaaa"], "bbbb": ["bbbb"],
+                      "aabb": ["aabb", "bbaa"]}
+
+    eri_ao = get_eri_ao(scfres) if max_memory is None else None
+    spin_coeff = {"a": mo_coeff[0], "b": mo_coeff[1]}
+    for block, targets in transforms.items():
+        coeffs = tuple(spin_coeff[spin] for spin in block)
+        for p0, p1, eri in _transform_eri(scfres, coeffs, max_memory=max_memory,
+                                          eri_ao=eri_ao, compact=packed):
+            if packed and block != "aabb":
+                # Only keep the lower triangle with respect to the compound
+                # pair indices, which is pyscf's s8 format
+                lower = (np.arange(eri.shape[1])[None, :]
+                         <= np.arange(p0, p1)[:, None])
+                blocks[block][p0 * (p0 + 1) // 2:p1 * (p1 + 1) // 2] = \
+                    eri[lower]
+            elif eri_layout in ["spin_blocks", "packed"]:
+                blocks[block][p0:p1] = eri
+            else:
+                for target in targets:
+                    if target == block or restricted:
+                        sl = _spin_block_slices(target, n_orbs_alpha, p0, p1)
+                        eri_ffff[sl] = eri
+                    else:
+                        # bbaa block: (pq|rs) = (rs|pq) with p in the batch
+                        sl = _spin_block_slices(target, n_orbs_alpha, p0, p1,
+                                                axis=2)
+                        eri_ffff[sl] = eri.transpose(2, 3, 0, 1)
+            del eri
+    del eri_ao
+
+
+def _pivoted_cholesky(matrix, tol):
+    """
+    Pivoted incomplete Cholesky decomposition of the positive semi-definite
+    `matrix`, i.e. return vectors `L` such that `matrix` is approximated
+    by `L.T @ L` with an error below `tol` on the diagonal.
+    """
+    diag = np.diag(matrix).copy()
+    vectors = np.empty((len(diag), len(diag)))
+    n_vectors = 0
+    while n_vectors < len(diag):
+        pivot = np.argmax(diag)
+        if diag[pivot] < tol:
+            break
+        column = (matrix[:, pivot]
+                  - vectors[:n_vectors].T @ vectors[:n_vectors, pivot])
+        vectors[n_vectors] = column / np.sqrt(diag[pivot])
+        diag -= vectors[n_vectors]**2
+        n_vectors += 1
+    vectors.resize((n_vectors, len(diag)))  # Release the unused rows
+    return vectors
+
+
+def _dump_eri_factors(data, scfres, mo_coeff, restricted, storage, eri_layout,
+                      auxbasis=None, cholesky_tol=1e-8):
+    """
+    Store a three-index factorisation `(pq|rs) = sum_Q B^Q_pq B^Q_rs`
+    of the electron-repulsion integrals in the MO basis defined by the
+    alpha and beta coefficients `mo_coeff`. For `eri_layout == "df"`
+    the factors are obtained by density fitting, for `eri_layout == "cholesky"`
+    by a pivoted Cholesky decomposition of the AO integrals.
+    """
+    mol = scfres.mol
+    if eri_layout == "df":
+        if auxbasis is None:
+            auxbasis = df.make_auxbasis(mol)
+        factors_ao = df.incore.cholesky_eri(mol, auxbasis=auxbasis)
+    else:
+        eri_ao = ao2mo.restore(4, get_eri_ao(scfres), mol.nao_nr())
+        factors_ao = _pivoted_cholesky(eri_ao, cholesky_tol)
+        del eri_ao
+
+    factors = data.create_group("eri_factors")
+    factors.attrs["format_version"] = ERI_FACTORS_FORMAT_VERSION
+    factors.attrs["kind"] = eri_layout
+    spins = ["alpha"] if restricted else ["alpha", "beta"]
+    for i, spin in enumerate(spins):
+        # Transform the factors to the MO basis in batches over Q
+        n_orbs = mo_coeff[i].shape[1]
+        dataset = storage.create_dataset(
+            factors, spin, shape=(len(factors_ao), n_orbs, n_orbs), dtype=float
+        )
+        for q0 in range(0, len(factors_ao), 64):
+            q1 = min(len(factors_ao), q0 + 64)
+            factors_bb = lib.unpack_tril(factors_ao[q0:q1])
+            dataset[q0:q1] = np.einsum("Qmn,mp,nq->Qpq", factors_bb,
+                                       mo_coeff[i], mo_coeff[i], optimize=True)
+    del factors_ao
+
+
+def collect_scf_data(scfres, frozen_core=[], frozen_virtual=[]):
+    """
+    Collect the SCF data of a converged pyscf calculation in the layout
+    expected by :py:`ArrayProvider` (except the electron-repulsion integrals).
+    Returns a dict mapping from the (HDF5) paths to the data and the tuple
+    of alpha and beta orbital coefficients in the orbital order of the data.
+
+    Parameters
+    ----------
+    scfres : pyscf.scf.hf.SCF
+        Converged pyscf SCF calculation
+
+    frozen_core : list
+        Orbitals to remove from the data as frozen core orbitals, given
+        as in :py:`run_adcman`. The frozen core electrons are folded
+        into the nuclear multipoles.
+
+    frozen_virtual : list
+        Orbitals to remove from the data as frozen virtual orbitals, given
+        as in :py:`run_adcman`.
     """
     if not isinstance(scfres, scf.hf.SCF):
         raise TypeError("Unsupported type for dump_pyscf.")
@@ -42,13 +259,6 @@ def dump_pyscf(scfres, out):
             "object?"
         )
 
-    if isinstance(out, h5py.File):
-        data = out
-    elif isinstance(out, str):
-        data = h5py.File(out, "w")
-    else:
-        raise TypeError("Unknown type for out, only HDF5 file and str supported.")
-
     # Try to determine whether we are restricted
     if isinstance(scfres.mo_occ, list):
         restricted = len(scfres.mo_occ) < 2
@@ -105,21 +315,19 @@ def dump_pyscf(scfres, out):
     threshold = max(10 * scfres.conv_tol, conv_tol_grad)
 
     #
-    # Put basic data into HDF5 file
+    # Basic data
     #
-    data.create_dataset("n_orbs_alpha", shape=(), data=int(n_orbs_alpha))
-    data.create_dataset("energy_scf", shape=(), data=float(scfres.e_tot))
-    data.create_dataset("restricted", shape=(), data=restricted)
-    data.create_dataset("conv_tol", shape=(), data=float(threshold))
+    data = {}
+    data["energy_scf"] = float(scfres.e_tot)
+    data["restricted"] = restricted
+    data["conv_tol"] = float(threshold)
 
     if restricted:
         # Note: In the pyscf world spin is 2S, so the multiplicity
         #       is spin + 1
-        data.create_dataset(
-            "spin_multiplicity", shape=(), data=int(scfres.mol.spin) + 1
-        )
+        data["spin_multiplicity"] = int(scfres.mol.spin) + 1
     else:
-        data.create_dataset("spin_multiplicity", shape=(), data=0)
+        data["spin_multiplicity"] = 0
 
     #
     # Orbital reordering
@@ -147,87 +355,205 @@ def dump_pyscf(scfres, out):
     mo_coeff = tuple(mo_coeff[i][:, sort_indices[i]] for i in range(2))
     fock = tuple(fock[i][sort_indices[i]][:, sort_indices[i]] for i in range(2))
 
+    #
+    # Active space
+    #
+    # Remove the frozen orbitals. The Fock matrix in the SCF orbital basis
+    # already contains the interaction with the frozen core electrons
+    # and the total SCF energy is kept, such that only the multipoles need
+    # to be adapted below.
+    frozen_core = sorted(int(p) for p in frozen_core)
+    frozen_virtual = sorted(int(p) for p in frozen_virtual)
+    frozen = frozen_core + frozen_virtual
+    occupied = np.hstack(mo_occ) > 0
+    if any(p < 0 or p >= n_orbs for p in frozen):
+        raise ValueError("Frozen orbital indices need to be between 0 and "
+                         "{}.".format(n_orbs - 1))
+    if len(set(frozen)) != len(frozen):
+        raise ValueError("An orbital can only be frozen once.")
+    if not np.all(occupied[frozen_core]):
+        raise ValueError("Frozen core orbitals need to be occupied.")
+    if np.any(occupied[frozen_virtual]):
+        raise ValueError("Frozen virtual orbitals need to be unoccupied.")
+
+    active = tuple(np.array([p for p in range(n_orbs_alpha)
+                             if i * n_orbs_alpha + p not in frozen], dtype=int)
+                   for i in range(2))
+    if len(active[0]) != len(active[1]):
+        raise ValueError("The same number of alpha and beta orbitals "
+                         "needs to be frozen.")
+    if restricted and not np.array_equal(active[0], active[1]):
+        raise ValueError("For restricted references the same alpha and beta "
+                         "orbitals need to be frozen.")
+    core_coeff = tuple(
+        mo_coeff[i][:, [p % n_orbs_alpha for p in frozen_core
+                        if p // n_orbs_alpha == i]]
+        for i in range(2)
+    )
+
+    mo_occ = tuple(mo_occ[i][active[i]] for i in range(2))
+    mo_energy = tuple(mo_energy[i][active[i]] for i in range(2))
+    mo_coeff = tuple(mo_coeff[i][:, active[i]] for i in range(2))
+    fock = tuple(fock[i][active[i]][:, active[i]] for i in range(2))
+    n_orbs_alpha = len(active[0])
+    n_orbs = 2 * n_orbs_alpha
+    n_alpha = np.sum(mo_occ[0] > 0)
+    n_beta = np.sum(mo_occ[1] > 0)
+    data["n_orbs_alpha"] = int(n_orbs_alpha)
+    if frozen:
+        data["frozen_orbitals/core"] = np.array(frozen_core, dtype=int)
+        data["frozen_orbitals/virtual"] = np.array(frozen_virtual, dtype=int)
+
     #
     # SCF orbitals and SCF results
     #
-    data.create_dataset("occupation_f", data=np.hstack((mo_occ[0], mo_occ[1])))
-    data.create_dataset("orben_f", data=np.hstack((mo_energy[0], mo_energy[1])))
+    data["occupation_f"] = np.hstack((mo_occ[0], mo_occ[1]))
+    data["orben_f"] = np.hstack((mo_energy[0], mo_energy[1]))
     fullfock_ff = np.zeros((n_orbs, n_orbs))
     fullfock_ff[:n_orbs_alpha, :n_orbs_alpha] = fock[0]
     fullfock_ff[n_orbs_alpha:, n_orbs_alpha:] = fock[1]
-    data.create_dataset("fock_ff", data=fullfock_ff, compression=8)
+    data["fock_ff"] = fullfock_ff
 
     non_canonical = np.max(np.abs(data["fock_ff"] - np.diag(data["orben_f"])))
-    if non_canonical > data["conv_tol"][()]:
+    if non_canonical > data["conv_tol"]:
         raise ValueError("Running adcc on top of a non-canonical fock "
                          "matrix is not implemented.")
 
     cf_bf = np.hstack((mo_coeff[0], mo_coeff[1]))
-    data.create_dataset("orbcoeff_fb", data=cf_bf.transpose(), compression=8)
+    data["orbcoeff_fb"] = cf_bf.transpose()
 
-    #
-    # ERI AO to MO transformation
-    #
-    if hasattr(scfres, "_eri") and scfres._eri is not None:
-        # eri is stored ... use it directly
-        eri_ao = scfres._eri
-    else:
-        # eri is not stored ... generate it now.
-        eri_ao = scfres.mol.intor("int2e", aosym="s8")
+    # Compute electric and nuclear multipole moments
+    charges = scfres.mol.atom_charges()
+    coords = scfres.mol.atom_coords()
+    data["multipoles/nuclear_0"] = int(np.sum(charges))
+    data["multipoles/nuclear_1"] = np.einsum("i,ix->x", charges, coords)
+    data["multipoles/elec_0"] = -int(n_alpha + n_beta)
+    data["multipoles/elec_1"] = scfres.mol.intor_symmetric("int1e_r", comp=3)
+    if frozen_core:
+        # The frozen core electrons act like additional (negative) nuclear
+        # charges on the active electrons
+        dipole_core = sum(np.einsum("xmn,mi,ni->x", data["multipoles/elec_1"],
+                                    coeff, coeff) for coeff in core_coeff)
+        data["multipoles/nuclear_0"] -= len(frozen_core)
+        data["multipoles/nuclear_1"] = \
+            data["multipoles/nuclear_1"] - dipole_core
 
-    aro = slice(0, n_alpha)
-    bro = slice(n_orbs_alpha, n_orbs_alpha + n_beta)
-    arv = slice(n_alpha, n_orbs_alpha)
-    brv = slice(n_orbs_alpha + n_beta, n_orbs)
+    with scfres.mol.with_common_orig([0.0, 0.0, 0.0]):
+        data["magnetic_moments/mag_1"] = \
+            0.5 * scfres.mol.intor('int1e_cg_irxp', comp=3, hermi=2)
+        data["derivatives/nabla"] = \
+            -1.0 * scfres.mol.intor('int1e_ipovlp', comp=3, hermi=2)
+    return data, mo_coeff
 
-    # compute full ERI tensor (with really everything)
-    eri = ao2mo.general(eri_ao, (cf_bf, cf_bf, cf_bf, cf_bf), compact=False)
-    eri = eri.reshape(n_orbs, n_orbs, n_orbs, n_orbs)
-    del eri_ao
 
-    # Adjust spin-forbidden blocks to be exactly zero
-    eri[aro, bro, :, :] = 0
-    eri[aro, brv, :, :] = 0
-    eri[arv, bro, :, :] = 0
-    eri[arv, brv, :, :] = 0
+def dump_pyscf(scfres, out, eri_layout="dense", max_memory=None, auxbasis=None,
+               cholesky_tol=1e-8, storage=None, frozen_core=[],
+               frozen_virtual=[], threads=None):
+    """
+    Convert pyscf SCF result to HDF5 file in adcc format
 
-    eri[bro, aro, :, :] = 0
-    eri[bro, arv, :, :] = 0
-    eri[brv, aro, :, :] = 0
-    eri[brv, arv, :, :] = 0
+    Parameters
+    ----------
+    scfres : pyscf.scf.hf.SCF
+        Converged pyscf SCF calculation
 
-    eri[:, :, aro, bro] = 0
-    eri[:, :, aro, brv] = 0
-    eri[:, :, arv, bro] = 0
-    eri[:, :, arv, brv] = 0
+    out : h5py.File or str
+        HDF5 file (or file name) to dump the data into
 
-    eri[:, :, bro, aro] = 0
-    eri[:, :, bro, arv] = 0
-    eri[:, :, brv, aro] = 0
-    eri[:, :, brv, arv] = 0
-    data.create_dataset("eri_ffff", data=eri, compression=8)
+    eri_layout : str
+        Storage layout for the electron-repulsion integrals. "dense" stores
+        the full `eri_ffff` tensor (including all blocks, which are zero by
+        spin symmetry), "spin_blocks" only stores the non-zero spin blocks
+        in the `eri_blocks` group (see :py:`ArrayProvider` for details).
+        The latter can only be read by :py:`ArrayProvider`. For restricted
+        references only the integrals over the spatial orbitals are
+        stored in this case. "packed" stores the non-zero spin blocks
+        in addition packed by permutational symmetry (up to 8-fold).
+        "df" and "cholesky" store a three-index factorisation of the
+        integrals in the `eri_factors` group, obtained by density fitting
+        or a pivoted Cholesky decomposition of the AO integrals, respectively.
+        This approximates the integrals. "ao" stores the AO integrals
+        in pyscf's `s8` format in the `eri_ao` group, which are transformed
+        to the blocks requested by adcman on demand.
 
-    # Compute electric and nuclear multipole moments
-    charges = scfres.mol.atom_charges()
-    coords = scfres.mol.atom_coords()
-    mmp = data.create_group("multipoles")
-    mmp.create_dataset("nuclear_0", shape=(), data=int(np.sum(charges)))
-    mmp.create_dataset("nuclear_1", data=np.einsum("i,ix->x", charges, coords))
-    mmp.create_dataset("elec_0", shape=(), data=-int(n_alpha + n_beta))
-    mmp.create_dataset("elec_1",
-                       data=scfres.mol.intor_symmetric("int1e_r", comp=3))
-
-    magm = data.create_group("magnetic_moments")
-    derivs = data.create_group("derivatives")
-    with scfres.mol.with_common_orig([0.0, 0.0, 0.0]):
-        magm.create_dataset(
-            "mag_1",
-            data=0.5 * scfres.mol.intor('int1e_cg_irxp', comp=3, hermi=2)
-        )
-        derivs.create_dataset(
-            "nabla",
-            data=-1.0 * scfres.mol.intor('int1e_ipovlp', comp=3, hermi=2)
-        )
+    max_memory : float or NoneType
+        If not None, the electron-repulsion integrals are transformed
+        out of core using pyscf's outcore module and written to the HDF5 file
+        in batches, such that the memory used for the integrals stays
+        below `max_memory` (in MB, as in pyscf). Otherwise the integrals
+        are fully transformed in memory. Not used for the layouts "df",
+        "cholesky" and "ao".
+
+    auxbasis : str or NoneType
+        Auxiliary basis for `eri_layout == "df"` (default: chosen by pyscf)
+
+    cholesky_tol : float
+        Tolerance for the Cholesky decomposition
+        for `eri_layout == "cholesky"`
+
+    storage : StoragePolicy or NoneType
+        Policy for the HDF5 storage options (compression, chunking)
+        of the datasets (default: :py:`StoragePolicy.legacy()`)
+
+    frozen_core : list
+        Orbitals to select as frozen core orbitals, given as in
+        :py:`run_adcman`. They are not stored, i.e. the data only
+        describes the active orbitals, with the frozen core electrons
+        folded into the nuclear multipoles. The frozen orbitals are
+        recorded in the `frozen_orbitals` group, such that :py:`run_adcman`
+        can be called with the same `frozen_core` on the dumped data.
+
+    frozen_virtual : list
+        Orbitals to select as frozen virtual orbitals, which are not
+        stored either (see `frozen_core`).
+
+    threads : int or NoneType
+        If not None, set the number of threads used by pyscf and BLAS
+        (see :py:`set_num_threads`). Otherwise the number of threads
+        is taken from `ADCCTESTDATA_NUM_THREADS` if set, else the current
+        thread settings are used.
+    """
+    apply_num_threads(threads)
+    if eri_layout not in ["dense", "spin_blocks", "packed", "df", "cholesky",
+                          "ao"]:
+        raise ValueError("Unknown eri_layout: " + str(eri_layout))
+    scf_data, mo_coeff = collect_scf_data(scfres, frozen_core, frozen_virtual)
+    restricted = scf_data["restricted"]
+
+    if isinstance(out, h5py.File):
+        data = out
+    elif isinstance(out, str):
+        data = h5py.File(out, "w")
+    else:
+        raise TypeError("Unknown type for out, only HDF5 file and str supported.")
+    if storage is None:
+        storage = StoragePolicy.legacy()
+
+    #
+    # Put SCF data into HDF5 file
+    #
+    for key, value in scf_data.items():
+        if np.ndim(value) == 0:
+            data.create_dataset(key, shape=(), data=value)
+        else:
+            storage.create_dataset(data, key, data=value)
+
+    #
+    # ERI AO to MO transformation
+    #
+    if eri_layout == "ao":
+        eri_ao = data.create_group("eri_ao")
+        eri_ao.attrs["format_version"] = ERI_AO_FORMAT_VERSION
+        storage.create_dataset(eri_ao, "bbbb", data=ao2mo.restore(
+            8, get_eri_ao(scfres), scfres.mol.nao_nr()
+        ))
+    elif eri_layout in ["df", "cholesky"]:
+        _dump_eri_factors(data, scfres, mo_coeff, restricted, storage,
+                          eri_layout, auxbasis=auxbasis,
+                          cholesky_tol=cholesky_tol)
+    else:
+        _dump_eri(data, scfres, mo_coeff, restricted, storage, eri_layout,
+                  max_memory=max_memory)
 
     data.attrs["backend"] = "pyscf"
     return data
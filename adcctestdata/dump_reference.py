@@ -23,19 +23,23 @@
 import numpy as np
 
 from .run_adcman import run_adcman
+from .StoragePolicy import StoragePolicy
+from .Profiler import Profiler, write_report
 
 import h5py
 
 
 def dump_reference(data, method, dumpfile, mp_tree="mp", adc_tree="adc",
-                   n_states_full=None, **kwargs):
+                   n_states_full=None, storage=None, profile=False, **kwargs):
     """
     Run a reference calculation and dump the computed data as an HDF5 file.
-    All kwargs are passed to :py:`run_adcman`.
+    All kwargs are passed to :py:`run_adcman`. If `dry_run` is passed,
+    the estimates returned by :py:`run_adcman` are returned and nothing
+    is dumped.
 
     Parameters
     ----------
-    data : adcc.HdfProvider or h5py.File or str
+    data : ArrayProvider or h5py.File or str or pyscf.scf.hf.SCF or dict
         SCF data to run ADC upon
 
     method : str
@@ -53,15 +57,48 @@ def dump_reference(data, method, dumpfile, mp_tree="mp", adc_tree="adc",
     n_states_full : int or NoneType
         The number of states to include in full in the dump
         (i.e. including singles and doubles parts of the excitatation vectors)
+
+    storage : StoragePolicy or NoneType
+        Policy for the HDF5 storage options (compression, chunking)
+        of the datasets (default: :py:`StoragePolicy.legacy()`)
+
+    profile : bool
+        Profile the calculation and the dump (see :py:`run_adcman`)
+        and write the report into the group `profile` of the dump file
+        (see :py:`Profiler.write_report`).
     """
-    ctx = run_adcman(data, method, **kwargs)
+    if kwargs.get("dry_run", False):
+        return run_adcman(data, method, **kwargs)
+    if not profile:
+        ctx = run_adcman(data, method, **kwargs)
+        return dump_context(ctx, method, dumpfile, mp_tree, adc_tree,
+                            n_states_full, storage, **kwargs)
+
+    profiler = Profiler()
+    ctx, report = run_adcman(data, method, profile=profiler, **kwargs)
+    with profiler.stage("dump"):
+        out = dump_context(ctx, method, dumpfile, mp_tree, adc_tree,
+                           n_states_full, storage, **kwargs)
+    report.update(profiler.report())
+    write_report(report, out.create_group("profile"))
+    return out
+
 
+def dump_context(ctx, method, dumpfile, mp_tree="mp", adc_tree="adc",
+                 n_states_full=None, storage=None, **kwargs):
+    """
+    Dump the data computed by adcman from its output context `ctx` as
+    an HDF5 file. `kwargs` are the arguments `ctx` was computed with by
+    :py:`run_adcman`, see :py:`dump_reference` for the other arguments.
+    """
     if isinstance(dumpfile, h5py.File):
         out = dumpfile
     elif isinstance(dumpfile, str):
         out = h5py.File(dumpfile, "w")
     else:
         raise TypeError("Unknown type for out, only HDF5 file and str supported.")
+    if storage is None:
+        storage = StoragePolicy.legacy()
 
     # Tree where the ADC data is to be found
     method_tree = "adc_pp/" + method.replace("-", "_")
@@ -79,19 +116,19 @@ def dump_reference(data, method, dumpfile, mp_tree="mp", adc_tree="adc",
         # For CVS-ADC(3) the MP3 energy in adcman is wrong!
         mp["mp3/energy"] = ctx["/mp3/energy"]
     if "mp2/prop/dipole" in ctx:
-        mp["mp2/dipole"] = np.array(ctx["/mp2/prop/dipole"])
+        storage.create_dataset(mp, "mp2/dipole",
+                               data=np.array(ctx["/mp2/prop/dipole"]))
 
     for key in ["mp1/t_o1o1v1v1", "mp1/t_o2o2v1v1", "mp1/t_o1o2v1v1",
                 "mp1/df_o1v1", "mp1/df_o2v1", "mp2/td_o1o1v1v1"]:
         if key in ctx:
-            mp.create_dataset(key, data=ctx[key].to_ndarray(),
-                              compression=8)
+            storage.create_dataset(mp, key, data=ctx[key].to_ndarray())
 
     for block in ["dm_o1o1", "dm_o1v1", "dm_v1v1", "dm_bb_a", "dm_bb_b",
                   "dm_o2o1", "dm_o2o2", "dm_o2v1"]:
         if "mp2/opdm/" + block in ctx:
-            mp.create_dataset("mp2/" + block, compression=8,
-                              data=ctx["mp2/opdm/" + block].to_ndarray())
+            storage.create_dataset(mp, "mp2/" + block,
+                                   data=ctx["mp2/opdm/" + block].to_ndarray())
 
     #
     # ADC
@@ -160,18 +197,20 @@ def dump_reference(data, method, dumpfile, mp_tree="mp", adc_tree="adc",
             eigenvalues.append(ctx[state_tree + "/energy"])
 
         # Transform to numpy array
-        adc[kind + "/state_diffdm_bb_a"] = np.asarray(dm_bb_a)
-        adc[kind + "/state_diffdm_bb_b"] = np.asarray(dm_bb_b)
-        adc[kind + "/ground_to_excited_tdm_bb_a"] = np.asarray(tdm_bb_a)
-        adc[kind + "/ground_to_excited_tdm_bb_b"] = np.asarray(tdm_bb_b)
-        adc[kind + "/state_dipole_moments"] = np.asarray(state_dipoles)
-        adc[kind + "/transition_dipole_moments"] = np.asarray(transition_dipoles)
-        adc[kind + "/eigenvalues"] = np.array(eigenvalues)
-        adc[kind + "/eigenvectors_singles"] = np.asarray(eigenvectors_singles)
-
+        arrays = {
+            "state_diffdm_bb_a": dm_bb_a,
+            "state_diffdm_bb_b": dm_bb_b,
+            "ground_to_excited_tdm_bb_a": tdm_bb_a,
+            "ground_to_excited_tdm_bb_b": tdm_bb_b,
+            "state_dipole_moments": state_dipoles,
+            "transition_dipole_moments": transition_dipoles,
+            "eigenvalues": eigenvalues,
+            "eigenvectors_singles": eigenvectors_singles,
+        }
         if eigenvectors_doubles:  # For ADC(0) and ADC(1) there are no doubles
-            adc.create_dataset(kind + "/eigenvectors_doubles", compression=8,
-                               data=np.asarray(eigenvectors_doubles))
+            arrays["eigenvectors_doubles"] = eigenvectors_doubles
+        for key, value in arrays.items():
+            storage.create_dataset(adc, kind + "/" + key, data=np.asarray(value))
     # for kind
 
     # Store which kinds are available
@@ -213,9 +252,12 @@ def dump_reference(data, method, dumpfile, mp_tree="mp", adc_tree="adc",
                     tdm_bb_b.append(pairtree["optdm/dm_bb_b"].to_ndarray())
 
             s2s_from = s2s.create_group("from_{}".format(ifrom))
-            s2s_from["transition_dipole_moments"] = np.asarray(transition_dipoles)
+            storage.create_dataset(s2s_from, "transition_dipole_moments",
+                                   data=np.asarray(transition_dipoles))
             if tdm_bb_a and tdm_bb_b:
-                s2s_from["state_to_excited_tdm_bb_a"] = np.asarray(tdm_bb_a)
-                s2s_from["state_to_excited_tdm_bb_b"] = np.asarray(tdm_bb_b)
+                storage.create_dataset(s2s_from, "state_to_excited_tdm_bb_a",
+                                       data=np.asarray(tdm_bb_a))
+                storage.create_dataset(s2s_from, "state_to_excited_tdm_bb_b",
+                                       data=np.asarray(tdm_bb_b))
 
     return out
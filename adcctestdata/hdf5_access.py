@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2019 by Michael F. Herbst
+##
+## This file is part of adcc-testdata.
+##
+## adcc-testdata is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc-testdata is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc-testdata. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import collections
+
+import numpy as np
+
+import h5py
+
+from .AccessTrace import TracedDataset
+
+
+def read_into(source, out, source_sel=None, dest_sel=None):
+    """
+    Read the selection `source_sel` of the array or HDF5 dataset `source`
+    into the selection `dest_sel` of the array `out`. HDF5 datasets are read
+    directly into `out` without temporary arrays if the memory layout of
+    `out` allows it, otherwise the data is read into a temporary and copied.
+    """
+    if (
+        hasattr(source, "read_direct")
+        and isinstance(out, np.ndarray)
+        and out.flags.c_contiguous and out.flags.writeable
+        and out.dtype == source.dtype
+    ):
+        source.read_direct(out, source_sel, dest_sel)
+    else:
+        source_sel = () if source_sel is None else source_sel
+        dest_sel = () if dest_sel is None else dest_sel
+        out[dest_sel] = source[source_sel]
+
+
+def memmap_dataset(dataset):
+    """
+    Return a read-only `np.memmap` of the HDF5 dataset `dataset` if it
+    is stored contiguously and uncompressed in a plain file, else `None`.
+    Files open for writing are flushed first, such that the map
+    sees the data written so far.
+    """
+    if dataset.chunks is not None or dataset.external:
+        return None  # Chunked (e.g. compressed) or external storage
+    if dataset.file.driver not in ["sec2", "stdio"]:
+        return None
+    if dataset.dtype.kind not in "biuf" or dataset.size == 0:
+        return None
+    offset = dataset.id.get_offset()
+    if offset is None:
+        return None  # Storage not yet allocated
+    if dataset.file.mode != "r":
+        dataset.file.flush()  # Written data may still be in HDF5 buffers
+    return np.memmap(dataset.file.filename, dtype=dataset.dtype, mode="r",
+                     offset=offset, shape=dataset.shape, order="C")
+
+
+class MappedGroup:
+    def __init__(self, group, mmap=None, trace=None):
+        """
+        Read-only view of the HDF5 group `group`, which returns its datasets
+        as memory-mapped arrays (see :py:`memmap_dataset`) where possible,
+        such that reading from them bypasses h5py and uses the page cache
+        of the operating system.
+
+        `mmap` selects whether memory-mapping is attempted for all datasets
+        where possible (`None`), always (`True`, raises a `ValueError` for
+        datasets, which cannot be mapped) or never (`False`). If an
+        :py:`AccessTrace` `trace` is given, datasets, which are not
+        memory-mapped, account their reading times to it.
+        """
+        self.group = group
+        self.mmap = mmap
+        self.trace = trace
+        self.__mapped = {}
+
+    def __getitem__(self, key):
+        item = self.group[key]
+        if isinstance(item, h5py.Group):
+            return MappedGroup(item, self.mmap, self.trace)
+        if self.trace is not None:
+            traced = TracedDataset(item, self.trace)
+        else:
+            traced = item
+        if self.mmap is False:
+            return traced
+        if key not in self.__mapped:
+            self.__mapped[key] = memmap_dataset(item)
+        if self.__mapped[key] is not None:
+            return self.__mapped[key]
+        if self.mmap:
+            raise ValueError("HDF5 dataset {} cannot be memory-mapped, since "
+                             "it is not stored contiguously and uncompressed."
+                             "".format(item.name))
+        return traced
+
+    def __contains__(self, key):
+        return key in self.group
+
+    def __getattr__(self, name):
+        return getattr(self.group, name)
+
+
+class BlockCache:
+    def __init__(self, max_bytes=0):
+        """
+        Least-recently-used cache for array blocks, which holds at most
+        `max_bytes` bytes of data. The counters `hits` and `misses`
+        keep track of the successful and unsuccessful lookups.
+        """
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.__blocks = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self.__blocks)
+
+    def get(self, key):
+        """Return the block stored under `key` or `None`"""
+        block = self.__blocks.get(key, None)
+        if block is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.__blocks.move_to_end(key)
+        return block
+
+    def put(self, key, block):
+        """
+        Store a copy of the array `block` under `key`, evicting the least
+        recently used blocks if needed. Blocks larger than the cache
+        are not stored.
+        """
+        if block.nbytes > self.max_bytes:
+            return
+        if key in self.__blocks:
+            self.nbytes -= self.__blocks.pop(key).nbytes
+        while self.__blocks and self.nbytes + block.nbytes > self.max_bytes:
+            _, evicted = self.__blocks.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+        self.__blocks[key] = np.array(block)
+        self.nbytes += block.nbytes
+
+    def clear(self):
+        self.__blocks.clear()
+        self.nbytes = 0
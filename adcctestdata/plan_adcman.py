@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2019 by Michael F. Herbst
+##
+## This file is part of adcc-testdata.
+##
+## adcc-testdata is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc-testdata is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc-testdata. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import os
+
+import numpy as np
+
+# Fraction of the elements of a spin-orbital tensor, which are not zero
+# by spin symmetry, by the number of orbital indices of the tensor
+SPIN_FRACTION = {2: 1 / 2, 3: 3 / 8, 4: 3 / 8}
+
+
+def n_elements(*dims, pairs=0):
+    """
+    Rough number of elements adcman stores for a spin-orbital tensor
+    with the dimensions `dims`, where `pairs` is the number of index pairs
+    the tensor is antisymmetric in.
+    """
+    return float(SPIN_FRACTION[len(dims)] * np.prod(dims, dtype=float)
+                 / 2**pairs)
+
+
+def resolve_subspace(max_subspace, n_states):
+    """
+    The subspace size adcman uses for computing `n_states` states
+    for a passed `max_subspace` (see :py:`AdcCommon.add_solver_params_to`).
+    """
+    if max_subspace == 0:
+        return 5 * n_states
+    elif max_subspace < n_states:
+        return 2 * n_states
+    return max_subspace
+
+
+def available_memory(root="/sys/fs/cgroup"):
+    """
+    Return the physical memory of the machine in MB, limited by the memory
+    limit of the cgroup of this process (cgroup v2 `memory.max` or
+    cgroup v1 `memory.limit_in_bytes`).
+    """
+    memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    for path in [os.path.join(root, "memory.max"),
+                 os.path.join(root, "memory", "memory.limit_in_bytes")]:
+        try:
+            with open(path) as f:
+                memory = min(memory, int(f.read()))
+            break
+        except (OSError, ValueError):
+            continue
+    return memory / 1e6
+
+
+def plan_adcman(data, method, core_orbitals=[], frozen_core=[],
+                frozen_virtual=[], max_subspace=0, n_singlets=None,
+                n_triplets=None, n_states=None, n_spin_flip=None,
+                n_ipalpha=None, n_ipbeta=None, max_memory=None, shrink=True,
+                **kwargs):
+    """
+    Estimate the peak memory and the floating-point operations of the tasks
+    adcman performs for an ADC calculation. The estimates are rough and
+    meant to decide whether a calculation fits into the available memory
+    before it is started.
+
+    Parameters
+    ----------
+    data : ArrayProvider
+        SCF data to run ADC upon
+
+    method : str
+        ADC method to execute
+
+    core_orbitals, frozen_core, frozen_virtual : list
+        Orbital subspaces as in :py:`run_adcman`, but indexing
+        the orbitals present in `data`
+
+    max_subspace : int
+        Maximal subspace size as in :py:`run_adcman`
+
+    max_memory : float or NoneType
+        If not None, the memory budget in MB, which the estimated peak memory
+        is not allowed to exceed. In this case a :py:`MemoryError` is raised
+        if the budget is exceeded.
+
+    shrink : bool
+        If the budget `max_memory` is exceeded, first try to reduce the
+        Davidson subspace size (down to twice the number of states) to fit
+        the calculation into the budget.
+
+    Remaining arguments are the numbers of states as in :py:`run_adcman`.
+    All other kwargs are ignored.
+
+    Returns
+    -------
+    dict
+        Under the key "tasks" a dict with the estimated memory (in bytes)
+        and number of floating-point operations of each task
+        ("eri", "mp1", "mp2", "pi", "pia_pib", "davidson", "isr"). "memory"
+        and "flops" hold the estimates for the whole calculation,
+        "max_subspace" the maximal subspace size, for which the plan is made,
+        and "subspace_memory" the part of the memory taken by the
+        Davidson subspace. "spaces" holds the number of spin orbitals in the
+        orbital subspaces ("o": valence occupied, "c": core occupied,
+        "v": virtual, "f": all orbitals), "vector" the rough dimension of the
+        "singles" and "doubles" part of the excitation vectors.
+    """
+    base_method = method.split("-")[-1]
+    cvs = "cvs" in method.split("-")[:-1]
+    ip = base_method.startswith("ip")
+    level = int(base_method[-2 if base_method.endswith("x") else -1])
+    extended = base_method in ["adc2x", "adc3", "ipadc3"]
+
+    n_orbs = 2 * data.get_n_orbs_alpha()
+    occupation = np.empty(n_orbs)
+    data.fill_occupation_f(occupation)
+    n_core = len(core_orbitals)
+    n_occ = int(np.sum(occupation > 0)) - len(frozen_core) - n_core
+    n_virt = int(np.sum(occupation <= 0)) - len(frozen_virtual)
+    spaces = {"o": n_occ, "c": n_core, "v": n_virt, "f": n_orbs}
+    o = n_occ + n_core  # All active occupied orbitals
+    v = n_virt
+
+    word = 8  # Bytes per double
+    tasks = {}
+
+    # Import of the electron-repulsion integrals
+    eri = n_elements(o, o, v, v, pairs=2) + n_elements(o, v, o, v)
+    if level >= 2:
+        eri += (n_elements(o, o, o, o, pairs=2) + n_elements(o, o, o, v, pairs=1)
+                + n_elements(o, v, v, v, pairs=1)
+                + n_elements(v, v, v, v, pairs=2))
+    tasks["eri"] = {"memory": word * eri, "flops": eri}
+
+    # Ground state (MP) amplitudes and intermediates
+    t2 = n_elements(o, o, v, v, pairs=2)
+    if level >= 1:
+        tasks["mp1"] = {"memory": word * t2, "flops": 2 * t2}
+    if level >= 2:
+        tasks["mp2"] = {"memory": word * t2, "flops": 2 * t2 * (o**2 + v**2)}
+        tasks["pi"] = {"memory": 3 * word * t2, "flops": 6 * t2 * o * v}
+    if level >= 3:
+        pia = n_elements(o, o, o, v, pairs=1)
+        pib = n_elements(o, v, v, v, pairs=1)
+        tasks["pia_pib"] = {"memory": word * (pia + pib),
+                            "flops": 2 * (pia + pib) * o * v}
+
+    # Excitation (ionisation) vectors
+    o_exc = n_core if cvs else o  # Occupied orbitals excited from
+    if ip:
+        singles = o_exc / 2
+        if cvs:
+            doubles = n_elements(n_core, n_occ, v)
+        else:
+            doubles = n_elements(o, o, v, pairs=1)
+    else:
+        singles = n_elements(o_exc, v)
+        if cvs:
+            doubles = n_elements(n_core, n_occ, v, v, pairs=1)
+        else:
+            doubles = n_elements(o, o, v, v, pairs=2)
+    if level < 2:
+        doubles = 0
+    vector = singles + doubles
+
+    if doubles == 0:
+        matvec = 2 * singles * (o + v)
+    elif extended:
+        matvec = 2 * doubles * (o + v)**2
+    else:
+        matvec = 2 * doubles * (o + v)
+
+    kinds = [n for n in [n_singlets, n_triplets, n_states, n_spin_flip,
+                         n_ipalpha, n_ipbeta] if n]
+    if not kinds:
+        raise ValueError("No excited states to compute.")
+    n_pairs = sum(n * (n - 1) // 2 for n in kinds)
+    if n_singlets and n_triplets:
+        n_pairs += n_singlets * n_triplets
+    n_density = n_orbs**2 / 2  # Alpha and beta block of a density matrix
+
+    def make_plan(max_subspace):
+        subspaces = [resolve_subspace(max_subspace, n) for n in kinds]
+        # The kinds of states are solved for one after another, but the
+        # eigenvectors are kept
+        davidson = 2 * max(subspaces) * vector + sum(kinds) * vector
+        plan_tasks = dict(tasks)
+        plan_tasks["davidson"] = {
+            "memory": word * davidson,
+            "flops": sum(s * matvec for s in subspaces),
+        }
+        plan_tasks["isr"] = {
+            "memory": word * (n_pairs + 2 * sum(kinds)) * n_density,
+            "flops": (n_pairs + 2 * sum(kinds)) * 2 * vector * (o + v),
+        }
+        return {
+            "method": method,
+            "spaces": spaces,
+            "vector": {"singles": singles, "doubles": doubles},
+            "max_subspace": max_subspace,
+            "subspace_memory": 2 * word * max(subspaces) * vector,
+            "tasks": plan_tasks,
+            "memory": sum(t["memory"] for t in plan_tasks.values()),
+            "flops": sum(t["flops"] for t in plan_tasks.values()),
+        }
+
+    plan = make_plan(max_subspace)
+    if max_memory is None or plan["memory"] <= max_memory * 1e6:
+        return plan
+
+    if shrink:
+        # Fit the subspace into what is left of the budget
+        subspace = max(resolve_subspace(max_subspace, n) for n in kinds)
+        fixed = plan["memory"] - 2 * word * vector * subspace
+        fitting = int((max_memory * 1e6 - fixed) // (2 * word * vector))
+        if fitting >= 2 * max(kinds):
+            plan = make_plan(min(fitting, subspace))
+            if plan["memory"] <= max_memory * 1e6:
+                return plan
+
+    raise MemoryError("The {} calculation is estimated to need {:.0f} MB "
+                      "of memory, which exceeds the budget of {:.0f} MB."
+                      "".format(method, plan["memory"] / 1e6, max_memory))
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2019 by Michael F. Herbst
+##
+## This file is part of adcc-testdata.
+##
+## adcc-testdata is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc-testdata is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc-testdata. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import itertools
+
+import numpy as np
+
+import h5py
+
+from .AccessTrace import AccessTrace
+from .EriBackends import open_eri_backend
+
+
+def orbital_runs(data, core_orbitals=[], frozen_core=[], frozen_virtual=[]):
+    """
+    Split the spin-orbital axis of the SCF data `data` into the runs of
+    consecutive orbitals, which belong to the same spin and the same orbital
+    subspace of adcman (frozen core, core, occupied, virtual, frozen virtual).
+    The orbital lists are given as for :py:`run_adcman`. Returns a list
+    of tuples `(spin, start, stop)`.
+    """
+    occupation = np.asarray(data["occupation_f"])
+    n_orbs_alpha = occupation.size // 2
+
+    def label(p):
+        spin = "a" if p < n_orbs_alpha else "b"
+        if p in frozen_core:
+            return spin, "fo"
+        elif p in core_orbitals:
+            return spin, "c"
+        elif p in frozen_virtual:
+            return spin, "fv"
+        return spin, "o" if occupation[p] > 0 else "v"
+
+    runs = []
+    for p in range(occupation.size):
+        if runs and runs[-1][0] == label(p):
+            runs[-1][2] = p + 1
+        else:
+            runs.append([label(p), p, p + 1])
+    return [(lbl[0], start, stop) for lbl, start, stop in runs]
+
+
+def adcman_requests(data, core_orbitals=[], frozen_core=[], frozen_virtual=[]):
+    """
+    Model the data requests adcman makes to an :py:`HdfProvider` serving the
+    SCF data `data` for the given orbital subspaces (see :py:`run_adcman`).
+    adcman requests the Fock matrix and the electron-repulsion integrals
+    blockwise, one block per combination of orbital subspaces and spins
+    allowed by spin symmetry, and the orbital data in full.
+    Returns a list of `(key, slices)` tuples as in an :py:`AccessTrace`.
+    """
+    runs = orbital_runs(data, core_orbitals, frozen_core, frozen_virtual)
+    requests = [(key, None) for key in ["occupation_f", "orben_f",
+                                        "orbcoeff_fb"]]
+    for (s1, a1, b1), (s2, a2, b2) in itertools.product(runs, repeat=2):
+        if s1 == s2:
+            requests.append(("fock_ff", (slice(a1, b1), slice(a2, b2))))
+
+    if "eri_phys_asym_ffff" in data:
+        key = "eri_phys_asym_ffff"
+
+        def allowed(s1, s2, s3, s4):  # <12||34> = (13|24) - (14|23)
+            return (s1 == s3 and s2 == s4) or (s1 == s4 and s2 == s3)
+    else:
+        key = "eri_ffff"
+
+        def allowed(s1, s2, s3, s4):  # (12|34)
+            return s1 == s2 and s3 == s4
+
+    for block in itertools.product(runs, repeat=4):
+        if allowed(*[spin for spin, _, _ in block]):
+            requests.append((key, tuple(slice(start, stop)
+                                        for _, start, stop in block)))
+    return requests
+
+
+def trace_requests(trace):
+    """
+    Extract the `(key, slices)` tuples of the data requests recorded in
+    an :py:`AccessTrace` `trace` (or a JSON file written by it).
+    """
+    if isinstance(trace, str):
+        trace = AccessTrace.from_json(trace)
+    requests = []
+    for rec in trace.records:
+        if not rec["function"].startswith("fill_"):
+            continue
+        slices = rec["slices"]
+        if slices is not None:
+            slices = tuple(slice(*sl) for sl in slices)
+        requests.append((rec["key"], slices))
+    return requests
+
+
+class RecordingDataset:
+    def __init__(self, dataset, selections):
+        """
+        Stand-in for the HDF5 dataset `dataset`, which appends the
+        selections it is read with to the list `selections` and returns
+        zeros instead of reading any data.
+        """
+        self.shape = dataset.shape
+        self.dtype = dataset.dtype
+        self.selections = selections
+
+    def __getitem__(self, sel):
+        self.selections.append(sel)
+        return np.broadcast_to(np.zeros((), dtype=self.dtype), self.shape)[sel]
+
+
+class RecordingGroup:
+    def __init__(self, group, selections):
+        """
+        Stand-in for the HDF5 group `group`, which returns its datasets
+        as :py:`RecordingDataset` objects, recording into the dict
+        `selections` mapping from the dataset paths to the selections.
+        """
+        self.group = group
+        self.attrs = group.attrs
+        self.selections = selections
+
+    def __contains__(self, key):
+        return key in self.group
+
+    def __getitem__(self, key):
+        item = self.group[key]
+        if isinstance(item, h5py.Group):
+            return RecordingGroup(item, self.selections)
+        path = item.name.lstrip("/")
+        return RecordingDataset(item, self.selections.setdefault(path, []))
+
+
+def selection_ranges(sel, shape):
+    """
+    Translate the selection `sel` of an array of shape `shape` into
+    a tuple of `(start, stop)` ranges covering it along each axis.
+    """
+    if sel is None:
+        sel = ()
+    elif not isinstance(sel, tuple):
+        sel = (sel, )
+    sel = sel + (len(shape) - len(sel)) * (slice(None), )
+    ranges = []
+    for sl, n in zip(sel, shape):
+        if isinstance(sl, slice):
+            start, stop, step = sl.indices(n)
+            indices = range(start, stop, step)
+            if len(indices) == 0:
+                return None
+            ranges.append((min(indices[0], indices[-1]),
+                           max(indices[0], indices[-1]) + 1))
+        else:
+            indices = np.asarray(sl) % n
+            ranges.append((int(np.min(indices)), int(np.max(indices)) + 1))
+    return tuple(ranges)
+
+
+def dataset_requests(data, requests):
+    """
+    Translate the `(key, slices)` data requests to an :py:`HdfProvider`
+    serving `data` into the ranges read from each HDF5 dataset. This takes
+    the storage layout of the electron-repulsion integrals into account
+    (see :py:`EriBackends`). Returns a dict mapping from the dataset path
+    to a list of tuples of `(start, stop)` ranges along each axis.
+    """
+    restricted = bool(np.asarray(data["restricted"]))
+    n_orbs_alpha = data["orbcoeff_fb"].shape[0] // 2
+    selections = {}
+    recording = RecordingGroup(data, selections)
+    backend = open_eri_backend(recording, n_orbs_alpha, restricted=restricted)
+
+    for key, slices in requests:
+        if key in data:
+            selections.setdefault(key, []).append(slices)
+            continue
+        if backend is None or key not in ["eri_ffff", "eri_phys_asym_ffff"]:
+            continue
+        shape = tuple(len(range(*sl.indices(2 * n_orbs_alpha)))
+                      for sl in slices)
+        if key == "eri_ffff":
+            backend.fill(slices, np.empty(shape))
+        else:
+            backend.fill_phys_asym(slices, np.empty(shape))
+
+    ret = {}
+    for path, sels in selections.items():
+        shape = data[path].shape
+        ranges = [selection_ranges(sel, shape) for sel in sels]
+        ret[path] = [rng for rng in ranges if rng is not None]
+    return ret
+
+
+def choose_chunks(shape, ranges, itemsize=8, max_chunk_bytes=2**20,
+                  chunk_overhead=4096):
+    """
+    Choose the chunk shape for a dataset of shape `shape`, which is read
+    in the blocks given by `ranges` (list of tuples of `(start, stop)` ranges
+    along each axis, see :py:`dataset_requests`).
+
+    Parameters
+    ----------
+    itemsize : int
+        Size of a dataset element in bytes
+
+    max_chunk_bytes : int
+        Upper bound for the chunk size in bytes. The default of 1 MiB is
+        the size of HDF5's default chunk cache.
+
+    chunk_overhead : int
+        Cost of reading a chunk in addition to the decompressed bytes,
+        expressed in bytes. It models the per-chunk costs of the chunk
+        index lookup, the filter pipeline and the worse compression
+        of small chunks.
+
+    The chosen chunk shape minimises the cost of reading all blocks, i.e. the
+    sum over the blocks of the number of chunks touched by the block times
+    the chunk size plus `chunk_overhead`. The candidate chunk extents along
+    each axis are the block extents, the largest extent aligned with all
+    block boundaries, the powers of two and the full axis.
+    """
+    shape = tuple(shape)
+    if len(ranges) == 0:
+        ranges = [tuple((0, n) for n in shape)]
+    starts = np.array([[start for start, _ in rng] for rng in ranges])
+    stops = np.array([[stop for _, stop in rng] for rng in ranges])
+
+    candidates = []
+    for axis, n in enumerate(shape):
+        boundaries = np.concatenate([starts[:, axis], stops[:, axis], [n]])
+        extents = {1, n, int(np.gcd.reduce(boundaries))}
+        extents.update(int(e) for e in stops[:, axis] - starts[:, axis])
+        extents.update(2**k for k in range(int(np.log2(max(n, 1))) + 1))
+        candidates.append(sorted(e for e in extents if 0 < e <= n))
+
+    best, best_key = None, None
+    for chunks in itertools.product(*candidates):
+        chunk_bytes = itemsize * int(np.prod(chunks))
+        if chunk_bytes > max_chunk_bytes and any(c > 1 for c in chunks):
+            continue
+        touched = np.prod((stops - 1) // chunks - starts // chunks + 1, axis=1)
+        cost = np.sum(touched) * (chunk_bytes + chunk_overhead)
+        key = (cost, -chunk_bytes)
+        if best_key is None or key < best_key:
+            best, best_key = chunks, key
+    return best
+
+
+def rechunk(infile, outfile, trace=None, core_orbitals=[], frozen_core=[],
+            frozen_virtual=[], storage=None, max_chunk_bytes=2**20,
+            chunk_overhead=4096):
+    """
+    Rewrite the SCF data file `infile` (as written by :py:`dump_pyscf`)
+    to `outfile` with chunk shapes aligned to the blocks in which
+    :py:`HdfProvider` reads the data, such that each block request
+    touches (and decompresses) as few chunks as possible.
+
+    Parameters
+    ----------
+    infile : str or h5py.File
+        SCF data to rewrite
+
+    outfile : str or h5py.File
+        Destination file
+
+    trace : AccessTrace or str or NoneType
+        Access trace (or JSON file written by :py:`AccessTrace.to_json`)
+        recording the data requests of an adcman run on `infile`. If `None`,
+        the requests are modelled by :py:`adcman_requests`
+        for the orbital subspaces given by `core_orbitals`, `frozen_core`
+        and `frozen_virtual` (see :py:`run_adcman`).
+
+    storage : StoragePolicy or NoneType
+        Storage policy for the compression of the rewritten datasets. By
+        default the compression of the datasets in `infile` is kept.
+
+    max_chunk_bytes : int
+        Upper bound for the chunk size in bytes (see :py:`choose_chunks`)
+
+    chunk_overhead : int
+        Per-chunk reading cost in bytes (see :py:`choose_chunks`)
+
+    Datasets stored without compression are kept contiguous, since chunking
+    cannot reduce the amount of data read for them and prevents
+    memory-mapping. Returns a dict mapping from the path of each chunked
+    dataset to its chosen chunk shape.
+    """
+    if isinstance(infile, str):
+        with h5py.File(infile, "r") as fp:
+            return rechunk(fp, outfile, trace, core_orbitals, frozen_core,
+                           frozen_virtual, storage, max_chunk_bytes,
+                           chunk_overhead)
+    if isinstance(outfile, str):
+        with h5py.File(outfile, "w") as fp:
+            return rechunk(infile, fp, trace, core_orbitals, frozen_core,
+                           frozen_virtual, storage, max_chunk_bytes,
+                           chunk_overhead)
+
+    if trace is None:
+        requests = adcman_requests(infile, core_orbitals, frozen_core,
+                                   frozen_virtual)
+    else:
+        requests = trace_requests(trace)
+    ranges = dataset_requests(infile, requests)
+
+    chosen = {}
+    outfile.attrs.update(infile.attrs)
+
+    def copy_item(path, item):
+        if isinstance(item, h5py.Group):
+            outfile.require_group(path).attrs.update(item.attrs)
+            return
+        if storage is not None:
+            kwargs = storage.dataset_options(storage.options_for(path),
+                                             item.shape)
+            compressed = "compression" in kwargs
+        else:
+            kwargs = {"dcpl": item.id.get_create_plist()}
+            compressed = kwargs["dcpl"].get_nfilters() > 0
+        if path in ranges and compressed:
+            kwargs["chunks"] = choose_chunks(item.shape, ranges[path],
+                                             item.dtype.itemsize,
+                                             max_chunk_bytes, chunk_overhead)
+            chosen[path] = kwargs["chunks"]
+        elif storage is None:
+            infile.copy(item, outfile, name=path)
+            return
+
+        dataset = outfile.create_dataset(path, shape=item.shape,
+                                         dtype=item.dtype, **kwargs)
+        dataset.attrs.update(item.attrs)
+        if dataset.chunks is None:
+            dataset[()] = item[()]
+        else:
+            for sel in dataset.iter_chunks():
+                dataset[sel] = item[sel]
+
+    infile.visititems(copy_item)
+    return chosen
@@ -20,11 +20,24 @@
 ## along with adcc-testdata. If not, see <http://www.gnu.org/licenses/>.
 ##
 ## ---------------------------------------------------------------------
+import contextlib
+import collections.abc
+import numpy as np
+
 import h5py
 import pyadcman
 
+from pyscf import scf
+
 from . import tasks
 from .HdfProvider import HdfProvider
+from .CheckpointStore import CHECKPOINT_ENTRIES, CheckpointStore, task_entries
+from .ResultCache import ResultCache
+from .Profiler import Profiler
+from .ArrayProvider import ArrayProvider
+from .PyscfProvider import PyscfProvider
+from .threads import apply_num_threads
+from .plan_adcman import available_memory, plan_adcman
 
 
 def get_valid_methods():
@@ -142,6 +155,210 @@ def check_ipadc(refstate, n_ipalpha=None, n_ipbeta=None, **kwargs):
     return n_ipalpha, n_ipbeta
 
 
+def as_provider(data):
+    """
+    Convert the SCF data `data` as accepted by :py:`run_adcman`
+    into an :py:`ArrayProvider`.
+    """
+    if isinstance(data, str) and data.endswith(".hdf5"):
+        data = HdfProvider(h5py.File(data, "r"))
+    if isinstance(data, h5py.File):
+        data = HdfProvider(data)
+    if isinstance(data, scf.hf.SCF):
+        data = PyscfProvider(data)
+    if isinstance(data, (collections.abc.Mapping, np.lib.npyio.NpzFile)):
+        data = ArrayProvider(data)
+    if not isinstance(data, ArrayProvider):
+        raise TypeError("data needs to be an ArrayProvider instance")
+    return data
+
+
+def active_orbital_lists(data, core_orbitals=[], frozen_core=[],
+                         frozen_virtual=[]):
+    """
+    Translate the orbital subspaces passed to :py:`run_adcman` to the
+    indices of the orbitals present in the :py:`ArrayProvider` `data`.
+    Returns the tuple `(core_orbitals, frozen_core, frozen_virtual)`.
+    Raises a `ValueError` if not all orbitals removed from `data`
+    are passed as frozen orbitals.
+    """
+    # Orbitals frozen when the data was dumped are not present any more
+    removed_core = data.get_frozen_core()
+    removed_virtual = data.get_frozen_virtual()
+    for removed, frozen, name in [(removed_core, frozen_core, "frozen_core"),
+                                  (removed_virtual, frozen_virtual,
+                                   "frozen_virtual")]:
+        missing = [p for p in removed if p not in frozen]
+        if missing:
+            raise ValueError("The orbitals {} have been removed from the data, "
+                             "since they are frozen. Pass them in {} as well."
+                             "".format(missing, name))
+    frozen_core = data.active_orbitals(p for p in frozen_core
+                                       if p not in removed_core)
+    frozen_virtual = data.active_orbitals(p for p in frozen_virtual
+                                          if p not in removed_virtual)
+    core_orbitals = data.active_orbitals(core_orbitals)
+    return core_orbitals, frozen_core, frozen_virtual
+
+
+def setup_reference_state(data, core_orbitals=[], frozen_core=[],
+                          frozen_virtual=[]):
+    """
+    Convert `data` into an :py:`ArrayProvider` and build the adcman
+    reference state on top of it. Returns the tuple `(data, refstate)`.
+    See :py:`run_adcman` for a description of the arguments.
+    """
+    data = as_provider(data)
+    orbitals = active_orbital_lists(data, core_orbitals, frozen_core,
+                                    frozen_virtual)
+    return data, pyadcman.ReferenceState(data, *orbitals)
+
+
+def build_parameters(refstate, method, n_singlets=None, n_triplets=None,
+                     n_states=None, n_spin_flip=None, max_subspace=0,
+                     conv_tol=1e-6, max_iter=60, print_level=1,
+                     residual_min_norm=1e-12, n_guess_singles=0,
+                     n_guess_doubles=0, n_guess_h=0, n_guess_p2h=0,
+                     n_ipalpha=None, n_ipbeta=None, ground_state_density=None,
+                     auto_solver=None, skip_tasks=set()):
+    """
+    Build the adcman parameter tree for running `method` on top of the
+    reference state `refstate`. See :py:`run_adcman` for a description
+    of the arguments. `auto_solver` is passed to
+    :py:`AdcCommon.add_solver_params_to`, `skip_tasks` to
+    :py:`tasks.parameters`.
+    """
+    # Parse ADC method into base method and variants
+    if method not in get_valid_methods():
+        raise ValueError("Invalid ADC method: " + method)
+
+    adc_variant = []
+    split = method.split("-")
+    base_method = split[-1]
+    split = split[:-1]
+    if "cvs" in split:
+        adc_variant.append("cvs")  # core-valence-separation
+    # Also supported by adcman, but not adcc:
+    #   adc_variant.append("sos")  # spin-opposite-scaled
+    #   adc_variant.append("ri")   # resolution-of-identity
+
+    # Check consistency of requested states
+    checkargs = dict(n_states=n_states, n_singlets=n_singlets,
+                     n_triplets=n_triplets, n_spin_flip=n_spin_flip,
+                     n_ipalpha=n_ipalpha, n_ipbeta=n_ipbeta)
+    if base_method.startswith("ip"):
+        ret = check_ipadc(refstate, **checkargs)
+        n_ipalpha, n_ipbeta = ret
+    else:
+        ret = check_ppadc(refstate, **checkargs)
+        n_states, n_singlets, n_triplets, n_spin_flip = ret
+        if n_spin_flip > 0:
+            adc_variant.append("sf")  # spin-flip
+
+    if "cvs" in adc_variant and not refstate.has_core_occupied_space:
+        raise ValueError("Cannot request CVS variant if no core "
+                         "orbitals selected.")
+    if refstate.has_core_occupied_space and "cvs" not in adc_variant:
+        raise ValueError("Cannot request core orbitals without CVS variant.")
+
+    # Build adcman parameter tree
+    return tasks.parameters(
+        # General
+        base_method,
+        adc_variant,
+        print_level=print_level,
+        restricted=refstate.restricted,
+        solver="davidson",
+        conv_tol=conv_tol,
+        residual_min_norm=residual_min_norm,
+        max_iter=max_iter,
+        max_subspace=max_subspace,
+        ground_state_density=ground_state_density,
+        # PP-ADC
+        n_states=n_states,
+        n_singlets=n_singlets,
+        n_triplets=n_triplets,
+        n_guess_singles=n_guess_singles,
+        n_guess_doubles=n_guess_doubles,
+        # IP-ADC
+        n_ipalpha=n_ipalpha,
+        n_ipbeta=n_ipbeta,
+        n_guess_h=n_guess_h,
+        n_guess_p2h=n_guess_p2h,
+        auto_solver=auto_solver,
+        skip_tasks=skip_tasks,
+    )
+
+
+def build_incontext(data, refstate):
+    """
+    Build the adcman input context holding the reference state and
+    the operator integrals needed for computing properties.
+    """
+    incontext = refstate.to_ctx()
+
+    # Nuclear dipole moment
+    nucmm = [refstate.nuclear_total_charge] + refstate.nuclear_dipole
+    incontext["ao/nucmm"] = nucmm + 6 * [0.0]
+
+    # Electric dipole integrals
+    integrals_ao = data.operator_integral_provider
+    for i, comp in enumerate(["x", "y", "z"]):
+        dip_bb = as_tensor_bb(
+            refstate.mospaces, integrals_ao.electric_dipole[i], symmetric=True
+        )
+        incontext["ao/d{}_bb".format(comp)] = dip_bb
+    return incontext
+
+
+@contextlib.contextmanager
+def _no_capture():
+    yield
+
+
+#: Prerequisite tasks run in separate adcman runs when profiling, by the
+#: name of the profiling stage. Only tasks, whose results can be injected
+#: into later runs (see :py:`CHECKPOINT_ENTRIES`) and which only depend on
+#: such tasks, can be split off.
+PROFILED_TASKS = [("adcman_mp1", ["mp1"]),
+                  ("adcman_pi", ["pi_oovv", "pia", "pib"])]
+
+
+def run_prerequisites(data, refstate, method, tensors, skip_tasks,
+                      print_level=1, profiler=None, capture=_no_capture):
+    """
+    Run the prerequisite tasks of `method` listed in :py:`PROFILED_TASKS`
+    (apart from those in `skip_tasks`) in separate adcman runs, each timed
+    as a stage of the :py:`Profiler` `profiler`. The computed context
+    entries are added to the dict `tensors` and the names of the tasks to
+    the set `skip_tasks`, such that they are injected into the next runs.
+    """
+    profiler = profiler or Profiler()
+    required = tasks.task_names(method.split("-")[-1])
+    adc_variant = ["cvs"] if "cvs" in method.split("-")[:-1] else []
+    for stage, names in PROFILED_TASKS:
+        names = [name for name in names
+                 if name in required and name not in skip_tasks]
+        if not names:
+            continue
+        with profiler.stage(stage), capture():
+            params = tasks.parameters(names[0], adc_variant,
+                                      print_level=print_level,
+                                      skip_tasks=skip_tasks)
+            for name in names[1:]:
+                params.update(tasks.parameters(name, adc_variant,
+                                               print_level=print_level,
+                                               skip_tasks=skip_tasks))
+            incontext = build_incontext(data, refstate)
+            for ctxkey, tensor in tensors.items():
+                incontext[ctxkey] = tensor
+            ctx = pyadcman.run(incontext, params)
+        for name in names:
+            for ctxkey in task_entries(name, refstate.has_core_occupied_space):
+                tensors[ctxkey] = ctx[ctxkey]
+            skip_tasks.add(name)
+
+
 def run_adcman(
     data,
     method,
@@ -164,14 +381,25 @@ def run_adcman(
     n_ipalpha=None,
     n_ipbeta=None,
     ground_state_density=None,
+    threads=None,
+    max_memory=None,
+    shrink=True,
+    dry_run=False,
+    auto_solver=False,
+    checkpoint=None,
+    cache=None,
+    profile=False,
 ):
     """
     Run adcman to solve an ADC problem.
 
     Parameters
     ----------
-    data : adcc.HdfProvider or h5py.File or str
-        SCF data to run ADC upon
+    data : ArrayProvider or h5py.File or str or pyscf.scf.hf.SCF or dict
+        SCF data to run ADC upon. Converged pyscf calculations are
+        passed to adcman directly (see :py:`PyscfProvider`), mappings of
+        arrays (e.g. a dict or the result of `np.load`) are served
+        from memory (see :py:`ArrayProvider`).
 
     method : str
         ADC method to execute
@@ -181,11 +409,15 @@ def run_adcman(
 
     frozen_core : list
         The orbitals to select as frozen core orbitals (i.e. inactive occupied
-        orbitals for both the MP and ADC methods performed).
+        orbitals for both the MP and ADC methods performed). If some orbitals
+        have already been removed from `data` as frozen orbitals
+        (see :py:`dump_pyscf`), all orbitals are indexed as if
+        they were present and the removed orbitals have to be included.
 
     frozen_virtual : list
         The orbitals to select as frozen virtual orbitals (i.e. inactive
-        virtuals for both the MP and ADC methods performed).
+        virtuals for both the MP and ADC methods performed). Has to include
+        the orbitals removed from `data` as frozen virtuals (if any).
 
     n_singlets : int or NoneType
         Number of singlets to solve for (has to be None for UHF reference)
@@ -251,88 +483,277 @@ def run_adcman(
         Ground state density to use for 3rd order ADC methods. Can be "mp2"
         (the default), "mp3" or "dyson", which implies iterating the MP3 density
         using the dyson expansion method until convergence.
-    """
-    if isinstance(data, str) and data.endswith(".hdf5"):
-        data = HdfProvider(h5py.File(data, "r"))
-    if isinstance(data, h5py.File):
-        data = HdfProvider(data)
-    if not isinstance(data, HdfProvider):
-        raise TypeError("data needs to be an HdfProvider instance")
-    refstate = pyadcman.ReferenceState(data, core_orbitals, frozen_core,
-                                       frozen_virtual)
 
-    # Parse ADC method into base method and variants
+    threads : int or NoneType
+        If not None, set the number of threads used by adcman, pyscf and BLAS
+        (see :py:`set_num_threads`). Otherwise the number of threads
+        is taken from `ADCCTESTDATA_NUM_THREADS` if set, else the current
+        thread settings are used.
+
+    max_memory : float or NoneType
+        Memory budget in MB. If not None, the memory required by adcman is
+        estimated before it is started (see :py:`plan_adcman`) and a
+        :py:`MemoryError` is raised if the estimate exceeds the budget.
+
+    shrink : bool
+        Reduce the Davidson subspace size if required to fit the calculation
+        into the budget `max_memory`, rather than failing right away.
+
+    dry_run : bool
+        Do not run adcman, but only return the estimates of memory
+        and floating-point operations of :py:`plan_adcman`.
+
+    auto_solver : bool
+        Choose the Davidson subspace size, the guesses and the residual
+        threshold automatically for each solver run, based on the memory
+        budget `max_memory` (default: the available memory) and
+        the dimension of the excitation space. The passed `max_subspace` and
+        numbers of guesses are ignored in this case and `residual_min_norm`
+        only bounds the chosen threshold from below. The choices are logged
+        to the logger `adcctestdata.tasks.AdcCommon`.
+
+    checkpoint : CheckpointStore or str or bool or NoneType
+        If set, the MP and pi intermediates are taken from
+        a :py:`CheckpointStore` (or the store in the passed directory or in
+        the default directory for `True`) if they have been computed for the
+        same SCF data file and orbital subspaces before. Intermediates
+        computed in this run are added to the store.
+
+    cache : ResultCache or str or bool or NoneType
+        If set, the results are looked up in a :py:`ResultCache` (or the
+        cache in the passed directory or in the default directory for `True`)
+        before running adcman and stored there afterwards. Cached results
+        are returned as a :py:`CachedContext`, which only holds the energies,
+        vectors, densities and properties of the ground and excited states.
+
+    profile : bool or Profiler
+        If set, the tuple of the context and a profiling report is returned.
+        The report holds the wall and CPU time as well as the peak memory of
+        the stages of the calculation and the output of adcman
+        (see :py:`Profiler.report`). A :py:`Profiler` may be passed
+        to collect the stages together with stages timed by the caller.
+        The import of the SCF data (including the electron-repulsion
+        integrals) is timed as the stage `reference_state`. To time them
+        separately, the MP1 amplitudes and the pi intermediates are
+        computed in separate adcman runs (stages `adcman_mp1` and
+        `adcman_pi`, see :py:`PROFILED_TASKS`) and injected into the
+        final run (stage `adcman`). The final run holds the remaining
+        tasks, i.e. MP2 and MP3, the Davidson solver and the ISR properties,
+        which adcman runs as one task per method and which therefore
+        cannot be timed separately.
+    """
+    profiler = profile if isinstance(profile, Profiler) else Profiler()
+    capture = profiler.capture_output if profile else _no_capture
+
+    def finish(ctx):
+        if not profile:
+            return ctx
+        report = profiler.report()
+        if getattr(data, "trace", None):
+            report["data_access"] = data.trace.summary()
+        return ctx, report
+
+    apply_num_threads(threads)
     if method not in get_valid_methods():
         raise ValueError("Invalid ADC method: " + method)
+    with profiler.stage("setup"):
+        data = as_provider(data)
+        orbitals = active_orbital_lists(data, core_orbitals, frozen_core,
+                                        frozen_virtual)
+    # Arguments determining the adcman parameter tree
+    # (apart from the reference state)
+    parameters = dict(
+        n_singlets=n_singlets, n_triplets=n_triplets, n_states=n_states,
+        n_spin_flip=n_spin_flip, max_subspace=max_subspace, conv_tol=conv_tol,
+        max_iter=max_iter, residual_min_norm=residual_min_norm,
+        n_guess_singles=n_guess_singles, n_guess_doubles=n_guess_doubles,
+        n_guess_h=n_guess_h, n_guess_p2h=n_guess_p2h, n_ipalpha=n_ipalpha,
+        n_ipbeta=n_ipbeta, ground_state_density=ground_state_density,
+        auto_solver=None,
+    )
+    # Results are cached by the arguments as passed, since the adjustments
+    # to the memory budget below only affect the solver, not the results,
+    # and depend on the memory available at the time of the call.
+    cache_parameters = dict(parameters)
+
+    if max_memory is not None or dry_run or auto_solver:
+        if auto_solver and max_memory is None:
+            max_memory = available_memory()
+        with profiler.stage("plan"):
+            plan = plan_adcman(
+                data, method, *orbitals, max_subspace=max_subspace,
+                n_singlets=n_singlets, n_triplets=n_triplets,
+                n_states=n_states, n_spin_flip=n_spin_flip,
+                n_ipalpha=n_ipalpha, n_ipbeta=n_ipbeta, max_memory=max_memory,
+                shrink=shrink
+            )
+        if dry_run:
+            return plan
+        parameters["max_subspace"] = plan["max_subspace"]
+        if auto_solver:
+            # What is left of the budget for the subspace of a single run
+            memory = max_memory * 1e6 - plan["memory"] + plan["subspace_memory"]
+            parameters["auto_solver"] = dict(
+                memory=memory, n_singles=plan["vector"]["singles"],
+                n_doubles=plan["vector"]["doubles"]
+            )
 
-    adc_variant = []
-    split = method.split("-")
-    base_method = split[-1]
-    split = split[:-1]
-    if "cvs" in split:
-        adc_variant.append("cvs")  # core-valence-separation
-    # Also supported by adcman, but not adcc:
-    #   adc_variant.append("sos")  # spin-opposite-scaled
-    #   adc_variant.append("ri")   # resolution-of-identity
+    results = None
+    if cache:
+        results = cache
+        if not isinstance(cache, ResultCache):
+            results = ResultCache(None if cache is True else cache)
+        with profiler.stage("cache_lookup"):
+            result_key = results.key(data, method, orbitals,
+                                     cache_parameters)
+            ctx = results.get(result_key)
+        if ctx is not None:
+            return finish(ctx)
+
+    with profiler.stage("reference_state"), capture():
+        refstate = pyadcman.ReferenceState(data, *orbitals)
+    store = None
+    tensors, skip_tasks = {}, set()
+    if checkpoint:
+        store = checkpoint
+        if not isinstance(checkpoint, CheckpointStore):
+            store = CheckpointStore(None if checkpoint is True else checkpoint)
+        with profiler.stage("checkpoint_load"):
+            key = store.key(data, *orbitals)
+            tensors, skip_tasks = store.load(key, refstate)
+    loaded_tasks = set(skip_tasks)
+    if profile:
+        run_prerequisites(data, refstate, method, tensors, skip_tasks,
+                          print_level=print_level, profiler=profiler,
+                          capture=capture)
+
+    with profiler.stage("input_context"):
+        params = build_parameters(refstate, method, print_level=print_level,
+                                  skip_tasks=skip_tasks, **parameters)
+        incontext = build_incontext(data, refstate)
+        for ctxkey, tensor in tensors.items():
+            incontext[ctxkey] = tensor
+    with profiler.stage("adcman"), capture():
+        ctx = pyadcman.run(incontext, params)
+    for ctxkey, tensor in tensors.items():
+        if ctxkey not in ctx:
+            ctx[ctxkey] = tensor  # Injected entries belong to the results
+
+    if store is not None:
+        with profiler.stage("checkpoint_save"):
+            computed = tasks.task_names(method.split("-")[-1]) - loaded_tasks
+            store.save(key, refstate, ctx, computed & CHECKPOINT_ENTRIES.keys())
+    if results is not None:
+        with profiler.stage("cache_store"):
+            results.put(result_key, ctx, method)
+    return finish(ctx)
+
+
+# Arguments of run_adcman, which run_adcman_batch does not support
+BATCH_UNSUPPORTED = ["max_memory", "shrink", "dry_run", "auto_solver",
+                     "checkpoint", "cache", "profile", "skip_tasks"]
+
+
+def run_adcman_batch(data, methods, core_orbitals=[], frozen_core=[],
+                     frozen_virtual=[], print_level=1, threads=None,
+                     **kwargs):
+    """
+    Run adcman for several ADC methods on the same SCF data. The reference
+    state is built once and a single adcman run is performed, such that
+    the integral import and the MP and intermediate stages shared between
+    the methods are computed only once. All other kwargs are used for
+    each method and can be any of the arguments of :py:`run_adcman`
+    selecting the states and the solver (e.g. `n_singlets`, `conv_tol`,
+    `max_subspace` or `ground_state_density`). The options controlling
+    a single run (`max_memory`, `shrink`, `dry_run`, `auto_solver`,
+    `checkpoint`, `cache` and `profile`) are not supported.
 
-    # Check consistency of requested states
-    checkargs = dict(n_states=n_states, n_singlets=n_singlets,
-                     n_triplets=n_triplets, n_spin_flip=n_spin_flip,
-                     n_ipalpha=n_ipalpha, n_ipbeta=n_ipbeta)
-    if base_method.startswith("ip"):
-        ret = check_ipadc(refstate, **checkargs)
-        n_ipalpha, n_ipbeta = ret
-    else:
-        ret = check_ppadc(refstate, **checkargs)
-        n_states, n_singlets, n_triplets, n_spin_flip = ret
-        if n_spin_flip > 0:
-            adc_variant.append("sf")  # spin-flip
+    Parameters
+    ----------
+    data : ArrayProvider or h5py.File or str or pyscf.scf.hf.SCF or dict
+        SCF data to run ADC upon (see :py:`run_adcman`)
 
-    if "cvs" in adc_variant and not refstate.has_core_occupied_space:
-        raise ValueError("Cannot request CVS variant if no core "
-                         "orbitals selected.")
-    if refstate.has_core_occupied_space and "cvs" not in adc_variant:
-        raise ValueError("Cannot request core orbitals without CVS variant.")
+    methods : list
+        The methods to run. Each entry is either a method string or a dict
+        holding the method string under the key "method" alongside
+        method-specific keyword arguments for :py:`run_adcman` (e.g. the
+        number of states to compute), which take precedence over `kwargs`.
 
-    # Build adcman parameter tree
-    params = tasks.parameters(
-        # General
-        base_method,
-        adc_variant,
-        print_level=print_level,
-        restricted=refstate.restricted,
-        solver="davidson",
-        conv_tol=conv_tol,
-        residual_min_norm=residual_min_norm,
-        max_iter=max_iter,
-        max_subspace=max_subspace,
-        ground_state_density=ground_state_density,
-        # PP-ADC
-        n_states=n_states,
-        n_singlets=n_singlets,
-        n_triplets=n_triplets,
-        n_guess_singles=n_guess_singles,
-        n_guess_doubles=n_guess_doubles,
-        # IP-ADC
-        n_ipalpha=n_ipalpha,
-        n_ipbeta=n_ipbeta,
-        n_guess_h=n_guess_h,
-        n_guess_p2h=n_guess_p2h,
-    )
+    core_orbitals : list
+        The orbitals to be put into the core-occupied space
+        (shared by all methods).
 
-    # Build adcman context tree
-    incontext = refstate.to_ctx()
+    frozen_core : list
+        The orbitals to select as frozen core orbitals (shared by all methods).
 
-    # Nuclear dipole moment
-    nucmm = [refstate.nuclear_total_charge] + refstate.nuclear_dipole
-    incontext["ao/nucmm"] = nucmm + 6 * [0.0]
+    frozen_virtual : list
+        The orbitals to select as frozen virtual orbitals
+        (shared by all methods).
 
-    # Electric dipole integrals
-    integrals_ao = data.operator_integral_provider
-    for i, comp in enumerate(["x", "y", "z"]):
-        dip_bb = as_tensor_bb(
-            refstate.mospaces, integrals_ao.electric_dipole[i], symmetric=True
-        )
-        incontext["ao/d{}_bb".format(comp)] = dip_bb
+    print_level : int
+        ADCman print level (shared by all methods)
+
+    threads : int or NoneType
+        If not None, set the number of threads used by adcman, pyscf and BLAS
+        (see :py:`set_num_threads`). Otherwise the number of threads
+        is taken from `ADCCTESTDATA_NUM_THREADS` if set, else the current
+        thread settings are used.
+
+    Returns
+    -------
+    list
+        One adcman context per entry of `methods`. Since all methods are run
+        in the same adcman run, the contexts refer to the same object, but
+        the results of each method are found in its own subtree.
+    """
+    specs = []
+    for spec in methods:
+        if isinstance(spec, str):
+            spec = {"method": spec}
+        spec = dict(spec)
+        if "method" not in spec:
+            raise ValueError("Method specification lacks the key 'method'.")
+        for key in ["print_level", "threads"]:
+            if key in spec:
+                raise ValueError(key + " can only be set for the whole batch.")
+        specs.append(spec)
+    for spec in [kwargs] + specs:
+        for key in BATCH_UNSUPPORTED:
+            if key in spec:
+                raise ValueError(key + " is not supported by run_adcman_batch.")
+
+    names = [spec["method"] for spec in specs]
+    for name in set(names):
+        if names.count(name) > 1:
+            raise ValueError("Method " + name + " requested more than once.")
+
+    # Settings which enter the parameters of shared prerequisites
+    # (the iterated ground state density) need to agree between methods
+    densities = set()
+    for spec in specs:
+        args = dict(kwargs, **spec)
+        density = args.get("ground_state_density", None)
+        if density not in [None, "mp2"]:
+            densities.add((density, args.get("conv_tol", 1e-6)))
+    if len(densities) > 1:
+        raise ValueError("Methods in a batch need to agree on "
+                         "ground_state_density and conv_tol.")
+
+    apply_num_threads(threads)
+    data, refstate = setup_reference_state(data, core_orbitals, frozen_core,
+                                           frozen_virtual)
+    params = None
+    for spec in specs:
+        args = dict(kwargs, **spec)
+        method = args.pop("method")
+        method_params = build_parameters(refstate, method,
+                                         print_level=print_level, **args)
+        if params is None:
+            params = method_params
+        else:
+            params.update(method_params)
+    if params is None:
+        raise ValueError("No methods to run.")
 
-    return pyadcman.run(incontext, params)
+    ctx = pyadcman.run(build_incontext(data, refstate), params)
+    return [ctx for _ in specs]
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2019 by Michael F. Herbst
+##
+## This file is part of adcc-testdata.
+##
+## adcc-testdata is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc-testdata is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc-testdata. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import multiprocessing
+
+import h5py
+
+from .run_adcman import get_valid_methods
+from .threads import available_cores, set_num_threads
+
+# Exponent of the scaling of the ADC methods with the number of orbitals
+COST_EXPONENTS = {"adc0": 4, "adc1": 4, "adc2": 5, "adc2x": 6, "adc3": 6,
+                  "ipadc0": 4, "ipadc2": 5, "ipadc3": 6}
+
+
+def estimate_cost(scf_file, method, kwargs={}):
+    """
+    Rough estimate of the cost of running `method` on the SCF data stored
+    in the HDF5 file `scf_file` with the :py:`run_adcman` arguments `kwargs`.
+    Only the relative size of the estimates for different jobs is meaningful.
+    """
+    if method not in get_valid_methods():
+        raise ValueError("Invalid ADC method: " + method)
+    with h5py.File(scf_file, "r") as data:
+        n_orbs = int(data["n_orbs_alpha"][()])
+        removed = set()  # Frozen orbitals already removed from the data
+        for key in ["frozen_orbitals/core", "frozen_orbitals/virtual"]:
+            if key in data:
+                removed.update(int(p) for p in data[key][()])
+    frozen = set(kwargs.get("frozen_core", [])) \
+        | set(kwargs.get("frozen_virtual", []))
+    n_orbs -= len(frozen - removed) // 2
+
+    n_states = 0
+    for key in ["n_singlets", "n_triplets", "n_states", "n_spin_flip",
+                "n_ipalpha", "n_ipbeta"]:
+        n_states += kwargs.get(key, None) or 0
+
+    base_method = method.split("-")[-1]
+    cost = float(max(1, n_orbs)) ** COST_EXPONENTS[base_method]
+    cost *= max(1, n_states)
+    if kwargs.get("ground_state_density", None) == "dyson":
+        cost *= 2  # Iterated ground state density
+    return cost
+
+
+def init_worker(n_threads):
+    set_num_threads(n_threads)
+
+
+def run_job(scf_file, method, dumpfile, kwargs):
+    from .dump_reference import dump_reference
+
+    dump_reference(scf_file, method, dumpfile, **kwargs).close()
+    return dumpfile
+
+
+def run_sweep(jobs, n_workers=None, n_threads=None):
+    """
+    Run many reference calculations in parallel, each equivalent
+    to a call of :py:`dump_reference`. The jobs are distributed over a pool
+    of worker processes, each running adcman with its own slice of the
+    cores of the machine. The jobs are started in order of decreasing
+    estimated cost (see :py:`estimate_cost`), such that long-running jobs
+    do not end up being started last.
+
+    Since the workers are started as fresh processes, scripts calling this
+    function need to guard their main code by `if __name__ == "__main__"`.
+
+    Parameters
+    ----------
+    jobs : list
+        The jobs to run as tuples `(scf_file, method, dumpfile, kwargs)`,
+        where `scf_file` is an HDF5 file with SCF data (e.g. written by
+        :py:`dump_pyscf`) and the remaining entries are passed
+        to :py:`dump_reference`. `kwargs` may be omitted.
+
+    n_workers : int or NoneType
+        Number of worker processes (default: one worker per four of the
+        :py:`available_cores`, but no more workers than jobs)
+
+    n_threads : int or NoneType
+        Number of threads used by adcman in each worker
+        (default: the cores divided evenly between the workers)
+
+    Returns
+    -------
+    list
+        The names of the written dump files in the order of `jobs`.
+        If jobs fail, the exception of the first failed job is raised
+        once all jobs have finished.
+    """
+    jobs = [tuple(job) + ({}, ) if len(job) == 3 else tuple(job)
+            for job in jobs]
+    if not jobs:
+        return []
+    for job in jobs:
+        if len(job) != 4:
+            raise ValueError("Jobs need to be given as tuples "
+                             "(scf_file, method, dumpfile, kwargs).")
+        if not isinstance(job[0], str) or not isinstance(job[2], str):
+            raise TypeError("scf_file and dumpfile of jobs need to be "
+                            "file names.")
+
+    n_cores = available_cores()
+    if n_workers is None:
+        n_workers = max(1, n_cores // 4)
+        if n_threads is not None:
+            n_workers = max(1, n_cores // n_threads)
+    n_workers = min(n_workers, len(jobs))
+    if n_threads is None:
+        n_threads = max(1, n_cores // n_workers)
+
+    # Longest jobs first: Jobs are picked up in the order of submission.
+    costs = [estimate_cost(job[0], job[1], job[3]) for job in jobs]
+    order = sorted(range(len(jobs)), key=lambda i: costs[i], reverse=True)
+
+    # Start workers from scratch rather than forking a process,
+    # which already carries adcman's thread pool.
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(n_workers, initializer=init_worker,
+                      initargs=(n_threads, )) as pool:
+        results = {i: pool.apply_async(run_job, jobs[i]) for i in order}
+        for result in results.values():
+            result.wait()
+        return [results[i].get() for i in range(len(jobs))]
@@ -20,6 +20,11 @@
 ## along with adcc-testdata. If not, see <http://www.gnu.org/licenses/>.
 ##
 ## ---------------------------------------------------------------------
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
 
 
 class AdcCommon:
@@ -105,10 +110,39 @@ class AdcCommon:
         # Setup solver-related parameters inside the subtree
         cls.add_solver_params_to(tirrep, n_states, **kwargs)
 
+    @classmethod
+    def choose_solver_params(cls, n_states, memory, n_singles, n_doubles,
+                             conv_tol=1e-6, residual_min_norm=1e-12):
+        """
+        Choose the parameters of a davidson solver run computing `n_states`
+        states, such that the subspace fits into `memory` bytes. `n_singles`
+        and `n_doubles` are the dimensions of the singles and doubles
+        part of the excitation vectors. Returns the tuple
+        `(max_subspace, n_guess_singles, n_guess_doubles, residual_min_norm)`.
+        """
+        n_vector = n_singles + n_doubles
+
+        # Room for a few times the states to keep restarts rare,
+        # but no more than fits into memory (vectors and matrix products)
+        fitting = int(memory // (2 * 8 * n_vector))
+        max_subspace = min(max(8 * n_states, n_states + 20), fitting)
+        max_subspace = int(min(max(max_subspace, 2 * n_states), n_vector))
+
+        # Two guesses per state, taken from the singles as far as possible
+        n_guesses = min(max(2 * n_states, 4), max_subspace)
+        n_guess_singles = int(min(n_guesses, n_singles))
+        n_guess_doubles = int(min(n_guesses - n_guess_singles, n_doubles))
+
+        # Residuals below the rounding noise of the vectors do not carry
+        # information, residuals near conv_tol are still needed
+        threshold = 10 * np.finfo(float).eps * np.sqrt(n_vector)
+        threshold = min(max(residual_min_norm, threshold), conv_tol / 10)
+        return max_subspace, n_guess_singles, n_guess_doubles, threshold
+
     @classmethod
     def add_solver_params_to(cls, tirrep, n_states, solver="davidson",
                              conv_tol=1e-6, residual_min_norm=1e-12, max_iter=0,
-                             max_subspace=60, **kwargs):
+                             max_subspace=60, auto_solver=None, **kwargs):
         """
         Add parameters for one particular davidson solver run to the
         (irrep-specific) parameter tree. `n_states` is the number of states to
@@ -117,6 +151,10 @@ class AdcCommon:
           - solver
           - davidson
           - ...
+
+        If `auto_solver` is a dict with the keys `memory`, `n_singles`
+        and `n_doubles`, the subspace size, the guesses and the residual
+        threshold are chosen by :py:`choose_solver_params` instead.
         """
         # Setup guesses
         if cls.adcclass == "pp":
@@ -128,6 +166,19 @@ class AdcCommon:
         else:
             raise NotImplementedError(f"adcclass {cls.adcclass} not implemented.")
 
+        if auto_solver is not None:
+            choice = cls.choose_solver_params(
+                n_states, conv_tol=conv_tol, residual_min_norm=residual_min_norm,
+                **auto_solver
+            )
+            max_subspace, n_guess_s, n_guess_d, residual_min_norm = choice
+            kwargs[guessmap["s"][1]] = n_guess_s
+            kwargs[guessmap["d"][1]] = n_guess_d
+            logger.info("Davidson for %d states of %s: max_subspace=%d, "
+                        "%s=%d, %s=%d, threshold=%.3g", n_states, cls.name,
+                        max_subspace, guessmap["s"][1], n_guess_s,
+                        guessmap["d"][1], n_guess_d, residual_min_norm)
+
         tirrep[guessmap["s"][0]] = str(kwargs[guessmap["s"][1]])
         tirrep[guessmap["d"][0]] = str(kwargs[guessmap["d"][1]])
         sum_guesses = kwargs[guessmap["s"][1]] + kwargs[guessmap["d"][1]]
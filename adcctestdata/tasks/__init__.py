@@ -21,7 +21,9 @@
 ##
 ## ---------------------------------------------------------------------
 
-__all__ = ["parameters"]
+from pyadcman import CtxMap
+
+__all__ = ["parameters", "task_names"]
 
 
 def resolve_method(method):
@@ -37,24 +39,44 @@ def resolve_method(method):
     raise ValueError("Unknown method string: {}".format(method))
 
 
-def collect_task_parameters(task, **kwargs):
+def collect_task_parameters(task, skip_tasks=set(), **kwargs):
     """
     Collect the parameters required to run the task and recursively
-    the parameters for all of the tasks' dependencies.
+    the parameters for all of the tasks' dependencies. The tasks named
+    in `skip_tasks` are not run (but their dependencies are).
     """
-    ret = task.parameters(**kwargs)
+    if task.name in skip_tasks:
+        ret = CtxMap()
+    else:
+        ret = task.parameters(**kwargs)
     for dep in task.dependencies:
-        ret.update(collect_task_parameters(dep, **kwargs))
+        ret.update(collect_task_parameters(dep, skip_tasks, **kwargs))
     return ret
 
 
-def parameters(basemethod, adc_variant, print_level=0, **kwargs):
+def task_names(basemethod):
+    """
+    Return the names of the tasks run for the passed method,
+    i.e. the task itself and all its dependencies.
+    """
+    def collect(task):
+        names = {task.name}
+        for dep in task.dependencies:
+            names |= collect(dep)
+        return names
+    return collect(resolve_method(basemethod))
+
+
+def parameters(basemethod, adc_variant, print_level=0, skip_tasks=set(),
+               **kwargs):
     """
     Return the parameter tree required for running the passed
     method under the passed parameters. Method should be a string.
+    The tasks named in `skip_tasks` are not run, e.g. because their
+    results are already provided in the input context.
     """
     task = resolve_method(basemethod)
-    params = collect_task_parameters(task, adc_variant=adc_variant,
+    params = collect_task_parameters(task, skip_tasks, adc_variant=adc_variant,
                                      print_level=print_level, **kwargs)
 
     params["print_level"] = str(print_level)
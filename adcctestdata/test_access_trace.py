@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2019 by Michael F. Herbst
+##
+## This file is part of adcc-testdata.
+##
+## adcc-testdata is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc-testdata is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc-testdata. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import io
+import csv
+import json
+import tempfile
+import unittest
+import numpy as np
+
+import h5py
+
+from adcctestdata import AccessTrace, HdfProvider
+
+
+def write_data(filename):
+    """Write a minimal restricted SCF data file with 2 spatial orbitals"""
+    with h5py.File(filename, "w") as h5f:
+        h5f["restricted"] = True
+        h5f["conv_tol"] = 1e-10
+        h5f["orbcoeff_fb"] = np.eye(4, 2)
+        h5f["occupation_f"] = np.array([1.0, 0, 1, 0])
+        h5f["orben_f"] = np.array([-1.0, 1, -1, 1])
+        h5f["fock_ff"] = np.diag([-1.0, 1, -1, 1])
+        h5f.create_dataset("eri_ffff", data=np.ones((4, 4, 4, 4)),
+                           compression="gzip", chunks=(2, 2, 2, 2))
+
+
+class TestAccessTrace(unittest.TestCase):
+    def setUp(self):
+        self.trace = AccessTrace()
+        self.trace.record("fill_orben_f", "orben_f", nbytes=32, time=0.5,
+                          time_h5py=0.25)
+        self.trace.record("fill_eri_ffff", "eri_ffff",
+                          (slice(0, 2, None), slice(None)), 128, 1.0, 0.5, 0.25)
+        self.trace.record("fill_eri_ffff", "eri_ffff", nbytes=128, time=2.0)
+
+    def test_summary(self):
+        summary = self.trace.summary()
+        self.assertEqual(summary["orben_f"], {
+            "calls": 1, "nbytes": 32, "time": 0.5, "time_h5py": 0.25,
+            "time_decompress": 0.0
+        })
+        self.assertEqual(summary["eri_ffff"], {
+            "calls": 2, "nbytes": 256, "time": 3.0, "time_h5py": 0.5,
+            "time_decompress": 0.25
+        })
+
+    def test_json(self):
+        fp = io.StringIO()
+        self.trace.to_json(fp)
+        dump = json.loads(fp.getvalue())
+        self.assertEqual(dump["summary"], self.trace.summary())
+        self.assertEqual(dump["records"][1]["slices"],
+                         [[0, 2, None], [None, None, None]])
+
+        fp.seek(0)
+        trace = AccessTrace.from_json(fp)
+        self.assertEqual(trace.records, self.trace.records)
+
+    def test_csv(self):
+        fp = io.StringIO()
+        self.trace.to_csv(fp)
+        fp.seek(0)
+        rows = list(csv.DictReader(fp))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(list(rows[0].keys()), AccessTrace.fields)
+        self.assertEqual(rows[0]["slices"], "")
+        self.assertEqual(json.loads(rows[1]["slices"]),
+                         [[0, 2, None], [None, None, None]])
+        self.assertEqual(int(rows[2]["nbytes"]), 128)
+
+    def test_provider_trace(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            write_data(tmpdir + "/data.hdf5")
+            provider = HdfProvider(tmpdir + "/data.hdf5", trace=True)
+            trace = provider.trace
+            trace.records.clear()  # Requests made during setup
+
+            out = np.empty(4)
+            provider.fill_orben_f(out)
+            slices = (slice(0, 2), slice(0, 4), slice(2, 4), slice(0, 1))
+            out = np.empty((2, 4, 2, 1))
+            provider.fill_eri_ffff(slices, out)
+
+            self.assertEqual([rec["function"] for rec in trace.records],
+                             ["fill_orben_f", "fill_eri_ffff"])
+            rec = trace.records[1]
+            self.assertEqual(rec["key"], "eri_ffff")
+            self.assertEqual(rec["slices"], [[0, 2, None], [0, 4, None],
+                                             [2, 4, None], [0, 1, None]])
+            self.assertEqual(rec["nbytes"], out.nbytes)
+            self.assertGreater(rec["time_h5py"], 0)
+            self.assertGreater(rec["time_decompress"], 0)
+
+            # Estimating the decompression time is not part of the time
+            # spent in the function
+            self.assertGreater(trace.time_overhead, 0)
+            self.assertEqual(trace.time_decompress, rec["time_decompress"])
+            self.assertLessEqual(rec["time_h5py"], rec["time"])
+
+            summary = trace.summary()
+            self.assertEqual(summary["eri_ffff"]["calls"], 1)
+            self.assertEqual(summary["orben_f"]["nbytes"], 32)
@@ -20,7 +20,6 @@
 ## along with adcc-testdata. If not, see <http://www.gnu.org/licenses/>.
 ##
 ## ---------------------------------------------------------------------
-import os
 import tempfile
 import unittest
 import numpy as np
@@ -35,11 +34,10 @@ def assert_allclose(x, y):
 
 
 class TestCn(unittest.TestCase):
-    def run_scf(self):
-        fn = "cn_sto3g.hdf5"
-        if os.path.isfile(fn):
-            return fn
+    def run_scf(self, eri_layout="dense"):
+        return atd.cached_dump_pyscf(self.make_scf(), eri_layout=eri_layout)
 
+    def make_scf(self):
         mol = gto.M(
             atom="""
             C 0 0 0
@@ -55,8 +53,7 @@ class TestCn(unittest.TestCase):
         mf.diis = scf.EDIIS()
         mf.diis_space = 5
         mf.max_cycle = 500
-        mf.kernel()
-        return atd.dump_pyscf(mf, fn)
+        return mf
 
     def test_cn_adc2(self):
         fn = self.run_scf()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2019 by Michael F. Herbst
+##
+## This file is part of adcc-testdata.
+##
+## adcc-testdata is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc-testdata is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc-testdata. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import tempfile
+import unittest
+import numpy as np
+
+from pyscf import ao2mo, df, gto, scf
+from numpy.testing import assert_allclose
+
+import adcctestdata as atd
+from adcctestdata.run_sweep import estimate_cost
+from adcctestdata.run_adcman import active_orbital_lists
+from adcctestdata.EriBackends import PackedSpinBlockEri, pair_index
+
+
+def make_water():
+    mol = gto.M(
+        atom="""
+        O 0 0 0
+        H 0 0 1.795239827225189
+        H 1.693194615993441 0 -0.599043184453037
+        """,
+        basis='sto-3g',
+        unit="Bohr"
+    )
+    mf = scf.RHF(mol)
+    mf.conv_tol = 1e-11
+    mf.conv_tol_grad = 1e-10
+    mf.kernel()
+    return mf
+
+
+def make_cn():
+    mol = gto.M(
+        atom="""
+        C 0 0 0
+        N 0 0 2.2143810738114829
+        """,
+        spin=1,
+        basis='sto-3g',
+        unit="Bohr",
+    )
+    mf = scf.UHF(mol)
+    mf.conv_tol = 1e-11
+    mf.conv_tol_grad = 1e-10
+    mf.diis = scf.EDIIS()
+    mf.diis_space = 5
+    mf.max_cycle = 500
+    mf.kernel()
+    return mf
+
+
+def fill_eri(data, slices=None):
+    """Assemble the requested slices of eri_ffff through an HdfProvider"""
+    provider = atd.HdfProvider(data)
+    nf = 2 * provider.get_n_orbs_alpha()
+    if slices is None:
+        slices = (slice(None), ) * 4
+    shape = tuple(len(range(*sl.indices(nf))) for sl in slices)
+    out = np.empty(shape)
+    provider.fill_eri_ffff(slices, out)
+    return out
+
+
+def reference_eri(data, eri_ao):
+    """
+    Transform the AO integrals `eri_ao` (or those of the passed molecule)
+    with all spin-orbital coefficients at once and zero the blocks
+    forbidden by spin symmetry
+    """
+    cf_bf = data["orbcoeff_fb"][()].transpose()
+    nf = cf_bf.shape[1]
+    eri = ao2mo.general(eri_ao, (cf_bf, cf_bf, cf_bf, cf_bf),
+                        compact=False).reshape(nf, nf, nf, nf)
+    spin = np.arange(nf) >= nf // 2
+    allowed = spin[:, None] == spin[None, :]
+    return eri * allowed[:, :, None, None] * allowed[None, None, :, :]
+
+
+class RecordingArray:
+    """Array wrapper recording the number of elements of each read"""
+    def __init__(self, array):
+        self.array = array
+        self.shape = array.shape
+        self.reads = []
+
+    def __getitem__(self, key):
+        ret = self.array[key]
+        self.reads.append(ret.size)
+        return ret
+
+
+class TestDumpPyscf(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.scfres = {"water": make_water(), "cn": make_cn()}
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def dump(self, system, name, **kwargs):
+        return atd.dump_pyscf(self.scfres[system],
+                              self.tmpdir.name + "/" + name + ".hdf5", **kwargs)
+
+    def assert_layout_matches_dense(self, system, eri_layout, atol=1e-12,
+                                    **kwargs):
+        dense = self.dump(system, system + "_dense")
+        other = self.dump(system, system + "_" + eri_layout,
+                          eri_layout=eri_layout, **kwargs)
+        ref = dense["eri_ffff"][()]
+        assert_allclose(fill_eri(other), ref, atol=atol)
+
+        # Slices crossing the boundary between alpha and beta orbitals
+        nf = ref.shape[0]
+        slices = (slice(1, nf - 2), slice(0, nf // 2 + 1),
+                  slice(nf // 2 - 1, nf), slice(2, nf, 2))
+        assert_allclose(fill_eri(other, slices), ref[slices], atol=atol)
+
+    def test_spin_blocks(self):
+        self.assert_layout_matches_dense("water", "spin_blocks")
+        self.assert_layout_matches_dense("cn", "spin_blocks")
+
+    def test_out_of_core(self):
+        for system in ["water", "cn"]:
+            dense = self.dump(system, system + "_dense")
+            ooc = self.dump(system, system + "_ooc", max_memory=1e-3)
+            assert_allclose(ooc["eri_ffff"][()], dense["eri_ffff"][()],
+                            atol=1e-12)
+
+    def test_restricted(self):
+        data = self.dump("water", "water")
+        assert_allclose(data["eri_ffff"][()],
+                        reference_eri(data, self.scfres["water"].mol), atol=1e-12)
+
+    def test_unrestricted(self):
+        data = self.dump("cn", "cn")
+        assert_allclose(data["eri_ffff"][()],
+                        reference_eri(data, self.scfres["cn"].mol), atol=1e-12)
+
+    def test_packed(self):
+        self.assert_layout_matches_dense("water", "packed")
+        self.assert_layout_matches_dense("cn", "packed")
+
+    def test_packed_reads_required_elements(self):
+        data = self.dump("cn", "cn", eri_layout="packed")
+        n = data["n_orbs_alpha"][()]
+        backend = PackedSpinBlockEri(data["eri_blocks"], n)
+        backend.blocks = blocks = {
+            key: RecordingArray(data["eri_blocks/" + key][()])
+            for key in ["aaaa", "aabb"]
+        }
+        backend.max_gap = 0
+
+        # The orbital pairs of the two index pairs are distinct
+        slices = (slice(0, 3), slice(4, n), slice(3, 4), slice(5, n))
+        backend.read_stored("aaaa", slices)
+        self.assertEqual(sum(blocks["aaaa"].reads), 3 * (n - 4) * (n - 5))
+
+        # Full rows over the range of rs pairs, but only the required rows
+        backend.read_stored("aabb", slices)
+        rs = pair_index(np.arange(5, n), 3)
+        self.assertEqual(sum(blocks["aabb"].reads),
+                         3 * (n - 4) * (np.max(rs) - np.min(rs) + 1))
+
+    def test_density_fitting(self):
+        for system in ["water", "cn"]:
+            data = self.dump(system, system, eri_layout="df",
+                             auxbasis="weigend")
+            eri_ao = df.DF(self.scfres[system].mol, auxbasis="weigend").get_eri()
+            assert_allclose(fill_eri(data), reference_eri(data, eri_ao),
+                            atol=1e-12)
+
+    def test_cholesky(self):
+        self.assert_layout_matches_dense("water", "cholesky", atol=1e-6)
+        self.assert_layout_matches_dense("cn", "cholesky", atol=1e-6)
+
+    def test_ao(self):
+        self.assert_layout_matches_dense("water", "ao")
+        self.assert_layout_matches_dense("cn", "ao")
+
+    def test_frozen_truncation(self):
+        dense = self.dump("water", "dense")
+        data = self.dump("water", "truncated", frozen_core=[0, 7])
+        self.assertEqual(data["n_orbs_alpha"][()], 6)
+        self.assertEqual(list(data["frozen_orbitals/core"][()]), [0, 7])
+
+        active = [p for p in range(14) if p not in [0, 7]]
+        assert_allclose(data["orben_f"][()], dense["orben_f"][()][active],
+                        atol=1e-12)
+        assert_allclose(data["eri_ffff"][()],
+                        dense["eri_ffff"][()][np.ix_(active, active,
+                                                     active, active)],
+                        atol=1e-12)
+
+        # The removed orbitals have to be passed as frozen orbitals
+        provider = atd.HdfProvider(data)
+        self.assertEqual(active_orbital_lists(provider, [1, 8], [0, 7]),
+                         ([0, 6], [], []))
+        with self.assertRaises(ValueError):
+            active_orbital_lists(provider, [1, 8], [0])
+        with self.assertRaises(ValueError):
+            active_orbital_lists(provider, [0, 7], [0, 7])
+
+        # Removed orbitals are not subtracted twice from the cost estimate
+        kwargs = {"frozen_core": [0, 7]}
+        self.assertEqual(estimate_cost(data.filename, "adc2", kwargs),
+                         estimate_cost(dense.filename, "adc2", kwargs))
+
+    def test_cached_dump(self):
+        cache_dir = self.tmpdir.name + "/cache"
+        cached = atd.cached_dump_pyscf(self.scfres["water"], cache_dir=cache_dir)
+        self.assertTrue(cached.startswith(cache_dir))
+        self.assertEqual(atd.cached_dump_pyscf(self.scfres["water"],
+                                               cache_dir=cache_dir), cached)
+
+        # Named copy of the cached file
+        out = self.tmpdir.name + "/water.hdf5"
+        self.assertEqual(atd.cached_dump_pyscf(self.scfres["water"], out=out,
+                                               cache_dir=cache_dir), out)
+        with open(cached, "rb") as fc, open(out, "rb") as fo:
+            self.assertEqual(fc.read(), fo.read())
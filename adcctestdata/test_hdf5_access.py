@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2019 by Michael F. Herbst
+##
+## This file is part of adcc-testdata.
+##
+## adcc-testdata is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc-testdata is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc-testdata. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import tempfile
+import unittest
+import numpy as np
+
+import h5py
+
+from numpy.testing import assert_array_equal
+
+from adcctestdata.hdf5_access import BlockCache, MappedGroup, memmap_dataset
+
+
+class TestHdf5Access(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.data = np.arange(24.0).reshape(2, 3, 4)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_memmap_dataset(self):
+        with h5py.File(self.tmpdir.name + "/data.hdf5", "w") as h5f:
+            h5f.create_dataset("contiguous", data=self.data)
+            h5f.create_dataset("compressed", data=self.data,
+                               compression="gzip")
+            h5f.create_dataset("unallocated", shape=(2, 3), dtype=float)
+
+        with h5py.File(self.tmpdir.name + "/data.hdf5", "r") as h5f:
+            mapped = memmap_dataset(h5f["contiguous"])
+            self.assertIsInstance(mapped, np.memmap)
+            assert_array_equal(mapped, self.data)
+            self.assertIsNone(memmap_dataset(h5f["compressed"]))
+            self.assertIsNone(memmap_dataset(h5f["unallocated"]))
+
+    def test_memmap_unflushed(self):
+        # The data is still open for writing when mapped
+        with h5py.File(self.tmpdir.name + "/data.hdf5", "w") as h5f:
+            h5f.create_dataset("contiguous", data=self.data)
+            assert_array_equal(memmap_dataset(h5f["contiguous"]), self.data)
+
+    def test_mapped_group(self):
+        with h5py.File(self.tmpdir.name + "/data.hdf5", "w") as h5f:
+            h5f.create_dataset("group/contiguous", data=self.data)
+            h5f.create_dataset("group/compressed", data=self.data,
+                               compression="gzip")
+
+            group = MappedGroup(h5f)
+            self.assertIsInstance(group["group"], MappedGroup)
+            self.assertIsInstance(group["group/contiguous"], np.memmap)
+            self.assertIsInstance(group["group/compressed"], h5py.Dataset)
+            self.assertIn("group/compressed", group)
+
+            group = MappedGroup(h5f, mmap=False)
+            self.assertIsInstance(group["group/contiguous"], h5py.Dataset)
+
+            group = MappedGroup(h5f, mmap=True)
+            assert_array_equal(group["group/contiguous"], self.data)
+            with self.assertRaises(ValueError):
+                group["group/compressed"]
+
+
+class TestBlockCache(unittest.TestCase):
+    def test_eviction(self):
+        block = np.zeros(10)  # 80 bytes
+        cache = BlockCache(max_bytes=250)
+        for key in "abc":
+            cache.put(key, block)
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(cache.nbytes, 240)
+
+        cache.get("a")  # Now b is the least recently used block
+        cache.put("d", block)
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(cache.nbytes, 240)
+        self.assertIsNone(cache.get("b"))
+        for key in "acd":
+            self.assertIsNotNone(cache.get(key))
+
+        # Replacing a block needs no eviction
+        cache.put("c", np.zeros(5))
+        self.assertEqual(cache.nbytes, 200)
+        for key in "acd":
+            self.assertIsNotNone(cache.get(key))
+
+        # Larger block evicts several blocks
+        cache.put("e", np.zeros(20))
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.nbytes, 240)
+        self.assertIsNotNone(cache.get("d"))
+
+    def test_oversized(self):
+        cache = BlockCache(max_bytes=100)
+        cache.put("a", np.zeros(10))
+        cache.put("b", np.zeros(20))
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.nbytes, 80)
+        self.assertIsNone(cache.get("b"))
+
+        cache = BlockCache()
+        cache.put("a", np.zeros(1))
+        self.assertEqual(len(cache), 0)
+
+    def test_counters(self):
+        cache = BlockCache(max_bytes=100)
+        block = np.arange(4.0)
+        self.assertIsNone(cache.get("a"))
+        cache.put("a", block)
+        block[:] = 0  # The cache holds a copy
+        assert_array_equal(cache.get("a"), np.arange(4.0))
+        cache.get("a")
+        cache.get("b")
+        self.assertEqual(cache.hits, 2)
+        self.assertEqual(cache.misses, 2)
+
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.nbytes, 0)
+        self.assertIsNone(cache.get("a"))
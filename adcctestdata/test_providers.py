@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2019 by Michael F. Herbst
+##
+## This file is part of adcc-testdata.
+##
+## adcc-testdata is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc-testdata is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc-testdata. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import tempfile
+import unittest
+import numpy as np
+
+import h5py
+
+from numpy.testing import assert_allclose
+
+import adcctestdata as atd
+from adcctestdata.test_dump_pyscf import make_cn, make_water
+
+
+def fill_all(provider):
+    """Read all data served by the fill functions of `provider`"""
+    nf = 2 * provider.get_n_orbs_alpha()
+    nb = provider.get_n_bas()
+    full = (slice(None), ) * 4
+    ret = {
+        "restricted": provider.get_restricted(),
+        "conv_tol": provider.get_conv_tol(),
+        "energy_scf": provider.get_energy_scf(),
+        "spin_multiplicity": provider.get_spin_multiplicity(),
+        "orbcoeff_fb": np.empty((nf, nb)),
+        "occupation_f": np.empty(nf),
+        "orben_f": np.empty(nf),
+        "fock_ff": np.empty((nf, nf)),
+        "eri_ffff": np.empty((nf, nf, nf, nf)),
+        "eri_phys_asym_ffff": np.empty((nf, nf, nf, nf)),
+    }
+    provider.fill_orbcoeff_fb(ret["orbcoeff_fb"])
+    provider.fill_occupation_f(ret["occupation_f"])
+    provider.fill_orben_f(ret["orben_f"])
+    provider.fill_fock_ff(full[:2], ret["fock_ff"])
+    provider.fill_eri_ffff(full, ret["eri_ffff"])
+    if provider.has_eri_phys_asym_ffff_inner() \
+            or provider.eri_backend is not None:
+        provider.fill_eri_phys_asym_ffff(full, ret["eri_phys_asym_ffff"])
+    else:
+        eri = ret["eri_ffff"]
+        ret["eri_phys_asym_ffff"] = (np.transpose(eri, (0, 2, 1, 3))
+                                     - np.transpose(eri, (0, 2, 3, 1)))
+    return ret
+
+
+class TestProviders(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.scfres = {"water": make_water(), "cn": make_cn()}
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def dump(self, system, eri_layout="dense", **kwargs):
+        fn = "{}/{}_{}.hdf5".format(self.tmpdir.name, system, eri_layout)
+        return atd.dump_pyscf(self.scfres[system], fn, eri_layout=eri_layout,
+                              **kwargs)
+
+    def reference(self, system):
+        """Data served by an HdfProvider on the dense dump"""
+        return fill_all(atd.HdfProvider(self.dump(system)))
+
+    def assert_data_equal(self, data, ref):
+        self.assertEqual(data.keys(), ref.keys())
+        for key in ref:
+            assert_allclose(data[key], ref[key], atol=1e-12, err_msg=key)
+
+    def test_pyscf_provider(self):
+        for system in ["water", "cn"]:
+            provider = atd.PyscfProvider(self.scfres[system])
+            self.assertEqual(provider.get_backend(), "pyscf")
+            self.assert_data_equal(fill_all(provider), self.reference(system))
+
+    def test_array_provider(self):
+        for system in ["water", "cn"]:
+            ref = self.reference(system)
+            scfdata = self.dump(system, eri_layout="spin_blocks")
+            data = {}
+            scfdata.visititems(lambda key, item: data.update({key: item[()]})
+                               if isinstance(item, h5py.Dataset) else None)
+            self.assertIn("eri_blocks/aaaa", data)
+            provider = atd.ArrayProvider(data)
+            self.assertEqual(provider.get_backend(), "<dict data>")
+            self.assert_data_equal(fill_all(provider), ref)
+
+            # Nested mappings
+            nested = {"eri_blocks": {}}
+            for key, value in data.items():
+                if key.startswith("eri_blocks/"):
+                    nested["eri_blocks"][key[len("eri_blocks/"):]] = value
+                else:
+                    nested[key] = value
+            provider = atd.ArrayProvider(nested)
+            self.assert_data_equal(fill_all(provider), ref)
+
+            del data["fock_ff"]
+            with self.assertRaises(ValueError):
+                atd.ArrayProvider(data)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2019 by Michael F. Herbst
+##
+## This file is part of adcc-testdata.
+##
+## adcc-testdata is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc-testdata is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc-testdata. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import tempfile
+import unittest
+import numpy as np
+
+import h5py
+
+from numpy.testing import assert_array_equal
+
+import adcctestdata as atd
+from adcctestdata.rechunk import choose_chunks, orbital_runs
+from adcctestdata.test_dump_pyscf import make_water
+
+
+class TestRechunk(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.scfres = make_water()
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.infile = self.tmpdir.name + "/scf.hdf5"
+        atd.dump_pyscf(self.scfres, self.infile).close()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_orbital_runs(self):
+        with h5py.File(self.infile, "r") as data:
+            self.assertEqual(orbital_runs(data),
+                             [("a", 0, 5), ("a", 5, 7),
+                              ("b", 7, 12), ("b", 12, 14)])
+            self.assertEqual(orbital_runs(data, core_orbitals=[0, 7]),
+                             [("a", 0, 1), ("a", 1, 5), ("a", 5, 7),
+                              ("b", 7, 8), ("b", 8, 12), ("b", 12, 14)])
+
+    def test_choose_chunks(self):
+        # Chunks aligned with the blocks
+        ranges = [((0, 4), (0, 8)), ((4, 8), (0, 8))]
+        self.assertEqual(choose_chunks((8, 8), ranges), (4, 8))
+
+        # Chunks bounded in size
+        ranges = [((0, 64), (0, 64))]
+        chunks = choose_chunks((64, 64), ranges, max_chunk_bytes=8 * 512)
+        self.assertLessEqual(np.prod(chunks), 512)
+
+    def test_rechunk(self):
+        outfile = self.tmpdir.name + "/rechunked.hdf5"
+        chunks = atd.rechunk(self.infile, outfile, core_orbitals=[0, 7])
+        self.assertIn("eri_ffff", chunks)
+        self.assertIn("fock_ff", chunks)
+
+        with h5py.File(self.infile, "r") as fin, \
+                h5py.File(outfile, "r") as fout:
+            self.assertEqual(fout["eri_ffff"].chunks, chunks["eri_ffff"])
+            self.assertEqual(fout["eri_ffff"].compression, "gzip")
+
+            def compare(path, item):
+                if isinstance(item, h5py.Dataset):
+                    assert_array_equal(fout[path][()], item[()])
+            fin.visititems(compare)
+
+    def test_rechunk_trace(self):
+        trace = atd.AccessTrace()
+        for p0 in range(0, 14, 7):
+            trace.record("fill_eri_ffff", "eri_ffff",
+                         (slice(p0, p0 + 7), ) + 3 * (slice(0, 14), ))
+        outfile = self.tmpdir.name + "/rechunked.hdf5"
+        chunks = atd.rechunk(self.infile, outfile, trace=trace)
+        self.assertEqual(list(chunks.keys()), ["eri_ffff"])
+        self.assertEqual(chunks["eri_ffff"][0], 7)
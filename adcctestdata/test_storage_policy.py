@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2019 by Michael F. Herbst
+##
+## This file is part of adcc-testdata.
+##
+## adcc-testdata is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc-testdata is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc-testdata. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import tempfile
+import unittest
+import numpy as np
+
+import h5py
+
+from unittest import mock
+from numpy.testing import assert_array_equal
+
+from adcctestdata import StoragePolicy
+
+
+class TestStoragePolicy(unittest.TestCase):
+    def test_rule_matching(self):
+        policy = StoragePolicy([("eri_blocks/*", {"codec": "lzf"}),
+                                ("eri_*", {"codec": "gzip"})],
+                               default={"chunks": True})
+        self.assertEqual(policy.options_for("/eri_blocks/aaaa"),
+                         {"codec": "lzf"})
+        self.assertEqual(policy.options_for("eri_ffff"), {"codec": "gzip"})
+        self.assertEqual(policy.options_for("fock_ff"), {"chunks": True})
+
+        # Rules given as dict
+        policy = StoragePolicy({"*/eigenvectors_*": {"codec": "lzf"}})
+        self.assertEqual(policy.options_for("adc/singlet/eigenvectors_doubles"),
+                         {"codec": "lzf"})
+        self.assertEqual(policy.options_for("adc/singlet/eigenvalues"), {})
+
+    def test_codecs(self):
+        options = StoragePolicy.dataset_options
+        self.assertEqual(options({}, (4, 4)), {})
+        self.assertEqual(options({"codec": "gzip"}, (4, 4)),
+                         {"compression": "gzip", "compression_opts": 4})
+        self.assertEqual(options({"codec": "gzip", "level": 8}, (4, 4)),
+                         {"compression": "gzip", "compression_opts": 8})
+        self.assertEqual(options({"codec": "lzf", "shuffle": True}, (4, 4)),
+                         {"compression": "lzf", "shuffle": True})
+
+        # Scalar and empty datasets get no options
+        self.assertEqual(options({"codec": "gzip"}, ()), {})
+        self.assertEqual(options({"codec": "gzip"}, (0, 4)), {})
+
+        with self.assertRaises(ValueError):
+            options({"codec": "rar"}, (4, 4))
+        with self.assertRaises(ValueError):
+            options({"compression": "gzip"}, (4, 4))
+        with self.assertRaises(ValueError):
+            StoragePolicy(default={"codec": "rar"})
+
+    def test_chunks(self):
+        options = StoragePolicy.dataset_options
+        self.assertEqual(options({"chunks": (2, 8)}, (4, 4)),
+                         {"chunks": (2, 4)})
+        self.assertEqual(options({"chunks": (0, 2)}, (4, 4)),
+                         {"chunks": (1, 2)})
+        self.assertEqual(options({"chunks": True}, (4, 4)), {"chunks": True})
+        with self.assertRaises(ValueError):
+            options({"chunks": (2, 2)}, (4, 4, 4))
+
+    def test_missing_hdf5plugin(self):
+        with mock.patch.dict("sys.modules", {"hdf5plugin": None}):
+            for codec in ["blosc", "zstd"]:
+                with self.assertRaises(ImportError):
+                    StoragePolicy.dataset_options({"codec": codec}, (4, 4))
+
+    def test_create_dataset(self):
+        policy = StoragePolicy(
+            [("group/*", {"codec": "gzip", "level": 2, "shuffle": True,
+                          "chunks": (2, 10)})]
+        )
+        data = np.arange(12.0).reshape(3, 4)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with h5py.File(tmpdir + "/data.hdf5", "w") as h5f:
+                group = h5f.create_group("group")
+                dataset = policy.create_dataset(group, "data", data=data)
+                self.assertEqual(dataset.compression, "gzip")
+                self.assertEqual(dataset.compression_opts, 2)
+                self.assertTrue(dataset.shuffle)
+                self.assertEqual(dataset.chunks, (2, 4))
+                assert_array_equal(dataset[()], data)
+
+                dataset = policy.create_dataset(h5f, "data", data=data)
+                self.assertIsNone(dataset.compression)
+                self.assertIsNone(dataset.chunks)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2019 by Michael F. Herbst
+##
+## This file is part of adcc-testdata.
+##
+## adcc-testdata is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc-testdata is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc-testdata. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import os
+import tempfile
+import unittest
+
+from unittest import mock
+
+from adcctestdata import threads
+from adcctestdata.threads import (apply_num_threads, available_cores,
+                                  cgroup_cpu_limit, default_num_threads)
+
+
+class TestThreads(unittest.TestCase):
+    def write(self, root, path, content):
+        os.makedirs(os.path.dirname(os.path.join(root, path)), exist_ok=True)
+        with open(os.path.join(root, path), "w") as fp:
+            fp.write(content)
+
+    def test_cgroup_v2(self):
+        for content, limit in [("max 100000\n", None), ("200000 100000\n", 2),
+                               ("250000 100000\n", 2), ("50000 100000\n", 1)]:
+            with tempfile.TemporaryDirectory() as root:
+                self.write(root, "cpu.max", content)
+                self.assertEqual(cgroup_cpu_limit(root), limit)
+
+    def test_cgroup_v1(self):
+        for quota, limit in [("-1\n", None), ("400000\n", 4), ("10000\n", 1)]:
+            with tempfile.TemporaryDirectory() as root:
+                self.write(root, "cpu/cpu.cfs_quota_us", quota)
+                self.write(root, "cpu/cpu.cfs_period_us", "100000\n")
+                self.assertEqual(cgroup_cpu_limit(root), limit)
+
+    def test_cgroup_missing(self):
+        with tempfile.TemporaryDirectory() as root:
+            self.assertIsNone(cgroup_cpu_limit(root))
+            self.write(root, "cpu.max", "invalid\n")
+            self.assertIsNone(cgroup_cpu_limit(root))
+
+    def test_default_num_threads(self):
+        with mock.patch.dict(os.environ, {"ADCCTESTDATA_NUM_THREADS": "3"}):
+            self.assertEqual(default_num_threads(), 3)
+        with mock.patch.dict(os.environ, {"ADCCTESTDATA_NUM_THREADS": "0"}):
+            with self.assertRaises(ValueError):
+                default_num_threads()
+        with mock.patch.dict(os.environ, {"ADCCTESTDATA_NUM_THREADS": ""}):
+            self.assertEqual(default_num_threads(), available_cores())
+
+    def test_apply_num_threads(self):
+        with mock.patch.object(threads, "set_num_threads",
+                               return_value=4) as set_num_threads:
+            with mock.patch.dict(os.environ, {"ADCCTESTDATA_NUM_THREADS": ""}):
+                self.assertIsNone(apply_num_threads())
+                set_num_threads.assert_not_called()
+                self.assertEqual(apply_num_threads(4), 4)
+                set_num_threads.assert_called_with(4)
+            with mock.patch.dict(os.environ, {"ADCCTESTDATA_NUM_THREADS": "4"}):
+                self.assertEqual(apply_num_threads(), 4)
+                set_num_threads.assert_called_with(None)
@@ -20,23 +20,24 @@
 ## along with adcc-testdata. If not, see <http://www.gnu.org/licenses/>.
 ##
 ## ---------------------------------------------------------------------
-import os
 import tempfile
 import unittest
 import numpy as np
 
+import h5py
+
 from pyscf import gto, scf
 from numpy.testing import assert_allclose
 
 import adcctestdata as atd
+from adcctestdata.ResultCache import CachedContext
 
 
 class TestWater(unittest.TestCase):
-    def run_scf(self):
-        fn = "water_sto3g.hdf5"
-        if os.path.isfile(fn):
-            return fn
+    def run_scf(self, eri_layout="dense"):
+        return atd.cached_dump_pyscf(self.make_scf(), eri_layout=eri_layout)
 
+    def make_scf(self):
         mol = gto.M(
             atom="""
             O 0 0 0
@@ -49,8 +50,7 @@ class TestWater(unittest.TestCase):
         mf = scf.RHF(mol)
         mf.conv_tol = 1e-11
         mf.conv_tol_grad = 1e-10
-        mf.kernel()
-        return atd.dump_pyscf(mf, fn)
+        return mf
 
     def test_water_adc2(self):
         fn = self.run_scf()
@@ -64,6 +64,128 @@ class TestWater(unittest.TestCase):
             assert_allclose(res["adc/triplet/eigenvalues"][()],
                             np.array([0.40288477, 0.4913253, 0.52854722]))
 
+    def test_water_adc2_batch(self):
+        fn = self.run_scf()
+        methods = ["adc1", {"method": "adc2", "n_triplets": 3}]
+        ctxs = atd.run_adcman_batch(fn, methods, n_singlets=5, print_level=2)
+        self.assertEqual(len(ctxs), 2)
+
+        tree = "adc_pp/adc2s/rhf/singlets/0"
+        self.assertEqual(ctxs[1][tree + "/nstates"], 5)
+        eigenvalues = [ctxs[1][tree + "/es{}/energy".format(i)]
+                       for i in range(5)]
+        assert_allclose(np.array(eigenvalues),
+                        np.array([0.47051314, 0.57255495, 0.59367335,
+                                  0.71296882, 0.83969732]))
+        self.assertEqual(ctxs[0]["adc_pp/adc1/rhf/singlets/0/nstates"], 5)
+        with self.assertRaises(ValueError):
+            atd.run_adcman_batch(fn, methods, n_singlets=5, cache=True)
+
+    def test_water_adc2_plan(self):
+        fn = self.run_scf()
+        plan = atd.run_adcman(fn, "adc2", n_singlets=5, n_triplets=3,
+                              dry_run=True)
+        self.assertEqual(plan["spaces"], {"o": 10, "c": 0, "v": 4, "f": 14})
+        self.assertEqual(plan["memory"],
+                         sum(t["memory"] for t in plan["tasks"].values()))
+
+        # Subspace is shrunk to fit into the budget or the job refused
+        plan = atd.run_adcman(fn, "adc2", n_singlets=5, max_subspace=200,
+                              dry_run=True)
+        budget = 0.9 * plan["memory"] / 1e6
+        plan = atd.run_adcman(fn, "adc2", n_singlets=5, max_subspace=200,
+                              max_memory=budget, dry_run=True)
+        self.assertLess(plan["max_subspace"], 200)
+        self.assertLessEqual(plan["memory"], budget * 1e6)
+        with self.assertRaises(MemoryError):
+            atd.run_adcman(fn, "adc2", n_singlets=5, max_subspace=200,
+                           max_memory=budget, shrink=False, dry_run=True)
+
+    def test_water_adc2_auto_solver(self):
+        fn = self.run_scf()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            res = atd.dump_reference(fn, "adc2", tmpdir + "/out.hdf5",
+                                     n_states_full=2, n_singlets=5,
+                                     n_triplets=3, print_level=2,
+                                     auto_solver=True, max_memory=100)
+            assert_allclose(res["adc/singlet/eigenvalues"][()],
+                            np.array([0.47051314, 0.57255495, 0.59367335,
+                                      0.71296882, 0.83969732]))
+            assert_allclose(res["adc/triplet/eigenvalues"][()],
+                            np.array([0.40288477, 0.4913253, 0.52854722]))
+
+    def test_water_adc3_checkpoint(self):
+        fn = self.run_scf()
+        kwargs = dict(n_states_full=2, n_singlets=3, print_level=2)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fresh = atd.dump_reference(fn, "adc3", tmpdir + "/fresh.hdf5",
+                                       **kwargs)
+
+            # ADC(2) stores the MP amplitudes, ADC(3) adds the pi intermediates
+            store = atd.CheckpointStore(tmpdir + "/checkpoints")
+            for method in ["adc2", "adc3", "adc3"]:
+                res = atd.dump_reference(fn, method, tmpdir + "/out.hdf5",
+                                         checkpoint=store, **kwargs)
+                assert_allclose(res["mp/mp2/energy"][()], -0.0342588021)
+                res.close()
+            self.assertEqual(len(store.cache.entries()), 1)
+
+            res = h5py.File(tmpdir + "/out.hdf5", "r")
+            for key in ["mp/mp2/energy", "mp/mp3/energy",
+                        "adc/singlet/eigenvalues"]:
+                assert_allclose(res[key][()], fresh[key][()])
+
+    def test_water_adc2_result_cache(self):
+        fn = self.run_scf()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = atd.ResultCache(tmpdir + "/results")
+            for i in range(2):  # Second run is served from the cache
+                res = atd.dump_reference(fn, "adc2", tmpdir + "/out.hdf5",
+                                         n_states_full=2, n_singlets=5,
+                                         n_triplets=3, print_level=2,
+                                         cache=cache)
+                assert_allclose(res["adc/singlet/eigenvalues"][()],
+                                np.array([0.47051314, 0.57255495, 0.59367335,
+                                          0.71296882, 0.83969732]))
+                assert_allclose(res["adc/triplet/eigenvalues"][()],
+                                np.array([0.40288477, 0.4913253, 0.52854722]))
+                res.close()
+            self.assertEqual(len(cache.cache.entries()), 1)
+            ctx = atd.run_adcman(fn, "adc2", n_singlets=5, n_triplets=3,
+                                 cache=cache)
+            self.assertIsInstance(ctx, CachedContext)
+
+    def test_water_adc2_profile(self):
+        fn = self.run_scf()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            res = atd.dump_reference(fn, "adc2", tmpdir + "/out.hdf5",
+                                     n_states_full=2, n_singlets=5,
+                                     print_level=2, profile=True)
+            assert_allclose(res["adc/singlet/eigenvalues"][()],
+                            np.array([0.47051314, 0.57255495, 0.59367335,
+                                      0.71296882, 0.83969732]))
+            stages = [s.decode() for s in res["profile/stages"][()]]
+            for stage in ["reference_state", "adcman_mp1", "adcman_pi",
+                          "adcman", "dump"]:
+                self.assertIn(stage, stages)
+            self.assertTrue(np.all(res["profile/stage_wall"][()] >= 0))
+            res.close()
+
+    def test_water_sweep(self):
+        fn = self.run_scf()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            jobs = [(fn, "adc1", tmpdir + "/adc1.hdf5", dict(n_singlets=3)),
+                    (fn, "adc2", tmpdir + "/adc2.hdf5",
+                     dict(n_singlets=5, n_triplets=3))]
+            outs = atd.run_sweep(jobs, n_workers=2, n_threads=1)
+            self.assertEqual(outs, [job[2] for job in jobs])
+            with h5py.File(outs[1], "r") as res:
+                assert_allclose(res["adc/singlet/eigenvalues"][()],
+                                np.array([0.47051314, 0.57255495, 0.59367335,
+                                          0.71296882, 0.83969732]))
+                assert_allclose(res["adc/triplet/eigenvalues"][()],
+                                np.array([0.40288477, 0.4913253, 0.52854722]))
+
     def test_water_cvs_adc2(self):
         fn = self.run_scf()
         with tempfile.TemporaryDirectory() as tmpdir:
@@ -95,3 +217,16 @@ class TestWater(unittest.TestCase):
                         for i in range(5)])
         assert_allclose(ips, np.array([0.315887216, 0.391410529, 0.619760418,
                                        1.067238764, 1.070609008]))
+
+    def test_water_ipadc2_result_cache(self):
+        fn = self.run_scf()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = atd.ResultCache(tmpdir + "/results")
+            fresh = atd.run_adcman(fn, "ipadc2", n_ipbeta=3, print_level=2,
+                                   cache=cache)
+            cached = atd.run_adcman(fn, "ipadc2", n_ipbeta=3, print_level=2,
+                                    cache=cache)
+            self.assertIsInstance(cached, CachedContext)
+            for i in range(3):
+                key = f"/adc_ip/adc2/rhf/0/ip{i}/energy"
+                assert_allclose(cached[key], fresh[key])
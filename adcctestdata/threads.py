@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2019 by Michael F. Herbst
+##
+## This file is part of adcc-testdata.
+##
+## adcc-testdata is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc-testdata is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc-testdata. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import os
+
+import pyadcman
+
+from pyscf import lib
+
+try:
+    # Allows to adjust the thread count of BLAS libraries already loaded
+    import threadpoolctl
+except ImportError:
+    threadpoolctl = None
+
+#: Environment variables read by BLAS and OpenMP libraries at load time
+BLAS_ENVIRONMENT = ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS",
+                    "MKL_NUM_THREADS", "BLIS_NUM_THREADS",
+                    "VECLIB_MAXIMUM_THREADS"]
+
+
+def cgroup_cpu_limit(root="/sys/fs/cgroup"):
+    """
+    Return the number of CPUs the CPU quota of the cgroup of this process
+    allows to use (rounded down, at least 1) or None if there is no quota.
+    Both cgroup v2 (`cpu.max`) and cgroup v1 (`cpu.cfs_quota_us`)
+    are supported.
+    """
+    try:
+        with open(os.path.join(root, "cpu.max")) as f:
+            quota, period = f.read().split()[:2]
+        if quota == "max":
+            return None
+        quota, period = int(quota), int(period)
+    except (OSError, ValueError):
+        try:
+            with open(os.path.join(root, "cpu", "cpu.cfs_quota_us")) as f:
+                quota = int(f.read())
+            with open(os.path.join(root, "cpu", "cpu.cfs_period_us")) as f:
+                period = int(f.read())
+        except (OSError, ValueError):
+            return None
+    if quota <= 0 or period <= 0:
+        return None
+    return max(1, quota // period)
+
+
+def available_cores():
+    """
+    Return the number of cores this process may use, i.e. the CPUs in its
+    affinity mask limited by the CPU quota of its cgroup.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        n_cores = len(os.sched_getaffinity(0))
+    else:
+        n_cores = os.cpu_count() or 1
+
+    limit = cgroup_cpu_limit()
+    if limit is not None:
+        n_cores = min(n_cores, limit)
+    return max(1, n_cores)
+
+
+def default_num_threads():
+    """
+    Return the default number of threads, which is taken from the
+    environment variable `ADCCTESTDATA_NUM_THREADS` if set,
+    else from :py:`available_cores`.
+    """
+    value = os.environ.get("ADCCTESTDATA_NUM_THREADS", "")
+    if value:
+        threads = int(value)
+        if threads < 1:
+            raise ValueError("ADCCTESTDATA_NUM_THREADS needs to be positive.")
+        return threads
+    return available_cores()
+
+
+def set_num_threads(threads=None):
+    """
+    Set the number of threads used by pyscf, the BLAS library and adcman
+    consistently.
+
+    BLAS libraries which have already been loaded can only be adjusted if
+    the `threadpoolctl` package is available. In any case the thread count is
+    exported to the usual BLAS and OpenMP environment variables, such that
+    it applies to subprocesses as well. The functions of this package
+    taking a `threads` argument call this via :py:`apply_num_threads`.
+
+    Parameters
+    ----------
+    threads : int or NoneType
+        Number of threads (default: :py:`default_num_threads()`)
+
+    Returns
+    -------
+    int
+        The number of threads set.
+    """
+    if threads is None:
+        threads = default_num_threads()
+    threads = int(threads)
+    if threads < 1:
+        raise ValueError("Number of threads needs to be positive.")
+
+    for key in BLAS_ENVIRONMENT:
+        os.environ[key] = str(threads)
+    lib.num_threads(threads)
+    if threadpoolctl is not None:
+        threadpoolctl.threadpool_limits(limits=threads, user_api="blas")
+    pyadcman.thread_pool.reinit(threads, threads + 1)
+    return threads
+
+
+def apply_num_threads(threads=None):
+    """
+    Set the number of threads (see :py:`set_num_threads`) if `threads` is
+    passed or the environment variable `ADCCTESTDATA_NUM_THREADS` is set.
+    Otherwise the current thread settings are kept. Returns the number
+    of threads set or None.
+    """
+    if threads is None and not os.environ.get("ADCCTESTDATA_NUM_THREADS", ""):
+        return None
+    return set_num_threads(threads)
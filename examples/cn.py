@@ -20,31 +20,27 @@
 ## along with adcc-testdata. If not, see <http://www.gnu.org/licenses/>.
 ##
 ## ---------------------------------------------------------------------
-import os
 import adcctestdata as atd
 
 from pyscf import gto, scf
 
-if not os.path.isfile("cn.hdf5"):
-    mol = gto.M(
-        atom="""
-        C 0 0 0
-        N 0 0 2.2143810738114829
-        """,
-        basis='cc-pvdz',
-        unit="Bohr",
-        spin=1,
-        verbose=4,
-    )
-    mf = scf.UHF(mol)
-    mf.conv_tol = 1e-11
-    mf.conv_tol_grad = 1e-10
-    mf.diis = scf.EDIIS()
-    mf.diis_space = 3
-    mf.max_cycle = 500
-    mf.kernel()
+mol = gto.M(
+    atom="""
+    C 0 0 0
+    N 0 0 2.2143810738114829
+    """,
+    basis='cc-pvdz',
+    unit="Bohr",
+    spin=1,
+    verbose=4,
+)
+mf = scf.UHF(mol)
+mf.conv_tol = 1e-11
+mf.conv_tol_grad = 1e-10
+mf.diis = scf.EDIIS()
+mf.diis_space = 3
+mf.max_cycle = 500
+scffile = atd.cached_dump_pyscf(mf, out="cn.hdf5")
 
-    atd.dump_pyscf(mf, "cn.hdf5")
-
-atd.dump_reference("cn.hdf5", "adc2", "cn_adc2.hdf5", n_states_full=3,
+atd.dump_reference(scffile, "adc2", "cn_adc2.hdf5", n_states_full=3,
                    n_states=5, print_level=100)
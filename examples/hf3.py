@@ -20,24 +20,21 @@
 ## along with adcc-testdata. If not, see <http://www.gnu.org/licenses/>.
 ##
 ## ---------------------------------------------------------------------
-import os
 import adcctestdata as atd
 
 from pyscf import gto, scf
 
-if not os.path.isfile("hf3.hdf5"):
-    mol = gto.M(
-        atom='H 0 0 0;'
-             'F 0 0 2.5',
-        basis='6-31G',
-        unit="Bohr",
-        spin=2  # =2S, ergo triplet
-    )
-    mf = scf.UHF(mol)
-    mf.conv_tol = 1e-14
-    mf.grad_conv_tol = 1e-10
-    mf.kernel()
-    atd.dump_pyscf(mf, "hf3.hdf5")
+mol = gto.M(
+    atom='H 0 0 0;'
+         'F 0 0 2.5',
+    basis='6-31G',
+    unit="Bohr",
+    spin=2  # =2S, ergo triplet
+)
+mf = scf.UHF(mol)
+mf.conv_tol = 1e-14
+mf.grad_conv_tol = 1e-10
+scffile = atd.cached_dump_pyscf(mf, out="hf3.hdf5")
 
-atd.dump_reference("hf3.hdf5", "adc2", "hf3_sf_adc2.hdf5", n_states_full=2,
+atd.dump_reference(scffile, "adc2", "hf3_sf_adc2.hdf5", n_states_full=2,
                    n_spin_flip=5, print_level=100)
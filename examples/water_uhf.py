@@ -20,30 +20,26 @@
 ## along with adcc-testdata. If not, see <http://www.gnu.org/licenses/>.
 ##
 ## ---------------------------------------------------------------------
-import os
 import adcctestdata as atd
 
 from pyscf import gto, scf
 
-if not os.path.isfile("water_uhf.hdf5"):
-    mol = gto.M(
-        atom="""
-        O 0 0 0
-        H 0 0 1.795239827225189
-        H 1.693194615993441 0 -0.599043184453037
-        """,
-        basis='cc-pvdz',
-        unit="Bohr"
-    )
-    mf = scf.UHF(mol)
-    mf.conv_tol = 1e-13
-    mf.conv_tol_grad = 1e-12
-    mf.diis = scf.EDIIS()
-    mf.diis_space = 3
-    mf.max_cycle = 500
-    mf.kernel()
+mol = gto.M(
+    atom="""
+    O 0 0 0
+    H 0 0 1.795239827225189
+    H 1.693194615993441 0 -0.599043184453037
+    """,
+    basis='cc-pvdz',
+    unit="Bohr"
+)
+mf = scf.UHF(mol)
+mf.conv_tol = 1e-13
+mf.conv_tol_grad = 1e-12
+mf.diis = scf.EDIIS()
+mf.diis_space = 3
+mf.max_cycle = 500
+scffile = atd.cached_dump_pyscf(mf, out="water_uhf.hdf5")
 
-    atd.dump_pyscf(mf, "water_uhf.hdf5")
-
-atd.dump_reference("water_uhf.hdf5", "adc2", "water_uhf_adc2.hdf5",
+atd.dump_reference(scffile, "adc2", "water_uhf_adc2.hdf5",
                    n_states_full=2, n_states=8, print_level=100)